@@ -0,0 +1,144 @@
+# app/Download/admission.py
+
+import uuid
+import shutil
+import logging
+import threading
+from typing import Dict, Any
+
+# --- Basic Configuration ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class InsufficientDiskSpaceError(Exception):
+    """Raised when a job can never fit on the disk, even once the running jobs finish."""
+
+
+class DiskAdmission:
+    """
+    Admission control for the downloads disk. Before a job starts writing, it reserves
+    its expected size (plus headroom for ffmpeg merges and conversions). The space
+    still owed to running jobs counts against the budget, so several large jobs can't
+    each fill the disk halfway. Jobs that don't fit yet wait for running jobs to finish;
+    jobs that could never fit are rejected straight away.
+
+    Every reservation gets a token of its own, so a job can hold several (e.g. one per
+    playlist item) and two jobs for the same URL never free each other's space.
+    """
+
+    def __init__(self, path, job_store=None, merge_headroom: float = 2.0,
+                 safety_margin: int = 512 * 1024 * 1024, poll_interval: float = 10.0):
+        """
+        Initializes the DiskAdmission.
+
+        Args:
+            path (str): A path on the disk that downloads are written to.
+            job_store (JobStore): Optional journal used to see how much a job has already written.
+            merge_headroom (float): Size multiplier when ffmpeg writes a new file next to its inputs.
+            safety_margin (int): Bytes always kept free on the disk.
+            poll_interval (float): Seconds between re-checks while a job waits for space.
+        """
+        self.path = str(path)
+        self.job_store = job_store
+        self.merge_headroom = merge_headroom
+        self.safety_margin = safety_margin
+        self.poll_interval = poll_interval
+        # token -> (job ID, reserved bytes)
+        self._reservations: Dict[str, tuple] = {}
+        self._condition = threading.Condition()
+
+    def estimate_size(self, info: Dict[str, Any], converts: bool = False) -> int:
+        """
+        Estimates how much disk a yt-dlp job needs from the 'filesize'/'filesize_approx'
+        of the selected formats. Merging several formats, or converting the download,
+        means ffmpeg's output exists alongside its inputs for a while, hence the headroom.
+        Returns 0 if the extractor didn't report any sizes.
+        """
+        formats = info.get('requested_formats') or [info]
+        size = sum(f.get('filesize') or f.get('filesize_approx') or 0 for f in formats)
+        if len(formats) > 1 or converts:
+            size = int(size * self.merge_headroom)
+        return size
+
+    def _outstanding(self, job_id: str, reserved: int) -> int:
+        """The part of a reservation that hasn't been written to disk yet (and so isn't in 'free')."""
+        job = self.job_store.get(job_id) if self.job_store and job_id else None
+        written = (job or {}).get('downloaded') or 0
+        return max(0, reserved - written)
+
+    def _budget(self) -> tuple[int, int]:
+        """Returns (space available now, space available once every running job has finished)."""
+        free = shutil.disk_usage(self.path).free - self.safety_margin
+        owed = sum(self._outstanding(job_id, size) for job_id, size in self._reservations.values())
+        return free - owed, free
+
+    def reserve(self, job_id: str | None, size: int, on_wait=None, check=None) -> str:
+        """
+        Blocks until `size` bytes can be reserved for the job.
+
+        Args:
+            job_id (str): The job the space is reserved for.
+            size (int): Bytes the job is expected to write.
+            on_wait (callable): Called once with (needed, available) if the job has to wait.
+            check (callable): Called before every re-check; may raise to stop waiting (e.g. on cancel).
+
+        Returns:
+            str: The reservation's token, which release() takes.
+
+        Raises:
+            InsufficientDiskSpaceError: If the job can't fit even with no other jobs running.
+        """
+        waited = False
+        with self._condition:
+            while True:
+                if check:
+                    check()
+                available, ceiling = self._budget()
+                if size <= available:
+                    token = uuid.uuid4().hex
+                    self._reservations[token] = (job_id, size)
+                    return token
+                if size > ceiling:
+                    raise InsufficientDiskSpaceError(
+                        f"Not enough disk space: this download needs about {size / (1024 ** 3):.2f} GB "
+                        f"but only {max(ceiling, 0) / (1024 ** 3):.2f} GB can be made available."
+                    )
+                if not waited and on_wait:
+                    on_wait(size, max(available, 0))
+                waited = True
+                # Free space also changes outside the app, so re-check periodically.
+                self._condition.wait(self.poll_interval)
+
+    def reserve_for_job(self, job_id: str | None, size: int, socketio=None, job_control=None) -> str:
+        """
+        reserve() as every downloader uses it: a job that has to wait says so in its terminal,
+        and stops waiting as soon as it is cancelled or paused.
+
+        Args:
+            job_id (str): The job the space is reserved for.
+            size (int): Bytes the job is expected to write; a negative size reserves nothing.
+            socketio: Where the waiting message is emitted.
+            job_control (JobControl): Checked while waiting; raises DownloadInterrupted on a stop request.
+
+        Returns:
+            str: The reservation's token, which release() takes.
+        """
+        def on_wait(needed, available):
+            if socketio:
+                socketio.emit('terminal_output', {
+                    'job_id': job_id, 'line': f"\033[93mWaiting for {needed / (1024 ** 3):.2f} GB of free disk space...\033[0m"})
+
+        return self.reserve(job_id, max(size, 0), on_wait=on_wait,
+                            check=(lambda: job_control.check(job_id)) if job_control else None)
+
+    def wake(self):
+        """Makes waiting jobs re-check now, e.g. so one that was cancelled stops waiting."""
+        with self._condition:
+            self._condition.notify_all()
+
+    def release(self, token: str | None):
+        """Frees a reservation and wakes up jobs waiting for space. Releasing twice is harmless."""
+        with self._condition:
+            if token and self._reservations.pop(token, None) is not None:
+                self._condition.notify_all()
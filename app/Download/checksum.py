@@ -0,0 +1,99 @@
+# app/Download/checksum.py
+
+import os
+import re
+import hashlib
+import logging
+from typing import Tuple
+
+from yt_dlp.postprocessor import PostProcessor
+from yt_dlp.utils import PostProcessingError
+
+# --- Basic Configuration ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Hex digest length -> algorithm, used when a bare digest is given without a prefix.
+_ALGORITHMS_BY_LENGTH = {32: 'md5', 40: 'sha1', 64: 'sha256', 128: 'sha512'}
+SUPPORTED_ALGORITHMS = tuple(_ALGORITHMS_BY_LENGTH.values())
+
+
+class ChecksumMismatchError(Exception):
+    """Raised when a finished download doesn't match its published digest."""
+
+
+def parse_expected_digest(value: str) -> Tuple[str, str]:
+    """
+    Parses an expected digest such as 'sha256:9f86d0...' or a bare hex digest,
+    in which case the algorithm is inferred from its length.
+
+    Returns:
+        tuple: (algorithm, lowercase hex digest)
+    """
+    value = value.strip()
+    if ':' in value:
+        algorithm, digest = value.split(':', 1)
+        algorithm = algorithm.strip().lower().replace('-', '')
+    else:
+        algorithm, digest = _ALGORITHMS_BY_LENGTH.get(len(value)), value
+    digest = digest.strip().lower()
+
+    if algorithm not in SUPPORTED_ALGORITHMS:
+        raise ValueError(f"Unsupported checksum algorithm. Use one of: {', '.join(SUPPORTED_ALGORITHMS)}")
+    if not re.fullmatch(r'[0-9a-f]+', digest) or len(digest) != hashlib.new(algorithm).digest_size * 2:
+        raise ValueError(f"'{value}' is not a valid {algorithm} digest.")
+    return algorithm, digest
+
+
+def hash_file(hasher, path: str, length: int | None = None, chunk_size: int = 1024 * 1024, offset: int = 0):
+    """Feeds `length` bytes of a file from `offset` (or the rest of it) into `hasher`."""
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    remaining = length
+    with open(path, 'rb', buffering=0) as f:
+        f.seek(offset)
+        while remaining is None or remaining > 0:
+            n = f.readinto(view if remaining is None else view[:min(chunk_size, remaining)])
+            if not n:
+                break
+            hasher.update(view[:n])
+            if remaining is not None:
+                remaining -= n
+    return hasher
+
+
+def verify_digest(algorithm: str, expected: str, actual: str):
+    """Raises ChecksumMismatchError if the computed digest differs from the expected one."""
+    if actual != expected:
+        raise ChecksumMismatchError(f"{algorithm.upper()} mismatch: expected {expected}, got {actual}.")
+
+
+class ChecksumPP(PostProcessor):
+    """
+    A yt-dlp post-processor that hashes the final output file and compares it with
+    the expected digest. It runs after ffmpeg has written the file, while its pages
+    are still in the OS cache. A file that doesn't match is deleted, like a rejected
+    document download.
+    """
+
+    def __init__(self, downloader, expected_digest: str):
+        super().__init__(downloader)
+        self.algorithm, self.expected = parse_expected_digest(expected_digest)
+        self.digest = None
+
+    def run(self, info):
+        path = info['filepath']
+        self.to_screen(f"Verifying {self.algorithm.upper()} of \"{path}\"")
+        self.digest = hash_file(hashlib.new(self.algorithm), path).hexdigest()
+        try:
+            verify_digest(self.algorithm, self.expected, self.digest)
+        except ChecksumMismatchError as e:
+            # The data is corrupt, so it must not stay in the downloads folder looking finished.
+            try:
+                os.remove(path)
+                self.to_screen(f"Deleted \"{path}\"")
+            except OSError as remove_error:
+                self.report_warning(f"Could not delete the rejected file: {remove_error}")
+            raise PostProcessingError(str(e))
+        self.to_screen(f"{self.algorithm.upper()} verified: {self.digest}")
+        return [], info
@@ -0,0 +1,217 @@
+# app/Download/control.py
+
+import os
+import glob
+import time
+import socket
+import logging
+import threading
+from typing import Dict, Any, List, Set
+
+from yt_dlp.utils import DownloadCancelled
+
+# --- Basic Configuration ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class DownloadInterrupted(DownloadCancelled):
+    """
+    Raised inside a download (from a yt-dlp hook or the document stream loop) once the
+    job was asked to stop. Subclassing DownloadCancelled lets it pass straight through
+    yt-dlp, even with 'ignoreerrors' set, instead of being logged as a failed item.
+    """
+
+    def __init__(self, action: str):
+        self.action = action
+        super().__init__("Download stopped: this worker lost its lease on the job."
+                         if action == JobControl.LEASE_LOST else f"Download {self.status}.")
+
+    @property
+    def status(self) -> str:
+        """The job status this interruption ends in: 'cancelled', 'paused' or 'lease_lost'."""
+        if self.action == JobControl.LEASE_LOST:
+            return 'lease_lost'
+        return 'cancelled' if self.action == JobControl.CANCEL else 'paused'
+
+
+class JobControl:
+    """
+    Lets running jobs be cancelled or paused. A request sets a flag, which the download
+    notices at its next progress update and unwinds by raising DownloadInterrupted,
+    closing its connections and freeing its disk reservation. HTTP responses a job
+    attaches are aborted right away, so a read stuck on a stalled server ends too.
+
+    The files a job writes are tracked as it goes, so a cancelled job can remove its
+    partial downloads. Only the item in progress counts: once an item of a playlist or
+    sync has been postprocessed, its files are finished and no longer tracked. A paused
+    job keeps its partials, and resuming it continues from there.
+
+    On a worker, a job whose lease was lost stops with LEASE_LOST. Its files now belong
+    to the job's new lease holder, so they are never discarded.
+    """
+
+    CANCEL = 'cancel'
+    PAUSE = 'pause'
+    LEASE_LOST = 'lease_lost'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests: Dict[str, str] = {}
+        self._partials: Dict[str, Set[str]] = {}
+        # Final names of the files the current item is downloading, tracked once they are complete
+        self._writing: Dict[str, Set[str]] = {}
+        self._responses: Dict[str, Set[Any]] = {}
+        # time.monotonic() after which a worker's job counts as having lost its lease
+        self._deadlines: Dict[str, float] = {}
+
+    def request(self, job_id: str, action: str):
+        """
+        Asks a job to stop. A cancel overrides an earlier pause request, but not the other way
+        round, and a lost lease overrides both.
+        """
+        if action not in (self.CANCEL, self.PAUSE, self.LEASE_LOST):
+            raise ValueError(f"Unknown job action '{action}'")
+        with self._lock:
+            current = self._requests.get(job_id)
+            if current != self.LEASE_LOST and (current != self.CANCEL or action == self.LEASE_LOST):
+                self._requests[job_id] = action
+            responses = list(self._responses.get(job_id, ()))
+        for response in responses:
+            self._abort(response)
+
+    def attach(self, job_id: str | None, response):
+        """Registers a job's open HTTP response (requests.Response), so a stop request can abort it."""
+        if job_id:
+            with self._lock:
+                self._responses.setdefault(job_id, set()).add(response)
+        if self.requested(job_id):
+            self._abort(response)
+
+    def detach(self, job_id: str | None, response):
+        """Forgets a response registered with attach() once the job is done with it."""
+        with self._lock:
+            responses = self._responses.get(job_id)
+            if responses is not None:
+                responses.discard(response)
+                if not responses:
+                    del self._responses[job_id]
+
+    @staticmethod
+    def _abort(response):
+        """
+        Shuts down the response's socket. Closing the response from another thread would wait
+        for the read in progress, but a shutdown makes that read return at once.
+        """
+        raw = response.raw
+        sock = getattr(getattr(raw, '_connection', None), 'sock', None)
+        if sock is None:
+            # A connection that closes after the response hands its socket over to the body's reader.
+            reader = getattr(getattr(getattr(raw, '_fp', None), 'fp', None), 'raw', None)
+            sock = getattr(reader, '_sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def requested(self, job_id: str | None) -> str | None:
+        """Returns the pending action for a job, if any."""
+        if not job_id:
+            return None
+        action = self._requests.get(job_id)
+        if action != self.LEASE_LOST and time.monotonic() > self._deadlines.get(job_id, float('inf')):
+            return self.LEASE_LOST
+        return action
+
+    def set_deadline(self, job_id: str, deadline: float):
+        """
+        Makes a worker's job stop with LEASE_LOST once time.monotonic() passes `deadline`, the
+        latest its lease can still be valid. A worker that was suspended past it then stops
+        before its next write, rather than waiting for a heartbeat to say so.
+        """
+        with self._lock:
+            self._deadlines[job_id] = deadline
+
+    def check(self, job_id: str | None):
+        """Raises DownloadInterrupted if the job was asked to stop."""
+        if action := self.requested(job_id):
+            raise DownloadInterrupted(action)
+
+    def track(self, job_id: str | None, path: str | None):
+        """Remembers a file the job is writing, so a cancel can remove it."""
+        if job_id and path:
+            with self._lock:
+                self._partials.setdefault(job_id, set()).add(os.path.abspath(path))
+
+    def partials(self, job_id: str) -> List[str]:
+        """Returns the files tracked for a job, e.g. to journal them when it pauses."""
+        with self._lock:
+            return sorted(self._partials.get(job_id, ()))
+
+    def on_progress(self, job_id: str | None, d: Dict[str, Any]):
+        """yt-dlp progress hook: tracks the files being written and stops the job if requested."""
+        status, filename = d.get('status'), d.get('filename')
+        if status == 'downloading':
+            self.track(job_id, d.get('tmpfilename'))
+            if job_id and filename:
+                with self._lock:
+                    self._writing.setdefault(job_id, set()).add(os.path.abspath(filename))
+        elif status == 'finished' and job_id and filename:
+            # A format file of this item (e.g. before merging) is an intermediate until the item is done.
+            # Files yt-dlp reports as already downloaded were never written by this run, and stay untracked.
+            with self._lock:
+                written = os.path.abspath(filename) in self._writing.get(job_id, ())
+            if written:
+                self.track(job_id, filename)
+        self.check(job_id)
+
+    def on_postprocess(self, job_id: str | None, d: Dict[str, Any]):
+        """
+        yt-dlp postprocessor hook: stops the job before the next ffmpeg step starts. Outputs of
+        steps that ran on data downloaded in this run (e.g. a merged file) count as partials too.
+        """
+        if d.get('status') == 'finished' and self._partials.get(job_id):
+            self.track(job_id, (d.get('info_dict') or {}).get('filepath'))
+        self.check(job_id)
+
+    def on_item_done(self, job_id: str | None, path: str | None = None):
+        """
+        yt-dlp post hook, called once an item is fully postprocessed: its files are finished
+        downloads now, so a later cancel of the same job must leave them alone.
+        """
+        if job_id:
+            with self._lock:
+                self._partials.pop(job_id, None)
+                self._writing.pop(job_id, None)
+
+    def discard_partials(self, job_id: str) -> int:
+        """
+        Deletes the files a job has written, along with yt-dlp's fragment files and resume
+        state ('.ytdl') next to them. Returns the number of files removed.
+        """
+        with self._lock:
+            paths = self._partials.pop(job_id, set())
+            self._writing.pop(job_id, None)
+        removed = 0
+        for path in paths:
+            # yt-dlp keeps the resume state of 'name.ext.part' in 'name.ext.ytdl'.
+            state = f"{path[:-len('.part')]}.ytdl" if path.endswith('.part') else f"{path}.ytdl"
+            for candidate in [path, state, *glob.glob(f"{glob.escape(path)}-Frag*")]:
+                try:
+                    os.remove(candidate)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logger.warning(f"Could not remove partial file {candidate} of job {job_id}: {e}")
+        return removed
+
+    def clear(self, job_id: str, keep_partials: bool = False):
+        """Forgets a job's pending request once it has stopped, and its partials unless it may resume."""
+        with self._lock:
+            self._requests.pop(job_id, None)
+            self._deadlines.pop(job_id, None)
+            if not keep_partials:
+                self._partials.pop(job_id, None)
+                self._writing.pop(job_id, None)
@@ -1,15 +1,33 @@
 # app/Download/documents/documents.py
 
 import os
+import re
+import time
+import hashlib
 import requests
 import logging
+import urllib3
 from urllib.parse import unquote, urlparse
-from typing import Dict, Any
+
+from app.Download.checksum import ChecksumMismatchError, parse_expected_digest, hash_file, verify_digest
+from app.Download.control import JobControl, DownloadInterrupted
+from app.Download.documents.mirrors import (
+    MirrorDownload, probe_mirrors, agreed_size, MAX_ACTIVE_MIRRORS, CONNECT_TIMEOUT, READ_TIMEOUT
+)
 
 # --- Basic Configuration ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# --- Disk I/O Tuning ---
+# Data is written in whole blocks of this size, aligned to the start of the file.
+WRITE_BLOCK_SIZE = 4 * 1024 * 1024
+# Socket reads start small and grow while the connection keeps filling them.
+MIN_READ_SIZE = 64 * 1024
+MAX_READ_SIZE = 1024 * 1024
+# Progress is reported at most this often, instead of once per chunk.
+PROGRESS_INTERVAL = 0.5
+
 
 class DocumentDownloader:
     """
@@ -17,9 +35,16 @@ class DocumentDownloader:
     It streams downloads to handle large files and reports progress via Socket.IO.
     """
 
-    def __init__(self, socketio=None, output_path='./downloads'):
+    def __init__(self, socketio=None, output_path='./downloads', job_store=None, disk_admission=None,
+                 job_control=None):
         self.socketio = socketio
         self.output_path = output_path
+        # Optional JobStore used to journal the progress of each download
+        self.job_store = job_store
+        # Optional DiskAdmission that reserves disk space before a download starts writing
+        self.disk_admission = disk_admission
+        # Cancels or pauses jobs on request; shared with the API when given
+        self.job_control = job_control or JobControl()
         os.makedirs(self.output_path, exist_ok=True)
 
     def _get_filename_from_url(self, url):
@@ -34,53 +59,379 @@ class DocumentDownloader:
             pass
         return "downloaded_file"  # Generic fallback
 
-    def download_document(self, url: str):
+    def _preallocate(self, fd, size):
         """
-        Main method to download a generic file. Designed to be run in a background task.
+        Reserves the full file size up front so the filesystem can lay it out contiguously.
+        Returns True if the space is now claimed on disk.
+        """
+        if size <= 0:
+            return False
+        try:
+            if hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(fd, 0, size)
+            else:
+                os.ftruncate(fd, size)  # Windows: extending the file allocates it on NTFS
+        except OSError as e:
+            logger.warning(f"Could not preallocate {size} bytes: {e}")
+            return False
+        return True
+
+    def _get_resume_offset(self, part_path, total_size, job_id):
+        """
+        Works out how many bytes of a previous attempt can be kept. A preallocated '.part'
+        file is already full size, so the journaled progress is used as the offset instead.
+        """
+        if not os.path.exists(part_path) or total_size <= 0:
+            return 0
+        part_size = os.path.getsize(part_path)
+        if part_size < total_size:
+            return part_size
+        job = self.job_store.get(job_id) if self.job_store and job_id else None
+        if job and job.get('total') == total_size:
+            return min(job.get('downloaded') or 0, total_size - 1)
+        return 0
+
+    def _get_reader(self, r):
+        """
+        Returns a readinto() callable for the response body. Identity-encoded bodies are read
+        straight from the underlying http.client response, which fills our buffer without the
+        intermediate copy urllib3 makes; compressed bodies go through urllib3 for decoding.
+        """
+        raw = r.raw
+        fp = getattr(raw, '_fp', None)
+        if r.headers.get('content-encoding', 'identity') == 'identity' and hasattr(fp, 'readinto'):
+            return fp.readinto
+        raw.decode_content = True
+        return raw.readinto
+
+    def _stream_to_file(self, r, part_path, offset, total_size, job_id=None, hasher=None, on_allocated=None):
+        """
+        Streams the response body into the '.part' file starting at `offset`.
+
+        The file is preallocated from content-length, socket reads go into one reusable
+        buffer with an adaptive read size, and the buffer is flushed in large blocks aligned
+        to WRITE_BLOCK_SIZE. If a `hasher` is given, each block is hashed as it is written.
+        `on_allocated` is called if the whole file's space was claimed on disk up front; it
+        isn't called for resumes, or bodies whose decoded size isn't known.
+        Returns the number of bytes now on disk.
+        """
+        readinto = self._get_reader(r)
+        # content-length counts encoded bytes, so it can't size a file we decode on the fly.
+        file_size = total_size if r.headers.get('content-encoding', 'identity') == 'identity' else 0
+        buffer = bytearray(WRITE_BLOCK_SIZE)
+        view = memoryview(buffer)
+        read_size = MIN_READ_SIZE
+        downloaded = offset
+        last_report = 0.0
+
+        fd = os.open(part_path, os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            if not offset:
+                os.ftruncate(fd, 0)
+                if self._preallocate(fd, file_size) and on_allocated:
+                    on_allocated()
+            os.lseek(fd, offset, os.SEEK_SET)
+
+            # The first block is shortened so every later write starts on a block boundary.
+            block_end = WRITE_BLOCK_SIZE - (offset % WRITE_BLOCK_SIZE)
+            filled = 0
+            while True:
+                # A cancel/pause request ends the stream like EOF would, so buffered data still gets written.
+                stop = self.job_control.requested(job_id)
+                try:
+                    n = 0 if stop else readinto(view[filled:min(filled + read_size, block_end)])
+                except (OSError, urllib3.exceptions.HTTPError):
+                    # The request aborts a blocked read by shutting the socket down under it.
+                    if not (stop := self.job_control.requested(job_id)):
+                        raise
+                    n = 0
+                if not n:
+                    stop = stop or self.job_control.requested(job_id)
+                if n:
+                    filled += n
+                    # A full read means data is waiting on the socket, so ask for more next time.
+                    if n == read_size:
+                        read_size = min(read_size * 2, MAX_READ_SIZE)
+                    elif n < read_size // 4:
+                        read_size = max(read_size // 2, MIN_READ_SIZE)
+
+                if filled and (filled == block_end or not n):
+                    written = 0
+                    while written < filled:
+                        written += os.write(fd, view[written:filled])
+                    if hasher:
+                        hasher.update(view[:filled])
+                    downloaded += filled
+                    filled = 0
+                    block_end = WRITE_BLOCK_SIZE
+                    # Only journal bytes the kernel has accepted, so a resume never skips data.
+                    if self.job_store:
+                        self.job_store.update_progress(job_id, downloaded, total_size)
+
+                now = time.monotonic()
+                if total_size > 0 and (now - last_report >= PROGRESS_INTERVAL or not n):
+                    last_report = now
+                    percent = ((downloaded + filled) / total_size) * 100
+                    progress_line = (
+                        f"\r\033[K"
+                        f"\033[36mDownloading...\033[0m "
+                        f"{percent:>7.2f}% of {total_size / (1024 * 1024):.2f} MB"
+                    )
+                    self.socketio.emit('terminal_output', {'job_id': job_id, 'line': progress_line})
+
+                if stop:
+                    # Journal exactly what is on disk, so a paused download resumes without a gap.
+                    if self.job_store:
+                        self.job_store.update_progress(job_id, downloaded, total_size, force=True)
+                    self.job_control.check(job_id)
+                if not n:
+                    break
+
+            if file_size > 0 and downloaded != file_size:
+                raise IOError(f"Connection closed after {downloaded} of {file_size} bytes.")
+            if file_size <= 0:
+                os.ftruncate(fd, downloaded)
+        finally:
+            view.release()
+            os.close(fd)
+        return downloaded
+
+    def _get_filename(self, content_disposition, url):
+        """Takes the filename from a Content-Disposition header, falling back to the URL."""
+        if content_disposition:
+            fname = re.findall('filename="?(.+)"?', content_disposition)
+            if fname:
+                return fname[0]
+        return self._get_filename_from_url(url)
+
+    def _reserve_disk(self, job_id, size):
+        """Waits until `size` bytes fit on disk. Returns the reservation's token."""
+        if not self.disk_admission:
+            return None
+        return self.disk_admission.reserve_for_job(job_id, size, self.socketio, self.job_control)
+
+    def _release_disk(self, token):
+        """Frees a reservation, e.g. once the file has been preallocated and shows up in the free space."""
+        if self.disk_admission:
+            self.disk_admission.release(token)
+
+    def _download_single(self, url, job_id, algorithm):
+        """
+        Streams the file from a single URL into its '.part' file, resuming a previous attempt
+        when the server supports range requests. Returns (filename, part_path, hasher).
         """
+        r = requests.get(url, stream=True, allow_redirects=True, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+        # Lets a cancel or pause abort a read that is waiting on the server.
+        self.job_control.attach(job_id, r)
         try:
-            self.socketio.emit('terminal_output', {'line': f"\n\033[1mIntercepted download request for:\033[0m {url}"})
+            r.raise_for_status()  # Will raise an exception for bad status codes (4xx or 5xx)
 
-            with requests.get(url, stream=True, allow_redirects=True) as r:
-                r.raise_for_status()  # Will raise an exception for bad status codes (4xx or 5xx)
+            # Try to get filename from headers, fallback to URL
+            filename = self._get_filename(r.headers.get('content-disposition'), url)
 
-                # Try to get filename from headers, fallback to URL
-                content_disposition = r.headers.get('content-disposition')
-                if content_disposition:
-                    import re
-                    fname = re.findall('filename="?(.+)"?', content_disposition)
-                    filename = fname[0] if fname else self._get_filename_from_url(url)
-                else:
-                    filename = self._get_filename_from_url(url)
+            total_size = int(r.headers.get('content-length', 0))
+            final_path = os.path.join(self.output_path, filename)
+            part_path = final_path + '.part'
+            self.job_control.track(job_id, part_path)
 
-                total_size = int(r.headers.get('content-length', 0))
-                final_path = os.path.join(self.output_path, filename)
+            # --- Resume a previous attempt if a partial file was left behind ---
+            downloaded = 0
+            if r.headers.get('accept-ranges') == 'bytes':
+                resume_from = self._get_resume_offset(part_path, total_size, job_id)
+                if resume_from > 0:
+                    self.job_control.detach(job_id, r)
+                    r.close()
+                    r = requests.get(url, stream=True, allow_redirects=True, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                                     headers={'Range': f"bytes={resume_from}-"})
+                    self.job_control.attach(job_id, r)
+                    r.raise_for_status()
+                    if r.status_code == 206:
+                        downloaded = resume_from
+                        self.socketio.emit('terminal_output', {
+                            'job_id': job_id, 'line': f"\033[35mResuming from {resume_from / (1024 * 1024):.2f} MB...\033[0m"})
 
-                self.socketio.emit('terminal_output', {'line': f"\033[1mFile:\033[0m {filename}"})
+            # --- Admission control: wait until the rest of the file fits on disk ---
+            token = self._reserve_disk(job_id, total_size - downloaded)
+            try:
+                self.socketio.emit('terminal_output', {'job_id': job_id, 'line': f"\033[1mFile:\033[0m {filename}"})
                 self.socketio.emit('terminal_output',
-                                   {'line': f"\033[1mSize:\033[0m {total_size / (1024 * 1024):.2f} MB\n"})
-
-                downloaded = 0
-                chunk_size = 8192
-                with open(final_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=chunk_size):
-                        f.write(chunk)
-                        downloaded += len(chunk)
-
-                        if total_size > 0:
-                            percent = (downloaded / total_size) * 100
-                            progress_line = (
-                                f"\r\033[K"
-                                f"\033[36mDownloading...\033[0m "
-                                f"{percent:>7.2f}% of {total_size / (1024 * 1024):.2f} MB"
-                            )
-                            self.socketio.emit('terminal_output', {'line': progress_line})
-
-            self.socketio.emit('terminal_output', {'line': f"\n\033[32;1mSuccess! File saved as:\033[0m {filename}"})
-            self.socketio.emit('download_complete', {'filename': filename})
+                                   {'job_id': job_id, 'line': f"\033[1mSize:\033[0m {total_size / (1024 * 1024):.2f} MB\n"})
+
+                hasher = None
+                if algorithm:
+                    # A resumed download only streams the tail, so the kept prefix is hashed from disk once.
+                    hasher = hash_file(hashlib.new(algorithm), part_path, downloaded) if downloaded \
+                        else hashlib.new(algorithm)
+                self._stream_to_file(r, part_path, downloaded, total_size, job_id, hasher,
+                                     on_allocated=lambda: self._release_disk(token))
+            finally:
+                # Without preallocation the file only claims its space as it is written.
+                self._release_disk(token)
+        finally:
+            self.job_control.detach(job_id, r)
+            r.close()
+        return filename, part_path, hasher
+
+    def _select_mirrors(self, urls, job_id):
+        """
+        Probes all mirrors in parallel and keeps the reachable ones that agree on the file's size.
+        Returns them fastest first.
+        """
+        self.socketio.emit('terminal_output', {'job_id': job_id, 'line': f"\033[1mProbing {len(urls)} mirrors...\033[0m"})
+        mirrors = probe_mirrors(urls)
+        size = agreed_size(mirrors, urls[0])
+        selected = []
+        for mirror in mirrors:
+            if mirror.error:
+                line = f"  \033[31m✗\033[0m {mirror.host}: {mirror.error}"
+            elif mirror.size != size:
+                line = f"  \033[31m✗\033[0m {mirror.host}: reports {mirror.size} bytes, the others {size}; skipped"
+            else:
+                selected.append(mirror)
+                line = (f"  \033[32m✓\033[0m {mirror.host}: {mirror.latency * 1000:.0f} ms"
+                        f"{'' if mirror.ranges else ', no range requests'}")
+            self.socketio.emit('terminal_output', {'job_id': job_id, 'line': line})
+        if not selected:
+            raise IOError("None of the mirrors could be reached.")
+
+        # Servers compute ETags differently, so differing ones are only worth a warning; each
+        # mirror's own ETag still pins its copy for the whole download (see MirrorDownload).
+        etags = {m.etag for m in selected if m.etag and not m.etag.startswith('W/')}
+        if len(etags) > 1:
+            self.socketio.emit('terminal_output', {
+                'job_id': job_id, 'line': "\033[93mMirrors report different ETags; use a checksum to be sure they serve the same file.\033[0m"})
+        return selected
+
+    def _download_mirrored(self, url, mirrors, job_id, algorithm):
+        """
+        Downloads the file from several mirrors at once into its '.part' file, resuming the
+        ranges a previous attempt didn't finish. Returns (filename, part_path, hasher).
+        """
+        primary = next((m for m in mirrors if m.content_disposition), mirrors[0])
+        filename = self._get_filename(primary.content_disposition, url)
+        total_size = mirrors[0].size
+        final_path = os.path.join(self.output_path, filename)
+        part_path = final_path + '.part'
+        self.job_control.track(job_id, part_path)
+        self.job_control.track(job_id, part_path + '.ranges')
+
+        remaining = MirrorDownload.load_state(part_path, total_size, mirrors)
+        token = None
+        try:
+            if remaining is None:
+                token = self._reserve_disk(job_id, total_size)
+                fd = os.open(part_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+                try:
+                    if self._preallocate(fd, total_size):
+                        self._release_disk(token)
+                    # The mirrors write at scattered offsets, so the file has to be full size either way.
+                    os.ftruncate(fd, total_size)
+                finally:
+                    os.close(fd)
+            download = MirrorDownload(mirrors, part_path, total_size, job_id=job_id, socketio=self.socketio,
+                                      job_control=self.job_control, remaining=remaining)
+
+            done = download.downloaded()
+            if remaining is not None:
+                self.socketio.emit('terminal_output', {
+                    'job_id': job_id, 'line': f"\033[35mResuming from {done / (1024 * 1024):.2f} MB...\033[0m"})
+            self.socketio.emit('terminal_output', {'job_id': job_id, 'line': f"\033[1mFile:\033[0m {filename}"})
+            self.socketio.emit('terminal_output', {
+                'job_id': job_id, 'line': f"\033[1mSize:\033[0m {total_size / (1024 * 1024):.2f} MB from {len(mirrors)} mirrors\n"})
+
+            # The data arrives out of order, so the digest follows the fully downloaded prefix, read back from disk.
+            hasher = hashlib.new(algorithm) if algorithm else None
+            hashed = 0
+
+            def on_progress():
+                nonlocal hashed
+                frontier = download.frontier()
+                if hasher and frontier > hashed:
+                    hash_file(hasher, part_path, frontier - hashed, offset=hashed)
+                    hashed = frontier
+                # Only the prefix is journaled, so a plain single-URL resume can never skip a gap.
+                if self.job_store:
+                    self.job_store.update_progress(job_id, frontier, total_size)
+                percent = download.downloaded() / total_size * 100 if total_size else 100
+                rates = ', '.join(f"{m.host} {m.rate / (1024 * 1024):.1f} MB/s" for m in download.active_mirrors())
+                self.socketio.emit('terminal_output', {
+                    'job_id': job_id,
+                    'line': f"\r\033[K\033[36mDownloading...\033[0m {percent:>7.2f}% of {total_size / (1024 * 1024):.2f} MB ({rates})"})
+
+            download.run(on_progress)
+        finally:
+            # Without preallocation the sparse file only claims its space as the mirrors fill it.
+            self._release_disk(token)
+        on_progress()
+        if self.job_store:
+            self.job_store.update_progress(job_id, download.frontier(), total_size, force=True)
+        self.job_control.check(job_id)
+        os.remove(download.state_path)
+        return filename, part_path, hasher
+
+    def download_document(self, url: str, job_id: str | None = None, checksum: str | None = None,
+                          mirrors: list | None = None):
+        """
+        Main method to download a generic file. Designed to be run in a background task.
+        Data is streamed into a '.part' file first, so an interrupted download can be
+        resumed with an HTTP Range request when the server supports it.
+
+        If `mirrors` lists other URLs of the same file, they are probed together with `url`
+        and the fastest ones that support range requests download it together.
+
+        If `checksum` is given (e.g. 'sha256:<hex>'), the digest is computed while the
+        data streams in and the file is rejected if it doesn't match.
+        """
+        part_path = None
+        try:
+            algorithm, expected_digest = parse_expected_digest(checksum) if checksum else (None, None)
+            self.socketio.emit('terminal_output', {'job_id': job_id, 'line': f"\n\033[1mIntercepted download request for:\033[0m {url}"})
+
+            urls = list(dict.fromkeys([url, *(mirrors or [])]))
+            racers = []
+            if len(urls) > 1:
+                selected = self._select_mirrors(urls, job_id)
+                racers = [m for m in selected if m.ranges][:MAX_ACTIVE_MIRRORS]
+                if len(racers) < 2:
+                    # Nothing to split between, so the fastest mirror does it alone.
+                    url = (racers or selected)[0].url
+            if len(racers) > 1:
+                filename, part_path, hasher = self._download_mirrored(urls[0], racers, job_id, algorithm)
+            else:
+                filename, part_path, hasher = self._download_single(url, job_id, algorithm)
+            final_path = os.path.join(self.output_path, filename)
+
+            digest = None
+            if hasher:
+                digest = hasher.hexdigest()
+                verify_digest(algorithm, expected_digest, digest)
+                self.socketio.emit('terminal_output',
+                                   {'job_id': job_id, 'line': f"\n\033[32m{algorithm.upper()} verified:\033[0m {digest}"})
+                digest = f"{algorithm}:{digest}"
+
+            os.replace(part_path, final_path)
+            self.socketio.emit('terminal_output', {'job_id': job_id, 'line': f"\n\033[32;1mSuccess! File saved as:\033[0m {filename}"})
+            self.socketio.emit('download_complete', {'job_id': job_id, 'filename': filename, 'digest': digest})
+            return {'status': 'success', 'filename': filename, 'digest': digest}
+
+        except DownloadInterrupted as e:
+            # The stream is closed above; a cancelled job's '.part' file is removed by the caller.
+            self.socketio.emit('terminal_output', {'job_id': job_id, 'line': f"\n\033[93;1m{e}\033[0m"})
+            self.socketio.emit(f"download_{e.status}", {'job_id': job_id})
+            return {'status': e.status}
+
+        except ChecksumMismatchError as e:
+            # The data is corrupt, so there is nothing worth resuming from.
+            if part_path and os.path.exists(part_path):
+                os.remove(part_path)
+            logger.error(f"Checksum verification failed for {url}: {e}")
+            self.socketio.emit('terminal_output', {'job_id': job_id, 'line': f"\n\033[31;1mCHECKSUM MISMATCH:\033[0m {e}"})
+            self.socketio.emit('download_error', {'job_id': job_id, 'error': str(e)})
+            return {'status': 'error', 'message': str(e)}
 
         except Exception as e:
             logger.error(f"Generic download failed for {url}: {e}", exc_info=False)
             error_message = str(e)
-            self.socketio.emit('terminal_output', {'line': f"\n\033[31;1mFATAL ERROR:\033[0m {error_message}"})
-            self.socketio.emit('download_error', {'error': error_message})
\ No newline at end of file
+            self.socketio.emit('terminal_output', {'job_id': job_id, 'line': f"\n\033[31;1mFATAL ERROR:\033[0m {error_message}"})
+            self.socketio.emit('download_error', {'job_id': job_id, 'error': error_message})
+            return {'status': 'error', 'message': error_message}
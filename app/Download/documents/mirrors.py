@@ -0,0 +1,420 @@
+# app/Download/documents/mirrors.py
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+import requests
+import urllib3
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+# --- Basic Configuration ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# --- Mirror Racing Tuning ---
+# At most this many of the fastest mirrors download at the same time.
+MAX_ACTIVE_MIRRORS = 4
+# The file is handed out in ranges of this size; the last ones are split between mirrors as they free up.
+SEGMENT_SIZE = 8 * 1024 * 1024
+# A range is only split if both halves would be at least this big.
+MIN_SPLIT_SIZE = 1024 * 1024
+READ_SIZE = 256 * 1024
+# Seconds to connect to a mirror, and to wait for its next bytes before giving up on the request.
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 20
+# A mirror is dropped after this many failed requests in a row.
+MAX_FAILURES = 3
+# Once every mirror has a measured speed, one below this fraction of the fastest takes no new ranges.
+SLOW_FRACTION = 0.1
+# Smoothing of each mirror's measured speed; higher follows changes faster.
+RATE_SMOOTHING = 0.3
+
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+
+class MirrorInconsistentError(IOError):
+    """Raised when a mirror serves something other than the file the other mirrors agreed on."""
+
+
+class Mirror:
+    """One URL of the file, with what its probe found out and how fast it has been."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.session = requests.Session()
+        self.latency = None
+        self.size = 0
+        self.ranges = False
+        self.etag = None
+        self.last_modified = None
+        self.content_disposition = None
+        self.error = None
+        # Bytes per second, smoothed; 0 until the first measurement
+        self.rate = 0.0
+        self.failures = 0
+        self.dropped = False
+
+    @property
+    def host(self) -> str:
+        return requests.utils.urlparse(self.url).netloc or self.url
+
+    def probe(self):
+        """
+        Asks for the first byte of the file. This measures the time to the first response,
+        and a 206 answer proves range requests work, which a HEAD request wouldn't.
+        """
+        start = time.monotonic()
+        try:
+            r = self.session.get(self.url, stream=True, allow_redirects=True, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                                 headers={'Range': 'bytes=0-0', 'Accept-Encoding': 'identity'})
+            self.latency = time.monotonic() - start
+            r.close()
+            r.raise_for_status()
+        except requests.RequestException as e:
+            self.error = str(e)
+            return
+        # Later requests go straight to where the redirects led.
+        self.url = r.url
+        self.etag = r.headers.get('etag')
+        self.last_modified = r.headers.get('last-modified')
+        self.content_disposition = r.headers.get('content-disposition')
+        match = CONTENT_RANGE.match(r.headers.get('content-range', ''))
+        if r.status_code == 206 and match and match.group(3) != '*':
+            self.size = int(match.group(3))
+            self.ranges = True
+        else:
+            self.size = int(r.headers.get('content-length', 0))
+
+    def validator(self) -> str | None:
+        """The If-Range value that makes the mirror refuse a range of a file that has since changed."""
+        if self.etag and not self.etag.startswith('W/'):
+            return self.etag
+        return self.last_modified
+
+    def record_rate(self, nbytes: int, seconds: float):
+        if seconds <= 0:
+            return
+        rate = nbytes / seconds
+        self.rate = rate if not self.rate else self.rate + RATE_SMOOTHING * (rate - self.rate)
+
+
+def probe_mirrors(urls: List[str]) -> List[Mirror]:
+    """Probes every mirror at the same time. Returns them fastest first, unreachable ones last."""
+    mirrors = [Mirror(url) for url in urls]
+    with ThreadPoolExecutor(max_workers=min(len(mirrors), 16)) as pool:
+        list(pool.map(Mirror.probe, mirrors))
+    return sorted(mirrors, key=lambda m: (m.error is not None, m.latency if m.latency is not None else float('inf')))
+
+
+def agreed_size(mirrors: List[Mirror], primary_url: str) -> int:
+    """
+    The size most reachable mirrors report, preferring the primary URL's on a tie.
+    Mirrors that report another size are serving a different file (or version) and are left out.
+    """
+    sizes = Counter(m.size for m in mirrors if not m.error and m.size)
+    if not sizes:
+        return 0
+    primary = next((m.size for m in mirrors if m.url == primary_url and m.size), None)
+    return max(sizes, key=lambda size: (sizes[size], size == primary))
+
+
+class Segment:
+    """A byte range [start, end) of the file; `pos` is where its download has got to."""
+
+    def __init__(self, start: int, end: int):
+        self.start = start
+        self.pos = start
+        self.end = end
+        self.owner = None
+
+    @property
+    def remaining(self) -> int:
+        return self.end - self.pos
+
+
+class MirrorDownload:
+    """
+    Downloads one file from several mirrors at once, each writing its ranges straight into
+    the preallocated '.part' file.
+
+    Every mirror pulls the next range from a shared queue, so faster mirrors simply take
+    more of them. Once the queue is empty, a mirror that runs out of work takes the tail
+    of the largest range still in flight, sized by how fast it is compared to the mirror
+    holding it; a slow mirror's last range therefore ends up mostly downloaded by fast
+    ones. A failed request puts the rest of its range back in the queue, and a mirror that
+    keeps failing, is far slower than the rest or turns out to serve a different file is
+    dropped.
+
+    The ranges still missing are saved next to the '.part' file, so a paused or failed
+    download resumes where it stopped.
+    """
+
+    def __init__(self, mirrors: List[Mirror], part_path: str, total_size: int, job_id=None,
+                 socketio=None, job_control=None, remaining=None):
+        """
+        Initializes the MirrorDownload.
+
+        Args:
+            mirrors (list): The probed mirrors to download from, fastest first.
+            part_path (str): The preallocated file the ranges are written into.
+            total_size (int): The size of the file, as the mirrors agreed.
+            job_id (str): The job this download belongs to.
+            socketio: Where terminal lines about mirrors are emitted.
+            job_control (JobControl): Checked between reads and aborts blocked ones, to stop on cancel/pause requests.
+            remaining (list): The [start, end) ranges still to download, from a saved state.
+        """
+        self.mirrors = mirrors
+        self.part_path = part_path
+        self.total_size = total_size
+        self.job_id = job_id
+        self.socketio = socketio
+        self.job_control = job_control
+        self._condition = threading.Condition()
+        self._active: set = set()
+        self._queue: List[Segment] = []
+        for start, end in (remaining if remaining is not None else [(0, total_size)]):
+            for offset in range(start, end, SEGMENT_SIZE):
+                self._queue.append(Segment(offset, min(offset + SEGMENT_SIZE, end)))
+
+    # --- State ---
+
+    @property
+    def state_path(self) -> str:
+        return self.part_path + '.ranges'
+
+    @classmethod
+    def load_state(cls, part_path: str, total_size: int, mirrors: List[Mirror]) -> List[List[int]] | None:
+        """
+        Returns the ranges a previous attempt still had to download, if its '.part' file can be
+        kept: same size, and no mirror's ETag/Last-Modified has changed since.
+        """
+        try:
+            with open(part_path + '.ranges', 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get('size') != total_size or not os.path.exists(part_path) \
+                or os.path.getsize(part_path) != total_size:
+            return None
+        validators = state.get('validators') or {}
+        for mirror in mirrors:
+            saved = validators.get(mirror.url)
+            if saved and mirror.validator() and saved != mirror.validator():
+                return None
+        return state.get('remaining')
+
+    def save_state(self):
+        """Records the ranges still missing. Written atomically, and an older copy only ever lists more."""
+        state = {
+            'size': self.total_size,
+            'validators': {m.url: m.validator() for m in self.mirrors if m.validator()},
+            'remaining': self.remaining_ranges(),
+        }
+        try:
+            with open(self.state_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(self.state_path + '.tmp', self.state_path)
+        except OSError as e:
+            logger.warning(f"Could not save the mirror download state of {self.part_path}: {e}")
+
+    def remaining_ranges(self) -> List[List[int]]:
+        with self._condition:
+            segments = sorted(self._queue + list(self._active), key=lambda s: s.pos)
+            return [[s.pos, s.end] for s in segments if s.remaining > 0]
+
+    def downloaded(self) -> int:
+        """Bytes on disk, wherever they are in the file."""
+        with self._condition:
+            return self.total_size - sum(s.remaining for s in self._queue + list(self._active))
+
+    def frontier(self) -> int:
+        """The length of the fully downloaded prefix of the file."""
+        with self._condition:
+            return min((s.pos for s in self._queue + list(self._active) if s.remaining > 0),
+                       default=self.total_size)
+
+    def active_mirrors(self) -> List[Mirror]:
+        return [m for m in self.mirrors if not m.dropped]
+
+    # --- Handing out ranges ---
+
+    def _stopping(self) -> bool:
+        return bool(self.job_control and self.job_control.requested(self.job_id))
+
+    def _is_slow(self, mirror: Mirror) -> bool:
+        rates = [m.rate for m in self.active_mirrors()]
+        if len(rates) < 2 or not all(rates):
+            return False
+        return mirror.rate < max(rates) * SLOW_FRACTION
+
+    def _split(self, thief: Mirror) -> Segment | None:
+        """Takes the tail of the largest range another mirror is still downloading."""
+        candidates = [s for s in self._active if s.owner is not thief]
+        if not candidates:
+            return None
+        segment = max(candidates, key=lambda s: s.remaining)
+        owner_rate, thief_rate = segment.owner.rate, thief.rate
+        share = thief_rate / (thief_rate + owner_rate) if owner_rate and thief_rate else 0.5
+        take = int(segment.remaining * share)
+        # The owner may be in the middle of a read, so its next READ_SIZE bytes stay with it.
+        split = max(segment.end - take, segment.pos + READ_SIZE)
+        if segment.end - split < MIN_SPLIT_SIZE or split - segment.pos < MIN_SPLIT_SIZE:
+            return None
+        tail = Segment(split, segment.end)
+        segment.end = split
+        return tail
+
+    def _take(self, mirror: Mirror) -> Segment | None:
+        """Waits for the next range for a mirror. Returns None once there is nothing left for it."""
+        with self._condition:
+            while not mirror.dropped and not self._stopping():
+                if self._is_slow(mirror):
+                    self._drop(mirror, "is too slow next to the others; its ranges go to faster mirrors")
+                    return None
+                segment = self._queue.pop(0) if self._queue else self._split(mirror)
+                if segment:
+                    segment.owner = mirror
+                    self._active.add(segment)
+                    return segment
+                if not self._active:
+                    return None
+                # Another mirror may still fail and hand its range back.
+                self._condition.wait(0.5)
+            return None
+
+    def _give_back(self, segment: Segment):
+        with self._condition:
+            self._active.discard(segment)
+            if segment.remaining > 0:
+                segment.owner = None
+                self._queue.insert(0, segment)
+            self._condition.notify_all()
+
+    def _drop(self, mirror: Mirror, reason: str):
+        mirror.dropped = True
+        logger.warning(f"Dropping mirror {mirror.url}: {reason}")
+        self._emit(f"\033[93mDropping mirror {mirror.host}: {reason}\033[0m")
+
+    def _emit(self, line: str):
+        if self.socketio:
+            self.socketio.emit('terminal_output', {'job_id': self.job_id, 'line': line})
+
+    # --- Downloading ---
+
+    def _fetch(self, mirror: Mirror, segment: Segment, fd: int, view: memoryview):
+        """Downloads a range from a mirror into the file until it is done, split off, or stopped."""
+        headers = {'Range': f"bytes={segment.pos}-{segment.end - 1}", 'Accept-Encoding': 'identity'}
+        if validator := mirror.validator():
+            headers['If-Range'] = validator
+        with mirror.session.get(mirror.url, headers=headers, stream=True,
+                                timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)) as r:
+            if self.job_control:
+                self.job_control.attach(self.job_id, r)
+            try:
+                self._read_range(mirror, segment, fd, view, r)
+            finally:
+                if self.job_control:
+                    self.job_control.detach(self.job_id, r)
+
+    def _read_range(self, mirror: Mirror, segment: Segment, fd: int, view: memoryview, r):
+        """Checks a range response and writes its body into the file."""
+        r.raise_for_status()
+        match = CONTENT_RANGE.match(r.headers.get('content-range', ''))
+        if r.status_code != 206 or not match:
+            # With If-Range, a full 200 answer means the mirror's copy changed since the probe.
+            raise MirrorInconsistentError("its copy of the file has changed")
+        if int(match.group(1)) != segment.pos or (match.group(3) != '*' and int(match.group(3)) != self.total_size):
+            raise MirrorInconsistentError(f"served the wrong range ({r.headers['content-range']})")
+
+        window_start, window_bytes = time.monotonic(), 0
+        try:
+            while not self._stopping():
+                with self._condition:
+                    want = min(segment.remaining, len(view))
+                if want <= 0:
+                    return
+                n = r.raw.readinto(view[:want])
+                if not n:
+                    raise IOError(f"connection closed at byte {segment.pos}")
+                # Another mirror may have taken over the end of this range during the read.
+                with self._condition:
+                    n = min(n, segment.remaining)
+                os.lseek(fd, segment.pos, os.SEEK_SET)
+                written = 0
+                while written < n:
+                    written += os.write(fd, view[written:n])
+                with self._condition:
+                    segment.pos += n
+                window_bytes += n
+                if time.monotonic() - window_start >= 0.5:
+                    mirror.record_rate(window_bytes, time.monotonic() - window_start)
+                    window_start, window_bytes = time.monotonic(), 0
+        finally:
+            # Fast mirrors can finish a range within one window, so the rest counts too.
+            if window_bytes:
+                mirror.record_rate(window_bytes, time.monotonic() - window_start)
+
+    def _run_mirror(self, mirror: Mirror):
+        buffer = bytearray(READ_SIZE)
+        view = memoryview(buffer)
+        fd = os.open(self.part_path, os.O_WRONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            while segment := self._take(mirror):
+                try:
+                    self._fetch(mirror, segment, fd, view)
+                    mirror.failures = 0
+                except MirrorInconsistentError as e:
+                    self._drop(mirror, str(e))
+                # Raw reads raise urllib3's own errors, which requests doesn't wrap.
+                except (requests.RequestException, urllib3.exceptions.HTTPError, OSError) as e:
+                    if self._stopping():
+                        # The stop request aborted the read; the mirror itself is fine.
+                        continue
+                    mirror.failures += 1
+                    if mirror.failures >= MAX_FAILURES:
+                        self._drop(mirror, f"failed {mirror.failures} times in a row ({e})")
+                    else:
+                        self._emit(f"\033[93mMirror {mirror.host} failed, retrying its range elsewhere: {e}\033[0m")
+                        # Back off a little so the other mirrors get the range first.
+                        time.sleep(mirror.failures)
+                finally:
+                    self._give_back(segment)
+        except Exception as e:
+            logger.error(f"Mirror worker for {mirror.url} crashed: {e}", exc_info=True)
+            self._drop(mirror, str(e))
+        finally:
+            view.release()
+            os.close(fd)
+            mirror.session.close()
+            with self._condition:
+                self._condition.notify_all()
+
+    def run(self, on_progress=None, interval: float = 0.5):
+        """
+        Downloads every missing range, calling `on_progress()` about every `interval` seconds
+        from this thread. Raises IOError if the mirrors that are left can't finish the file.
+        A cancel/pause request makes the mirrors stop after their current read.
+        """
+        threads = [threading.Thread(target=self._run_mirror, args=(mirror,), daemon=True,
+                                    name=f"mirror-{mirror.host}") for mirror in self.mirrors]
+        for thread in threads:
+            thread.start()
+        last_save = time.monotonic()
+        try:
+            while alive := [thread for thread in threads if thread.is_alive()]:
+                alive[0].join(interval)
+                if on_progress:
+                    on_progress()
+                if time.monotonic() - last_save >= 5:
+                    self.save_state()
+                    last_save = time.monotonic()
+        finally:
+            self.save_state()
+
+        if self.downloaded() < self.total_size and not self._stopping():
+            raise IOError("All mirrors failed before the file was complete.")
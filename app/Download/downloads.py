@@ -12,14 +12,16 @@ class DownloadManager:
     Manages the listing of completed downloads from the designated directory.
     """
 
-    def __init__(self, download_folder='./downloads'):
+    def __init__(self, download_folder='./downloads', media_cache=None):
         """
         Initializes the DownloadManager.
 
         Args:
             download_folder (str): The path to the folder containing downloads.
+            media_cache (MediaProbeCache): Optional cache of probed media details and thumbnails.
         """
         self.download_folder = download_folder
+        self.media_cache = media_cache
         if not os.path.exists(self.download_folder):
             os.makedirs(self.download_folder)
 
@@ -34,6 +36,15 @@ class DownloadManager:
             n += 1
         return f"{bytes_value:.2f} {power_labels[n]}B"
 
+    def _media_details(self, filepath, stats):
+        """Returns cached media details for a file, queueing a background probe on a miss."""
+        if self.media_cache is None:
+            return None
+        media = self.media_cache.lookup(filepath, stats)
+        if media is None:
+            self.media_cache.schedule(filepath, stats)
+        return media
+
     def list_files(self):
         """
         Scans the download directory and returns a list of files with metadata.
@@ -59,8 +70,12 @@ class DownloadManager:
                         'size': self._format_size(stats.st_size),
                         'created_at': datetime.fromtimestamp(stats.st_ctime).strftime('%B %d, %Y'),
                         'type': file_type,
+                        'media': self._media_details(filepath, stats),
                     })
 
+            if self.media_cache is not None:
+                self.media_cache.save_soon()
+
             # Sort files by creation date, newest first
             files_with_details.sort(key=lambda x: os.path.getctime(os.path.join(self.download_folder, x['filename'])),
                                     reverse=True)
@@ -0,0 +1,113 @@
+# app/Download/emitter.py
+
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any
+
+# --- Basic Configuration ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class SocketIOEmitter:
+    """
+    A drop-in stand-in for `socketio` in the downloaders. `emit()` only puts the
+    message on a bounded in-memory queue and returns; a dedicated thread does the
+    actual network I/O to clients. A slow or disconnected client therefore can't
+    stall a yt-dlp hook, and the download thread gets straight back to work.
+
+    Progress lines (the ones redrawn in place with '\\r') are merged per job: while
+    one is still waiting to be sent, a newer one of the same job simply replaces it.
+    Progress lines without a 'job_id' can't be told apart, so they are never merged.
+    If the queue fills up, further log lines are dropped and a single notice reports
+    how many were lost. Lifecycle events such as 'download_complete' are never dropped.
+
+    Messages tagged with a 'job_id' are recorded in the job's log buffer (which is
+    what late-joining clients replay) and sent to that job's room, plus the
+    'firehose' room of clients that haven't subscribed to specific jobs.
+    """
+
+    FIREHOSE_ROOM = 'firehose'
+
+    def __init__(self, socketio, max_queue: int = 2000, task_logs=None):
+        """
+        Initializes the SocketIOEmitter and starts its sender thread.
+
+        Args:
+            socketio: The Flask-SocketIO instance that actually talks to clients.
+            max_queue (int): Maximum number of queued log lines before lines are dropped.
+            task_logs (TaskLogStore): Optional per-job log buffers that job lines are recorded in.
+        """
+        self.socketio = socketio
+        self.max_queue = max_queue
+        self.task_logs = task_logs
+        self.dropped = 0
+        self._queue = deque()
+        self._progress: Dict[Any, tuple] = {}
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='socketio-emitter', daemon=True)
+        self._thread.start()
+
+    def _is_progress(self, event: str, data) -> bool:
+        return event == 'terminal_output' and isinstance(data, dict) and str(data.get('line', '')).startswith('\r')
+
+    @staticmethod
+    def job_room(job_id: str) -> str:
+        return f"job:{job_id}"
+
+    def emit(self, event: str, data=None, **kwargs):
+        """Queues a Socket.IO message. Never blocks on the network."""
+        job_id = data.get('job_id') if isinstance(data, dict) else None
+        if job_id:
+            if self.task_logs is not None and event == 'terminal_output':
+                # Recorded before queueing, so a line dropped for slow clients can still be fetched.
+                data = {**data, 'offset': self.task_logs.append(job_id, data.get('line', ''))}
+            kwargs.setdefault('to', [self.job_room(job_id), self.FIREHOSE_ROOM])
+
+        with self._condition:
+            if job_id and self._is_progress(event, data):
+                # One pending progress line per job: newer ones overwrite it in place.
+                if job_id not in self._progress:
+                    self._queue.append(('progress', job_id))
+                self._progress[job_id] = (event, data, kwargs)
+            elif event == 'terminal_output' and len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                return
+            else:
+                self._queue.append(('message', (event, data, kwargs)))
+            self._condition.notify()
+
+    def _next(self):
+        """Waits for and returns the next message to send, or None once closed and drained."""
+        with self._condition:
+            while not self._queue:
+                if self._closed:
+                    return None
+                self._condition.wait()
+
+            kind, item = self._queue.popleft()
+            if kind == 'progress':
+                item = self._progress.pop(item)
+            if self.dropped and not self._queue:
+                # Tell clients their terminal has a gap, once the backlog has cleared.
+                self._queue.append(('message', ('terminal_output', {
+                    'line': f"\033[93m[{self.dropped} log lines dropped: client too slow]\033[0m"}, {})))
+                self.dropped = 0
+            return item
+
+    def _run(self):
+        while (item := self._next()) is not None:
+            event, data, kwargs = item
+            try:
+                self.socketio.emit(event, data, **kwargs)
+            except Exception as e:
+                logger.error(f"Failed to emit '{event}' to clients: {e}")
+
+    def close(self, timeout: float | None = None):
+        """Sends whatever is still queued, then stops the sender thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout)
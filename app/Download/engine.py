@@ -0,0 +1,454 @@
+# app/Download/engine.py
+
+import os
+import json
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from contextlib import contextmanager
+from typing import Dict, Any
+
+import yt_dlp
+import yt_dlp.version
+from yt_dlp.postprocessor import PostProcessor, get_postprocessor
+from yt_dlp.utils import POSTPROCESS_WHEN
+
+from app.Download.checksum import ChecksumPP
+from app.Download.control import JobControl, DownloadInterrupted
+from app.Download.fragments import FragmentTuner
+
+# --- Basic Configuration ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Options a YoutubeDL bakes into its HTTP session, cookie jar, logged-in extractors or output
+# streams when it is created. Jobs that differ in any of these never share an instance.
+SESSION_OPTIONS = (
+    'cookiefile', 'cookiesfrombrowser', 'proxy', 'source_address', 'nocheckcertificate', 'http_headers',
+    'impersonate', 'socket_timeout', 'legacyserverconnect', 'enable_file_urls', 'client_certificate',
+    'client_certificate_key', 'client_certificate_password', 'username', 'password', 'usenetrc',
+    'netrc_location', 'ap_username', 'ap_password', 'allowed_extractors', 'compat_opts', 'js_runtimes',
+    'remote_components', 'cachedir', 'debug_printtraffic', 'quiet', 'logtostderr', 'color', 'no_color',
+)
+# Params YoutubeDL normalizes on creation; a reused instance keeps its normalized copies.
+NORMALIZED_SESSION_PARAMS = ('http_headers', 'compat_opts', 'js_runtimes', 'remote_components', 'color')
+# Options YoutubeDL only acts on when it is created (e.g. preloading the download archive).
+# Jobs that set any of them always get a new instance.
+INIT_ONLY_OPTIONS = ('download_archive', 'bidi_workaround', 'listformats', 'list_thumbnails', 'listsubtitles')
+# Two sets of job options that differ in everything YoutubeDL.__init__ derives state from,
+# used to check that a reconfigured instance matches a new one (see _reuse_supported).
+REUSE_PROBES = (
+    {'quiet': True, 'noprogress': True, 'outtmpl': '%(id)s.%(ext)s', 'format': 'best', 'nooverwrites': True},
+    {'quiet': True, 'noprogress': True, 'outtmpl': 'probe/%(title)s [%(id)s].%(ext)s', 'paths': {'home': 'probe'},
+     'format': 'bestvideo+bestaudio/best', 'overwrites': True, 'forceprint': {'video': ['id']},
+     'progress_hooks': [print], 'postprocessor_hooks': [print], 'post_hooks': [print],
+     'postprocessors': [{'key': 'FFmpegMetadata'}, {'key': 'FFmpegVideoRemuxer', 'preferedformat': 'mp4'},
+                        {'key': 'Exec', 'exec_cmd': 'true', 'when': 'after_move'}]},
+)
+
+
+def _describe(value):
+    """A comparable summary of an attribute: plain values as they are, other objects by type."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, dict):
+        return {str(k): _describe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_describe(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted(repr(_describe(v)) for v in value)
+    return type(value).__name__
+
+
+@lru_cache(maxsize=None)
+def _reuse_supported() -> bool:
+    """
+    True if pooled instances can be reused with the installed yt-dlp. YoutubeDLPool._reconfigure
+    redoes part of YoutubeDL.__init__, which isn't public API, so a reconfigured instance is
+    compared with a new one once; if they differ, every job gets a new instance. Warns once if so.
+    """
+    try:
+        with yt_dlp.YoutubeDL(dict(REUSE_PROBES[0])) as pooled, yt_dlp.YoutubeDL(dict(REUSE_PROBES[1])) as new:
+            YoutubeDLPool._reconfigure(pooled, dict(REUSE_PROBES[1]))
+            pooled_state, new_state = vars(pooled), vars(new)
+            differing = sorted(name for name in pooled_state.keys() | new_state.keys()
+                               if _describe(pooled_state.get(name)) != _describe(new_state.get(name)))
+    except Exception as e:
+        differing = [repr(e)]
+    if not differing:
+        return True
+    logger.warning(f"With yt-dlp {yt_dlp.version.__version__}, a reused YoutubeDL differs from a new one "
+                   f"({', '.join(differing)}); every job gets a new YoutubeDL instead of a warm one.")
+    return False
+
+
+class YoutubeDLPool:
+    """
+    Keeps YoutubeDL instances warm between jobs. Creating one registers every extractor
+    class and loads the cookie jar; the extractors a job uses are then instantiated and
+    initialized (e.g. logged in), and its HTTP session opens connections. A pooled
+    instance keeps all of that, and only the per-job options, hooks and postprocessors
+    are swapped in when it is checked out again.
+
+    A YoutubeDL isn't thread-safe, so each running job checks out its own instance and
+    the pool grows to the number of jobs that run at the same time. Jobs with options
+    only YoutubeDL.__init__ applies, or any job on a yt-dlp release the pool can't
+    reconfigure instances for, get a new instance that is closed afterwards.
+    """
+
+    def __init__(self, max_idle: int = 4):
+        """
+        Initializes the YoutubeDLPool.
+
+        Args:
+            max_idle (int): How many unused instances are kept; the least recently used are closed.
+        """
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle: OrderedDict[int, tuple] = OrderedDict()
+
+    @staticmethod
+    def session_key(params: Dict[str, Any]) -> str:
+        """Jobs with the same key can share an instance."""
+        return json.dumps({k: params.get(k) for k in SESSION_OPTIONS}, sort_keys=True, default=str)
+
+    @staticmethod
+    def reusable(params: Dict[str, Any]) -> bool:
+        """Whether a job with these options can run on a pooled instance."""
+        return _reuse_supported() and not any(params.get(k) for k in INIT_ONLY_OPTIONS)
+
+    @contextmanager
+    def acquire(self, params: Dict[str, Any]):
+        """
+        Checks out a YoutubeDL configured with `params`, and returns it to the pool afterwards.
+        The instance uses `params` itself as its params, as a new YoutubeDL would, so changes
+        the job makes to the dict while it runs (e.g. fragment tuning) reach yt-dlp.
+        """
+        if not self.reusable(params):
+            with yt_dlp.YoutubeDL(params) as ydl:
+                yield ydl
+            return
+        key = self.session_key(params)
+        ydl = None
+        with self._lock:
+            for slot, (slot_key, idle) in reversed(self._idle.items()):
+                if slot_key == key:
+                    del self._idle[slot]
+                    ydl = idle
+                    break
+        if ydl is None:
+            ydl = yt_dlp.YoutubeDL(params)
+        else:
+            self._reconfigure(ydl, params)
+        try:
+            yield ydl
+        finally:
+            self._release(key, ydl)
+
+    @staticmethod
+    def _reconfigure(ydl: yt_dlp.YoutubeDL, params: Dict[str, Any]):
+        """
+        Applies a job's options to a pooled instance: what YoutubeDL.__init__ derives from
+        its params, minus the session state this pool exists to keep. Like __init__, this
+        normalizes `params` in place and makes it the instance's params.
+        """
+        for key in NORMALIZED_SESSION_PARAMS:
+            if key in ydl.params:
+                params[key] = ydl.params[key]
+        # Forced on creation when the filesystem encoding can't represent all names.
+        if ydl.params.get('restrictfilenames') and 'restrictfilenames' not in params:
+            params['restrictfilenames'] = True
+        if 'overwrites' not in params and params.get('nooverwrites') is not None:
+            params['overwrites'] = not params['nooverwrites']
+        elif params.get('overwrites') is not None:
+            params['nooverwrites'] = not params['overwrites']
+        params.setdefault('forceprint', {})
+        params.setdefault('print_to_file', {})
+        ydl.params = params
+
+        # Per-run state left over from the previous job
+        ydl._printed_messages = set()
+        ydl._download_retcode = 0
+        ydl._num_downloads = 0
+        ydl._num_videos = 0
+        ydl._playlist_level = 0
+        ydl._playlist_urls = set()
+        ydl.archive = set()
+
+        ydl._parse_outtmpl()
+        fmt = params.get('format')
+        ydl.format_selector = fmt if fmt in (None, '-') or callable(fmt) else ydl.build_format_selector(fmt)
+
+        ydl._post_hooks, ydl._progress_hooks, ydl._postprocessor_hooks = [], [], []
+        for hook in params.get('post_hooks', []):
+            ydl.add_post_hook(hook)
+        for hook in params.get('progress_hooks', []):
+            ydl.add_progress_hook(hook)
+        for hook in params.get('postprocessor_hooks', []):
+            ydl.add_postprocessor_hook(hook)
+        ydl._pps = {when: [] for when in POSTPROCESS_WHEN}
+        for pp_def_raw in params.get('postprocessors', []):
+            pp_def = dict(pp_def_raw)
+            when = pp_def.pop('when', 'post_process')
+            ydl.add_post_processor(get_postprocessor(pp_def.pop('key'))(ydl, **pp_def), when=when)
+
+    def _release(self, key: str, ydl: yt_dlp.YoutubeDL):
+        try:
+            ydl.save_cookies()
+        except Exception as e:
+            logger.warning(f"Could not save yt-dlp cookies: {e}")
+        # Don't keep the last job's hooks (and the objects they reference) alive while idle.
+        ydl.params = {**ydl.params, 'logger': None, 'progress_hooks': [], 'postprocessor_hooks': []}
+        ydl._progress_hooks, ydl._postprocessor_hooks = [], []
+        ydl._pps = {when: [] for when in POSTPROCESS_WHEN}
+        with self._lock:
+            self._idle[id(ydl)] = (key, ydl)
+            evicted = []
+            while len(self._idle) > self.max_idle:
+                evicted.append(self._idle.popitem(last=False)[1][1])
+        for old in evicted:
+            old.close()
+
+    def close(self):
+        """Closes every idle instance and its HTTP connections."""
+        with self._lock:
+            idle, self._idle = list(self._idle.values()), OrderedDict()
+        for _, ydl in idle:
+            ydl.close()
+
+
+class SocketIOLogger:
+    """
+    Forwards yt-dlp's messages for one job to the frontend terminal.
+
+    Args:
+        socketio: Where the lines are emitted.
+        job_id (str): The job the lines belong to.
+        show_debug (bool): Also forward '[debug]' lines.
+        line_end (str): Appended to every line.
+    """
+
+    def __init__(self, socketio, job_id: str | None = None, show_debug: bool = False, line_end: str = ''):
+        self.socketio = socketio
+        self.job_id = job_id
+        self.show_debug = show_debug
+        self.line_end = line_end
+
+    def debug(self, msg):
+        if self.show_debug or not msg.startswith('[debug]'):
+            self.socketio.emit('terminal_output', {'job_id': self.job_id, 'line': msg + self.line_end})
+
+    def warning(self, msg):
+        self.socketio.emit('terminal_output', {'job_id': self.job_id, 'line': f'\033[93m{msg}\033[0m{self.line_end}'})
+
+    def error(self, msg):
+        self.socketio.emit('terminal_output', {'job_id': self.job_id, 'line': f'\033[91m{msg}\033[0m{self.line_end}'})
+
+
+class DiskReservationPP(PostProcessor):
+    """
+    Reserves disk space for each item of a multi-item job just before yt-dlp downloads it.
+    The previous item's reservation is freed first: that item is on disk by then, so it
+    already counts against the free space.
+    """
+
+    def __init__(self, engine: 'YtDlpEngine', job_id: str | None = None, converts: bool = False):
+        super().__init__()
+        self.engine = engine
+        self.job_id = job_id
+        self.converts = converts
+        self.token = None
+
+    def run(self, info):
+        self.release()
+        self.token = self.engine._reserve_disk(
+            self.job_id, self.engine.disk_admission.estimate_size(info, converts=self.converts))
+        return [], info
+
+    def release(self):
+        self.engine._release_disk(self.token)
+        self.token = None
+
+
+class YtDlpEngine:
+    """
+    The common base of the yt-dlp downloaders: the shared collaborators, the terminal
+    logger and hooks every job needs, and the extract → reserve disk → download flow.
+    YoutubeDL instances come from a YoutubeDLPool, which is shared between downloaders
+    when given, so a job starts on a warm instance instead of building a new one.
+    """
+
+    # Logged once if FFmpeg can't be found
+    FFMPEG_MISSING = "FFmpeg not found. Merging will likely fail."
+    # Label of the terminal progress line
+    PROGRESS_LABEL = "Downloading..."
+
+    def __init__(self, socketio=None, output_path='./downloads', job_store=None, fragment_tuner=None,
+                 disk_admission=None, job_control=None, ydl_pool=None):
+        """
+        Initializes the engine.
+
+        Args:
+            socketio: Where terminal output and job events are emitted.
+            output_path (str): The folder downloads are saved to.
+            job_store (JobStore): Optional journal of each job's progress.
+            fragment_tuner (FragmentTuner): Picks HLS/DASH fragment concurrency per host.
+            disk_admission (DiskAdmission): Optional; reserves disk space before a download writes.
+            job_control (JobControl): Cancels or pauses jobs on request.
+            ydl_pool (YoutubeDLPool): Warm YoutubeDL instances.
+        """
+        self.socketio = socketio
+        self.output_path = output_path
+        # Optional JobStore used to journal the progress of each download
+        self.job_store = job_store
+        # Optional DiskAdmission that reserves disk space before a download starts writing
+        self.disk_admission = disk_admission
+        # Cancels or pauses jobs on request; shared with the API when given
+        self.job_control = job_control or JobControl()
+        # Picks the HLS/DASH fragment concurrency per host; shared between downloaders when given
+        self.fragment_tuner = fragment_tuner or FragmentTuner()
+        # Warm YoutubeDL instances; shared between downloaders when given
+        self.ydl_pool = ydl_pool or YoutubeDLPool()
+        self._ffmpeg_location = None
+        os.makedirs(self.output_path, exist_ok=True)
+
+    def _get_ffmpeg_location(self) -> str | None:
+        """Finds the FFmpeg executable. A found location is remembered for later jobs."""
+        if self._ffmpeg_location:
+            return self._ffmpeg_location
+        if ff_path := shutil.which('ffmpeg'):
+            self._ffmpeg_location = ff_path
+            return ff_path
+        try:
+            current_dir = os.path.dirname(os.path.abspath(__file__))
+            project_root = os.path.abspath(os.path.join(current_dir, '..', '..'))
+            local_ffmpeg_path = os.path.join(project_root, 'ffmpeg', 'ffmpeg.exe' if os.name == 'nt' else 'ffmpeg')
+            if os.path.isfile(local_ffmpeg_path):
+                self._ffmpeg_location = local_ffmpeg_path
+                return local_ffmpeg_path
+        except Exception:
+            pass
+        logger.warning(self.FFMPEG_MISSING)
+        return None
+
+    def _emit_line(self, job_id: str | None, line: str):
+        self.socketio.emit('terminal_output', {'job_id': job_id, 'line': line})
+
+    def _make_logger(self, job_id: str | None = None, **kwargs) -> SocketIOLogger:
+        return SocketIOLogger(self.socketio, job_id, **kwargs)
+
+    def _make_progress_hook(self, job_id: str | None = None, fragment_session=None, finished_line: str | None = None):
+        """
+        Builds a job's yt-dlp progress hook: stops the job when it is cancelled or paused,
+        feeds the fragment tuner, journals progress and draws the terminal progress line.
+        """
+        def progress_hook(d: Dict[str, Any]):
+            # Raises DownloadInterrupted here once the job is cancelled or paused
+            self.job_control.on_progress(job_id, d)
+            if fragment_session:
+                fragment_session.on_progress(d)
+            if d.get('status') == 'downloading':
+                if self.job_store:
+                    self.job_store.update_progress(job_id, d.get('downloaded_bytes'),
+                                                   d.get('total_bytes') or d.get('total_bytes_estimate'))
+                progress_line = (
+                    f"\r\033[K"  # Clear line
+                    f"\033[36m{self.PROGRESS_LABEL}\033[0m "  # Cyan text
+                    f"{d.get('_percent_str', ''):>8} of {d.get('_total_bytes_str', ''):<10} "
+                    f"at {d.get('_speed_str', ''):<12} ETA {d.get('_eta_str', '')}"
+                )
+                self._emit_line(job_id, progress_line)
+            elif d.get('status') == 'finished' and finished_line:
+                self._emit_line(job_id, finished_line)
+            elif d.get('status') == 'error':
+                self._emit_line(job_id, "\n\033[31mAn error occurred during download.\033[0m")
+
+        return progress_hook
+
+    def _make_postprocessor_hook(self, job_id: str | None = None):
+        return lambda d: self.job_control.on_postprocess(job_id, d)
+
+    def _job_opts(self, job_id: str | None = None, fragment_session=None, finished_line: str | None = None,
+                  **logger_kwargs) -> Dict[str, Any]:
+        """The options every job has: its logger and hooks."""
+        return {
+            'progress_hooks': [self._make_progress_hook(job_id, fragment_session, finished_line)],
+            'postprocessor_hooks': [self._make_postprocessor_hook(job_id)],
+            'post_hooks': [lambda path: self.job_control.on_item_done(job_id, path)],
+            'logger': self._make_logger(job_id, **logger_kwargs),
+        }
+
+    def _reserve_disk(self, job_id: str | None, size: int) -> str | None:
+        """Waits until `size` bytes of disk space can be reserved for the job. Returns the reservation's token."""
+        if not self.disk_admission:
+            return None
+        return self.disk_admission.reserve_for_job(job_id, size, self.socketio, self.job_control)
+
+    def _release_disk(self, token: str | None):
+        if self.disk_admission:
+            self.disk_admission.release(token)
+
+    @contextmanager
+    def _reserve_per_item(self, ydl: yt_dlp.YoutubeDL, job_id: str | None = None, converts: bool = False):
+        """
+        Reserves disk space for every item `ydl` downloads while the block runs, right before
+        the item starts writing. For jobs with several items, e.g. playlists and syncs.
+        """
+        if not self.disk_admission:
+            yield
+            return
+        reservation = DiskReservationPP(self, job_id, converts)
+        ydl.add_post_processor(reservation, when='before_dl')
+        try:
+            yield
+        finally:
+            reservation.release()
+
+    def _run(self, url: str, ydl_opts: Dict[str, Any], job_id: str | None = None, checksum: str | None = None,
+             converts: bool = False):
+        """
+        Downloads a single item on a pooled YoutubeDL. The info is extracted first, so the
+        expected size can be reserved on disk before anything is written.
+
+        Returns:
+            tuple: (info dict, final file path, 'algorithm:digest' or None)
+        """
+        token = None
+        try:
+            with self.ydl_pool.acquire(ydl_opts) as ydl:
+                # Verify the final output against the published digest, if one was given
+                checksum_pp = ChecksumPP(ydl, checksum) if checksum else None
+                if checksum_pp:
+                    ydl.add_post_processor(checksum_pp, when='after_move')
+                info = ydl.extract_info(url, download=False)
+                token = self._reserve_disk(job_id, self.disk_admission.estimate_size(info, converts=converts)
+                                           if self.disk_admission else 0)
+                info = ydl.process_ie_result(info, download=True)
+                final_filename = ydl.prepare_filename(info)
+        finally:
+            self._release_disk(token)
+        digest = f"{checksum_pp.algorithm}:{checksum_pp.digest}" if checksum_pp else None
+        return info, final_filename, digest
+
+    def _interrupted(self, job_id: str | None, e: DownloadInterrupted) -> Dict[str, Any]:
+        """Reports a cancelled or paused job. A cancelled job's partial files are removed by the caller."""
+        self._emit_line(job_id, f"\n\033[93;1m{e}\033[0m")
+        self.socketio.emit(f"download_{e.status}", {'job_id': job_id})
+        return {'status': e.status}
+
+    def _completed(self, job_id: str | None, final_filename: str, digest: str | None,
+                   line_end: str = '') -> Dict[str, Any]:
+        """Reports a finished download and returns the job's result."""
+        filename = os.path.basename(final_filename)
+        self._emit_line(job_id, f"\n{line_end}\033[32;1mSuccess! File saved as:\033[0m {filename}{line_end}")
+        # Let the frontend know the process is complete
+        self.socketio.emit('download_complete', {'job_id': job_id, 'filename': filename, 'digest': digest})
+        return {'status': 'success', 'filename': filename, 'digest': digest}
+
+    def _failed(self, job_id: str | None, error_message: str, line_end: str = '') -> Dict[str, Any]:
+        """Reports a failed download and returns the job's result."""
+        self._emit_line(job_id, f"\n{line_end}\033[31;1mFATAL ERROR:\033[0m {error_message}{line_end}")
+        self.socketio.emit('download_error', {'job_id': job_id, 'error': error_message})
+        return {'status': 'error', 'message': error_message}
@@ -0,0 +1,142 @@
+# app/Download/fragments.py
+
+import time
+import logging
+import threading
+from urllib.parse import urlparse
+from typing import Dict, Any
+
+# --- Basic Configuration ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class FragmentTuner:
+    """
+    Learns a good yt-dlp 'concurrent_fragment_downloads' value per host with an
+    AIMD (additive increase, multiplicative decrease) rule: while throughput keeps
+    improving and no fragment needs a retry, add one worker; when the server starts
+    failing fragments (throttling, 403/429), halve the number of workers.
+
+    yt-dlp fixes the worker count when a fragmented stream starts, so a new value
+    takes effect on the next stream of the same job (e.g. the audio after the video
+    of a DASH download) and on every later job for the same host.
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 16, window: float = 5.0):
+        """
+        Initializes the FragmentTuner.
+
+        Args:
+            initial (int): Concurrency used for a host that hasn't been measured yet.
+            minimum (int): Lower bound for the concurrency.
+            maximum (int): Upper bound for the concurrency.
+            window (float): Seconds of transfer each measurement covers.
+        """
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.window = window
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, Dict[str, Any]] = {}
+
+    def _host_key(self, url: str) -> str:
+        """Groups URLs by host, ignoring a leading 'www.'."""
+        host = urlparse(url).hostname or url
+        return host[4:] if host.startswith('www.') else host
+
+    def session(self, url: str, fragments='auto') -> 'FragmentSession':
+        """
+        Creates a session for one job. `fragments` is either 'auto' (let the tuner decide)
+        or a fixed number of concurrent fragment downloads chosen by the user, kept within
+        the tuner's bounds.
+        """
+        if fragments not in (None, 'auto'):
+            return FragmentSession(self, None, min(self.maximum, max(self.minimum, int(fragments))))
+        key = self._host_key(url)
+        with self._lock:
+            state = self._hosts.setdefault(key, {'concurrency': self.initial, 'best_speed': 0.0})
+            return FragmentSession(self, key, state['concurrency'])
+
+    def _adjust(self, key: str, concurrency: int, speed: float, errors: int) -> int:
+        """Applies the AIMD rule to one measurement window and returns the new concurrency."""
+        with self._lock:
+            state = self._hosts[key]
+            if errors:
+                new = max(self.minimum, concurrency // 2)
+                state['best_speed'] = 0.0  # The server pushed back, so start measuring afresh
+            elif speed >= state['best_speed'] * 0.95:
+                new = min(self.maximum, concurrency + 1)
+                state['best_speed'] = max(state['best_speed'], speed)
+            else:
+                # More workers made it slower: the link is saturated, so step back.
+                new = max(self.minimum, concurrency - 1)
+            state['concurrency'] = new
+
+        if new != concurrency:
+            logger.info(f"Fragment concurrency for {key}: {concurrency} -> {new} "
+                        f"({speed / (1024 * 1024):.2f} MB/s, {errors} retries)")
+        return new
+
+
+class FragmentSession:
+    """
+    Tracks the throughput and fragment retries of one job and feeds them back into
+    the FragmentTuner. Its options are merged into the yt-dlp options of the job.
+    """
+
+    def __init__(self, tuner: FragmentTuner, key: str | None, concurrency: int):
+        self.tuner = tuner
+        self.key = key
+        self.concurrency = concurrency
+        self._params = None
+        self._errors = 0
+        self._window_start = None
+        self._window_bytes = 0
+        self._last_bytes = {}
+
+    @property
+    def auto(self) -> bool:
+        return self.key is not None
+
+    def ydl_opts(self) -> Dict[str, Any]:
+        """Returns the yt-dlp options that wire this session into a download."""
+        return {
+            'concurrent_fragment_downloads': self.concurrency,
+            'retry_sleep_functions': {'fragment': self.on_retry},
+        }
+
+    def bind(self, params: Dict[str, Any]):
+        """Remembers the live yt-dlp params so later streams of the job pick up new values."""
+        self._params = params
+
+    def on_retry(self, n: int) -> float:
+        """
+        Called by yt-dlp each time a fragment is retried. Counts the error and returns an
+        exponential backoff, so a throttling server isn't hammered while we scale down.
+        """
+        self._errors += 1
+        return min(0.5 * (2 ** n), 10.0)
+
+    def on_progress(self, d: Dict[str, Any]):
+        """Feeds a yt-dlp progress hook update into the current measurement window."""
+        # Only fragmented (HLS/DASH) streams are affected by the fragment concurrency
+        if not self.auto or d.get('status') != 'downloading' or not d.get('fragment_count'):
+            return
+        now = time.monotonic()
+        filename = d.get('tmpfilename') or d.get('filename')
+        downloaded = d.get('downloaded_bytes') or 0
+        self._window_bytes += max(0, downloaded - self._last_bytes.get(filename, 0))
+        self._last_bytes[filename] = downloaded
+
+        if self._window_start is None:
+            self._window_start, self._window_bytes = now, 0
+            return
+        elapsed = now - self._window_start
+        if elapsed < self.tuner.window:
+            return
+
+        self.concurrency = self.tuner._adjust(self.key, self.concurrency, self._window_bytes / elapsed, self._errors)
+        if self._params is not None:
+            self._params['concurrent_fragment_downloads'] = self.concurrency
+        self._window_start, self._window_bytes, self._errors = now, 0, 0
@@ -0,0 +1,295 @@
+# app/Download/jobs.py
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+
+# --- Basic Configuration ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class JobStore:
+    """
+    A durable on-disk journal of download jobs, backed by SQLite in WAL mode.
+    Every request submitted through the API is recorded here along with its
+    progress, so unfinished jobs can be re-queued when the app restarts.
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    PAUSED = 'paused'
+    CANCELLED = 'cancelled'
+
+    # Jobs in these states were interrupted by a shutdown and should be re-queued.
+    # Paused jobs are not: they wait for the user to resume them.
+    UNFINISHED = (PENDING, RUNNING)
+
+    # A job still running after this many attempts keeps taking the app down with it,
+    # so a restart marks it failed instead of starting it again.
+    MAX_ATTEMPTS = 5
+
+    def __init__(self, db_path, progress_interval: float = 1.0):
+        """
+        Initializes the JobStore.
+
+        Args:
+            db_path (str): The path to the SQLite database file.
+            progress_interval (float): Minimum seconds between progress writes for a job.
+        """
+        self.db_path = str(db_path)
+        self.progress_interval = progress_interval
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+
+        # A single connection shared by all download threads, serialized by a lock.
+        self._lock = threading.Lock()
+        self._last_progress_write: Dict[str, float] = {}
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                downloaded INTEGER NOT NULL DEFAULT 0,
+                total INTEGER,
+                filename TEXT,
+                digest TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker_id TEXT,
+                lease_expires REAL,
+                partials TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)')
+        self._migrate()
+
+    def _migrate(self):
+        """Adds columns introduced after a journal was first created."""
+        columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(jobs)')}
+        if 'digest' not in columns:
+            self._conn.execute('ALTER TABLE jobs ADD COLUMN digest TEXT')
+        if 'worker_id' not in columns:
+            self._conn.execute('ALTER TABLE jobs ADD COLUMN worker_id TEXT')
+            self._conn.execute('ALTER TABLE jobs ADD COLUMN lease_expires REAL')
+        if 'partials' not in columns:
+            self._conn.execute('ALTER TABLE jobs ADD COLUMN partials TEXT')
+
+    def _row_to_dict(self, row) -> Optional[Dict[str, Any]]:
+        """Converts a database row into a plain dictionary."""
+        if row is None:
+            return None
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['partials'] = json.loads(job['partials'] or '[]')
+        return job
+
+    def _update(self, job_id: str, **fields):
+        """Updates the given columns of a job and bumps its timestamp."""
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{column} = ?" for column in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def submit(self, kind: str, params: Dict[str, Any]) -> str:
+        """
+        Records a newly submitted job.
+
+        Args:
+            kind (str): The type of job (e.g., 'video', 'playlist').
+            params (dict): The keyword arguments the downloader will be called with.
+
+        Returns:
+            str: The ID of the new job.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, params, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(params), self.PENDING, now, now)
+            )
+        return job_id
+
+    def mark_running(self, job_id: str):
+        """Marks a job as running and counts the attempt."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (self.RUNNING, now, job_id)
+            )
+
+    def update_progress(self, job_id: str, downloaded: int | None, total: int | None = None, force: bool = False):
+        """
+        Records how far a job has progressed. Writes are throttled per job so that
+        chatty progress hooks don't turn into a stream of database commits; `force`
+        writes immediately, e.g. to save the exact offset of a paused download.
+        """
+        if not job_id or downloaded is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_progress_write.get(job_id, 0) < self.progress_interval:
+            return
+        self._last_progress_write[job_id] = now
+        self._update(job_id, downloaded=int(downloaded), total=int(total) if total else None)
+
+    def mark_completed(self, job_id: str, filename: str | None = None, digest: str | None = None):
+        """Marks a job as successfully completed, recording the verified digest if there is one."""
+        self._last_progress_write.pop(job_id, None)
+        with self._lock:
+            # Progress writes are throttled, so settle the final byte count here.
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, filename = ?, digest = ?, error = NULL, "
+                "downloaded = COALESCE(total, downloaded), updated_at = ? WHERE id = ?",
+                (self.COMPLETED, filename, digest, time.time(), job_id)
+            )
+
+    def mark_failed(self, job_id: str, error: str):
+        """Marks a job as failed, keeping the error message for later inspection."""
+        self._last_progress_write.pop(job_id, None)
+        self._update(job_id, status=self.FAILED, error=error)
+
+    def mark_paused(self, job_id: str, partials: List[str] | None = None):
+        """
+        Marks a job as paused. Its partial files are kept so it can be resumed, and their
+        paths are journaled so cancelling it still removes them after a restart.
+        """
+        self._last_progress_write.pop(job_id, None)
+        self._update(job_id, status=self.PAUSED, partials=json.dumps(partials or []))
+
+    def mark_cancelled(self, job_id: str):
+        """Marks a job as cancelled by the user."""
+        self._last_progress_write.pop(job_id, None)
+        self._update(job_id, status=self.CANCELLED)
+
+    def requeue_paused(self, job_id: str) -> bool:
+        """
+        Puts a paused job back in the queue. Returns False if the job isn't paused, so
+        two concurrent resume requests can't both start it.
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = NULL, updated_at = ? WHERE id = ? AND status = ?",
+                (self.PENDING, time.time(), job_id, self.PAUSED)
+            )
+        return cursor.rowcount == 1
+
+    # --- Leases, for jobs run by remote worker processes ---
+
+    def lease(self, worker_id: str, kinds: List[str], lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """
+        Hands the oldest queued job of one of `kinds` to a worker, for `lease_seconds`.
+        Running jobs that were never leased were orphaned by a restart and are handed
+        out too. Jobs whose lease ran out are first re-queued by expire_leases().
+
+        Returns:
+            dict: The leased job, or None if there is nothing to do.
+        """
+        if not kinds:
+            return None
+        now = time.time()
+        placeholders = ', '.join('?' for _ in kinds)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT id FROM jobs WHERE kind IN ({placeholders}) AND (status = ? OR "
+                f"(status = ? AND lease_expires IS NULL)) ORDER BY created_at LIMIT 1",
+                (*kinds, self.PENDING, self.RUNNING)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, worker_id = ?, lease_expires = ?, attempts = attempts + 1, "
+                "updated_at = ? WHERE id = ?",
+                (self.RUNNING, worker_id, now + lease_seconds, now, row['id'])
+            )
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone()
+        return self._row_to_dict(row)
+
+    def holds_lease(self, job_id: str, worker_id: str) -> bool:
+        """Returns True if the worker still holds an unexpired lease on the running job."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM jobs WHERE id = ? AND worker_id = ? AND status = ? AND lease_expires >= ?",
+                (job_id, worker_id, self.RUNNING, time.time())
+            ).fetchone()
+        return row is not None
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """
+        Extends a worker's lease on a job. Returns False if the lease was lost, e.g.
+        because it expired and the job went to another worker.
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = ? AND lease_expires >= ?",
+                (now + lease_seconds, now, job_id, worker_id, self.RUNNING, now)
+            )
+        return cursor.rowcount == 1
+
+    def expire_leases(self) -> List[str]:
+        """Puts running jobs whose lease ran out back in the queue. Returns their IDs."""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = ? AND lease_expires < ?", (self.RUNNING, now)
+            ).fetchall()
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, lease_expires = NULL, updated_at = ? WHERE status = ? AND lease_expires < ?",
+                (self.PENDING, now, self.RUNNING, now)
+            )
+        return [row['id'] for row in rows]
+
+    def stale_scratch(self, worker_id: str, job_ids: List[str]) -> List[str]:
+        """
+        Of the paused jobs a worker keeps scratch files for, returns those it can delete: jobs
+        that ended, and jobs that were resumed on another worker. IDs this journal doesn't
+        know are never returned.
+        """
+        if not job_ids:
+            return []
+        placeholders = ', '.join('?' for _ in job_ids)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, status, worker_id FROM jobs WHERE id IN ({placeholders})", list(job_ids)
+            ).fetchall()
+        stale = {row['id'] for row in rows
+                 if row['status'] in (self.COMPLETED, self.FAILED, self.CANCELLED)
+                 or (row['status'] == self.RUNNING and row['worker_id'] != worker_id)}
+        return [job_id for job_id in job_ids if job_id in stale]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Returns a single job, or None if it doesn't exist."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row)
+
+    def list_jobs(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Returns the most recently submitted jobs, newest first."""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        """Returns the jobs that were queued or running when the app last stopped, oldest first."""
+        placeholders = ', '.join('?' for _ in self.UNFINISHED)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM jobs WHERE status IN ({placeholders}) ORDER BY created_at", self.UNFINISHED
+            ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
@@ -0,0 +1,258 @@
+# app/Download/media_cache.py
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Set
+
+# --- Basic Configuration ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Extensions worth handing to ffprobe; anything else (documents, archives) is listed without media info.
+MEDIA_EXTENSIONS = {'.mp4', '.mkv', '.webm', '.mov', '.avi', '.flv', '.m4v', '.ts',
+                    '.mp3', '.m4a', '.aac', '.opus', '.ogg', '.flac', '.wav'}
+# Seconds a single ffprobe/ffmpeg run may take before the file is given up on
+PROBE_TIMEOUT = 60
+
+
+def _find_tool(name: str) -> str | None:
+    """Finds an FFmpeg tool on PATH or in the project's bundled 'ffmpeg' folder."""
+    if path := shutil.which(name):
+        return path
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.abspath(os.path.join(current_dir, '..', '..'))
+    local_path = os.path.join(project_root, 'ffmpeg', f'{name}.exe' if os.name == 'nt' else name)
+    return local_path if os.path.isfile(local_path) else None
+
+
+class MediaProbeCache:
+    """
+    Media details (duration, resolution, codecs) and a thumbnail for each downloaded file,
+    so the downloads list can show them without running ffprobe on the request path.
+
+    Probes run in a small background pool; until one finishes the file is simply listed
+    without media details. Results are keyed by the file's path, mtime and size, so a
+    file that is replaced or modified is probed again and stale entries age out.
+
+    The cache lives on disk (an index plus one JPEG per video) and is kept under a byte
+    budget by evicting the least recently listed entries.
+    """
+
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, cache_dir, max_bytes: int = 256 * 1024 * 1024, max_workers: int = 2,
+                 thumbnail_width: int = 320):
+        """
+        Initializes the MediaProbeCache.
+
+        Args:
+            cache_dir (str): The folder the index and thumbnails are kept in.
+            max_bytes (int): Disk budget for the cache; least recently used entries go first.
+            max_workers (int): How many files are probed at the same time.
+            thumbnail_width (int): Width thumbnails are scaled to, in pixels.
+        """
+        self.cache_dir = str(cache_dir)
+        self.max_bytes = max_bytes
+        self.thumbnail_width = thumbnail_width
+        self.ffprobe = _find_tool('ffprobe')
+        self.ffmpeg = _find_tool('ffmpeg')
+        self._lock = threading.Lock()
+        # Serializes index writes, which share one temp file; held without blocking lookups.
+        self._save_lock = threading.Lock()
+        self._entries: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._pending: Set[str] = set()
+        self._dirty = False
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='media-probe')
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load()
+        if not self.ffprobe:
+            logger.warning("ffprobe not found. Downloads will be listed without media details.")
+
+    # --- Keys and the on-disk index ---
+
+    @staticmethod
+    def key(path: str, stats: os.stat_result) -> str:
+        """The cache key of a file: changes whenever the file is moved, rewritten or modified."""
+        raw = f"{os.path.abspath(path)}\0{stats.st_mtime_ns}\0{stats.st_size}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:24]
+
+    def _load(self):
+        """Reads the index, dropping entries whose thumbnail has gone missing."""
+        try:
+            with open(os.path.join(self.cache_dir, self.INDEX_FILE), 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Media cache index is unreadable, starting empty: {e}")
+            return
+        # The index is stored in LRU order, oldest first.
+        for key, entry in entries:
+            if entry.get('thumbnail') and not os.path.exists(self.thumbnail_path(key) or ''):
+                continue
+            self._entries[key] = entry
+
+    def _save(self):
+        """
+        Writes the index atomically, if it changed. Probe threads save concurrently, so each
+        save takes its snapshot and writes it under one lock, and the newest snapshot lands last.
+        """
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = list(self._entries.items())
+                self._dirty = False
+            index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+            try:
+                with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(index_path + '.tmp', index_path)
+            except OSError as e:
+                logger.warning(f"Could not save the media cache index: {e}")
+
+    def thumbnail_path(self, key: str) -> str | None:
+        """The thumbnail file for a cache key, or None if the key isn't a valid cache key."""
+        if len(key) != 24 or any(c not in '0123456789abcdef' for c in key):
+            return None
+        return os.path.join(self.cache_dir, f"{key}.jpg")
+
+    # --- Lookups (request path) ---
+
+    def lookup(self, path: str, stats: os.stat_result | None = None) -> Dict[str, Any] | None:
+        """
+        Returns the cached media details of a file, or None if it hasn't been probed (yet).
+        Never probes; call schedule() for that. A hit marks the entry as recently used,
+        which save_soon() persists.
+        """
+        stats = stats or os.stat(path)
+        key = self.key(path, stats)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self._dirty = True
+        if entry.get('media') is None:
+            return None
+        return {**entry['media'], 'thumbnail': key if entry.get('thumbnail') else None}
+
+    def schedule(self, path: str, stats: os.stat_result | None = None):
+        """Queues a file for probing in the background, unless it is cached, queued or not media."""
+        if not self.ffprobe or os.path.splitext(path)[1].lower() not in MEDIA_EXTENSIONS:
+            return
+        try:
+            stats = stats or os.stat(path)
+        except OSError:
+            return
+        key = self.key(path, stats)
+        with self._lock:
+            if key in self._entries or key in self._pending:
+                return
+            self._pending.add(key)
+        self._executor.submit(self._probe, path, key)
+
+    def save_soon(self):
+        """Saves the index in the background if it changed, e.g. after lookups reordered it."""
+        with self._lock:
+            if not self._dirty:
+                return
+        self._executor.submit(self._save)
+
+    # --- Probing (background) ---
+
+    def _probe(self, path: str, key: str):
+        try:
+            media = self._run_ffprobe(path)
+            thumbnail = None
+            if media and media.get('width') and self.ffmpeg:
+                thumbnail = self._extract_thumbnail(path, key, media.get('duration'))
+            size = os.path.getsize(thumbnail) if thumbnail else 0
+            with self._lock:
+                # Files ffprobe can't read are remembered too, so they aren't probed on every listing.
+                self._entries[key] = {'media': media, 'thumbnail': bool(thumbnail), 'bytes': size + 512}
+                self._dirty = True
+            self._evict()
+        except Exception as e:
+            logger.error(f"Media probe of {path} failed: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+            self._save()
+
+    def _run_ffprobe(self, path: str) -> Dict[str, Any] | None:
+        """Reads a file's container and stream details. Returns None for files that aren't media."""
+        try:
+            completed = subprocess.run(
+                [self.ffprobe, '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', path],
+                capture_output=True, timeout=PROBE_TIMEOUT, check=True)
+            probe = json.loads(completed.stdout or b'{}')
+        except (subprocess.SubprocessError, OSError, ValueError) as e:
+            logger.info(f"ffprobe could not read {os.path.basename(path)}: {e}")
+            return None
+
+        streams = probe.get('streams') or []
+        video = next((s for s in streams if s.get('codec_type') == 'video'
+                      and not (s.get('disposition') or {}).get('attached_pic')), None)
+        audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+        if not video and not audio:
+            return None
+        container = probe.get('format') or {}
+        duration = container.get('duration') or (video or audio).get('duration')
+        bit_rate = container.get('bit_rate')
+        return {
+            'duration': round(float(duration), 2) if duration else None,
+            'width': video.get('width') if video else None,
+            'height': video.get('height') if video else None,
+            'video_codec': video.get('codec_name') if video else None,
+            'audio_codec': audio.get('codec_name') if audio else None,
+            'bit_rate': int(bit_rate) if bit_rate else None,
+        }
+
+    def _extract_thumbnail(self, path: str, key: str, duration: float | None) -> str | None:
+        """Grabs one frame a little way in (past intros and fades) as a small JPEG."""
+        target = self.thumbnail_path(key)
+        offset = min(duration * 0.1, 10) if duration else 0
+        try:
+            subprocess.run(
+                [self.ffmpeg, '-v', 'error', '-ss', f"{offset:.2f}", '-i', path, '-frames:v', '1',
+                 '-vf', f"scale={self.thumbnail_width}:-2", '-q:v', '5', '-f', 'image2', '-y', target + '.tmp'],
+                capture_output=True, timeout=PROBE_TIMEOUT, check=True)
+            os.replace(target + '.tmp', target)
+            return target
+        except (subprocess.SubprocessError, OSError) as e:
+            logger.info(f"No thumbnail for {os.path.basename(path)}: {e}")
+            try:
+                os.remove(target + '.tmp')
+            except OSError:
+                pass
+            return None
+
+    def _evict(self):
+        """Drops least recently used entries until the cache fits its disk budget."""
+        with self._lock:
+            total = sum(entry.get('bytes', 0) for entry in self._entries.values())
+            evicted = []
+            while total > self.max_bytes and len(self._entries) > 1:
+                key, entry = self._entries.popitem(last=False)
+                total -= entry.get('bytes', 0)
+                if entry.get('thumbnail'):
+                    evicted.append(key)
+                self._dirty = True
+        for key in evicted:
+            try:
+                os.remove(self.thumbnail_path(key))
+            except OSError:
+                pass
+
+    def close(self):
+        """Stops the probe pool and saves the index."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._save()
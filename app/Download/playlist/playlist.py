@@ -1,26 +1,43 @@
 # app/Download/playlist/playlist.py
 
 import logging
-import yt_dlp
+from datetime import datetime, timezone
 from typing import Dict, Any
+from yt_dlp.utils import sanitize_filename
+
+from app.Download.control import DownloadInterrupted
+from app.Download.engine import YtDlpEngine
 
 # --- Basic Configuration ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
-class PlaylistDownloader:
+class PlaylistDownloader(YtDlpEngine):
     """
     Orchestrates playlist downloads using yt-dlp's native playlist handling
     for maximum efficiency. Supports all playlist types, including mixes.
     """
 
-    def __init__(self, socketio=None, video_downloader=None, audio_downloader=None):
+    # URL parts of feeds that list the newest uploads first (channels and their tabs).
+    NEWEST_FIRST_MARKERS = ('/@', '/channel/', '/c/', '/user/', '/videos', '/streams', '/shorts')
+    # A sync of a newest-first feed stops after this many already downloaded entries in a row.
+    KNOWN_STREAK_TO_STOP = 5
+    # An entry that failed is retried by this many syncs in total, then left alone.
+    MAX_ITEM_ATTEMPTS = 3
+    PROGRESS_LABEL = "Downloading item..."
+
+    def __init__(self, socketio=None, video_downloader=None, audio_downloader=None, job_store=None,
+                 sync_state=None, job_control=None, ydl_pool=None, disk_admission=None):
         """
-        Initializes the PlaylistDownloader.
+        Initializes the PlaylistDownloader. It shares the video downloader's YoutubeDL pool
+        unless given its own. With `disk_admission`, space is reserved for each item in turn.
         """
-        self.socketio = socketio
-        self.output_path = video_downloader.output_path if video_downloader else './downloads'
+        super().__init__(socketio, video_downloader.output_path if video_downloader else './downloads',
+                         job_store=job_store, job_control=job_control, disk_admission=disk_admission,
+                         ydl_pool=ydl_pool or (video_downloader.ydl_pool if video_downloader else None))
+        # Optional PlaylistSyncState that remembers what incremental syncs have downloaded
+        self.sync_state = sync_state
 
     def get_playlist_info(self, url: str) -> Dict[str, Any]:
         """
@@ -36,7 +53,7 @@ class PlaylistDownloader:
             'yes_playlist': True,  # This flag remains essential.
         }
         try:
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            with self.ydl_pool.acquire(ydl_opts) as ydl:
                 info = ydl.extract_info(url, download=False)
 
                 if info.get('_type') != 'playlist':
@@ -73,66 +90,199 @@ class PlaylistDownloader:
 
             return {'status': 'error', 'message': error_msg}
 
-    def download_playlist(self, url: str, num_videos: int, quality: str = '1080p', format: str = 'mp4'):
-        # This function does not need any changes.
-
-        class SocketIOLogger:
-            def __init__(self, socketio_instance): self.socketio = socketio_instance
-
-            def debug(self, msg):
-                if not msg.startswith('[debug]'): self.socketio.emit('terminal_output', {'line': msg})
-
-            def warning(self, msg): self.socketio.emit('terminal_output', {'line': f'\033[93m{msg}\033[0m'})
-
-            def error(self, msg): self.socketio.emit('terminal_output', {'line': f'\033[91m{msg}\033[0m'})
-
-        def progress_hook(d: Dict[str, Any]):
-            if d['status'] == 'downloading':
-                progress_line = (
-                    f"\r\033[K"
-                    f"\033[36mDownloading item...\033[0m "
-                    f"{d.get('_percent_str', ''):>8} of {d.get('_total_bytes_str', ''):<10} "
-                    f"at {d.get('_speed_str', ''):<12} ETA {d.get('_eta_str', '')}"
-                )
-                self.socketio.emit('terminal_output', {'line': progress_line})
+    def _format_opts(self, quality: str, format: str) -> Dict[str, Any] | None:
+        """Returns the yt-dlp format options for an output format, or None if it isn't supported."""
+        if format == 'mp4':
+            numeric_quality = quality.replace('p', '')
+            return {
+                'format': f"bestvideo[height<={numeric_quality}][ext=mp4]+bestaudio[ext=m4a]/best[height<={numeric_quality}]",
+                'merge_output_format': 'mp4',
+            }
+        elif format in ['mp3', 'm4a']:
+            return {
+                'format': 'bestaudio/best',
+                'postprocessors': [{
+                    'key': 'FFmpegExtractAudio',
+                    'preferredcodec': format,
+                    'preferredquality': '192',
+                }],
+            }
+        return None
 
+    def download_playlist(self, url: str, num_videos: int, quality: str = '1080p', format: str = 'mp4',
+                          job_id: str | None = None):
         playlist_folder_path = f"{self.output_path}/%(playlist_title)s"
         ydl_opts = {
             'outtmpl': f"{playlist_folder_path}/%(playlist_index)s - %(title)s.%(ext)s",
             'playlistend': num_videos,
-            'progress_hooks': [progress_hook],
-            'logger': SocketIOLogger(self.socketio),
             'ignoreerrors': True,
             'yes_playlist': True,
+            **self._job_opts(job_id),
         }
 
-        if format == 'mp4':
-            numeric_quality = quality.replace('p', '')
-            ydl_opts[
-                'format'] = f"bestvideo[height<={numeric_quality}][ext=mp4]+bestaudio[ext=m4a]/best[height<={numeric_quality}]"
-            ydl_opts['merge_output_format'] = 'mp4'
-        elif format in ['mp3', 'm4a']:
-            ydl_opts['format'] = 'bestaudio/best'
-            ydl_opts['postprocessors'] = [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': format,
-                'preferredquality': '192',
-            }]
-        else:
-            self.socketio.emit('download_error', {'error': f"Unsupported format '{format}'"})
-            return
+        format_opts = self._format_opts(quality, format)
+        if format_opts is None:
+            self.socketio.emit('download_error', {'job_id': job_id, 'error': f"Unsupported format '{format}'"})
+            return {'status': 'error', 'message': f"Unsupported format '{format}'"}
+        ydl_opts.update(format_opts)
 
         try:
-            self.socketio.emit('terminal_output', {'line': f"\n\03_3[1mStarting playlist download...\033[0m"})
+            self.socketio.emit('terminal_output', {'job_id': job_id, 'line': f"\n\03_3[1mStarting playlist download...\033[0m"})
             self.socketio.emit('terminal_output', {
-                'line': f"\033[1mFormat: {format.upper()}, Quality: {quality}, Items: {num_videos}\033[0m\n"})
+                'job_id': job_id, 'line': f"\033[1mFormat: {format.upper()}, Quality: {quality}, Items: {num_videos}\033[0m\n"})
 
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            with self.ydl_pool.acquire(ydl_opts) as ydl, \
+                    self._reserve_per_item(ydl, job_id, converts=format != 'mp4'):
                 ydl.download([url])
 
-            self.socketio.emit('terminal_output', {'line': f"\n\033[32;1mPlaylist download process finished!\033[0m"})
-            self.socketio.emit('download_complete', {})
+            self.socketio.emit('terminal_output', {'job_id': job_id, 'line': f"\n\033[32;1mPlaylist download process finished!\033[0m"})
+            self.socketio.emit('download_complete', {'job_id': job_id})
+            return {'status': 'success'}
+        except DownloadInterrupted as e:
+            return self._interrupted(job_id, e)
         except Exception as e:
             logger.error(f"A critical error occurred during playlist download: {e}", exc_info=True)
-            self.socketio.emit('terminal_output', {'line': f"\n\033[31mFATAL ERROR:\033[0m {str(e)}"})
-            self.socketio.emit('download_error', {'error': str(e)})
\ No newline at end of file
+            return self._failed(job_id, str(e))
+
+    def _entry_upload_date(self, entry: Dict[str, Any]) -> str | None:
+        """Returns an entry's upload date as YYYYMMDD, if the flat listing included one."""
+        if entry.get('upload_date'):
+            return entry['upload_date']
+        timestamp = entry.get('timestamp') or entry.get('release_timestamp')
+        return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y%m%d') if timestamp else None
+
+    def _find_new_entries(self, ydl, url: str, known: set, newest_upload_date: str | None, retry: set = frozenset()):
+        """
+        Lazily walks a flat listing of the playlist and collects entries that haven't been
+        downloaded yet. Channel and upload feeds list the newest videos first, so for those
+        the walk stops after a run of already known IDs, or at the first entry older than
+        the newest upload we have. Other playlists are walked to the end, which with a flat
+        listing costs about one request per page of entries. The walk never stops before it
+        has passed every ID in `retry`, the entries that failed in an earlier sync.
+
+        Returns:
+            tuple: (playlist info, new entries in listing order, number of entries scanned,
+                    IDs from `retry` that are no longer listed)
+        """
+        info = ydl.extract_info(url, download=False, process=False)
+        if info.get('_type') not in ('playlist', 'multi_video'):
+            raise ValueError("The provided URL is not a valid playlist or channel.")
+
+        newest_first = any(marker in url for marker in self.NEWEST_FIRST_MARKERS)
+        new_entries, scanned, known_streak, previous_date = [], 0, 0, None
+        unseen = set(retry)
+        for entry in info.get('entries') or []:
+            if not entry or not entry.get('id'):
+                continue
+            scanned += 1
+            unseen.discard(entry['id'])
+            upload_date = self._entry_upload_date(entry)
+            # Dates going backwards in the listing also tell us it's newest-first.
+            if upload_date and previous_date and upload_date < previous_date:
+                newest_first = True
+            previous_date = upload_date or previous_date
+
+            if entry['id'] in known:
+                known_streak += 1
+                if newest_first and known_streak >= self.KNOWN_STREAK_TO_STOP and not unseen:
+                    break
+                continue
+            known_streak = 0
+            if newest_first and upload_date and newest_upload_date and upload_date < newest_upload_date \
+                    and entry['id'] not in retry:
+                if not unseen:
+                    break
+                continue
+            new_entries.append(entry)
+        # Only a walk that reached the end can leave IDs unseen.
+        return info, new_entries, scanned, unseen
+
+    def sync_playlist(self, url: str, quality: str = '1080p', format: str = 'mp4', max_items: int | None = None,
+                      job_id: str | None = None):
+        """
+        Incremental sync for mirrored playlists and channels: enumerates only the entries
+        that are new since the last sync and downloads just that delta. Designed to be run
+        in a background task, and cheap enough to be scheduled every few minutes.
+        """
+        if self.sync_state is None:
+            return {'status': 'error', 'message': 'Playlist sync is not configured.'}
+
+        format_opts = self._format_opts(quality, format)
+        if format_opts is None:
+            self.socketio.emit('download_error', {'job_id': job_id, 'error': f"Unsupported format '{format}'"})
+            return {'status': 'error', 'message': f"Unsupported format '{format}'"}
+
+        job_opts = self._job_opts(job_id)
+        state = self.sync_state.get(url) or {}
+        try:
+            self.socketio.emit('terminal_output', {'job_id': job_id, 'line': f"\n\033[1mSyncing playlist:\033[0m {url}"})
+
+            list_opts = {
+                'quiet': True,
+                'logger': job_opts['logger'],
+                'extract_flat': 'in_playlist',
+                'lazy_playlist': True,
+                'yes_playlist': True,
+            }
+            failures = self.sync_state.failed_items(url)
+            retry = {video_id for video_id, count in failures.items() if count < self.MAX_ITEM_ATTEMPTS}
+            # Entries that failed too often count as known, so they are neither retried nor waited for.
+            known = self.sync_state.known_ids(url) | (failures.keys() - retry)
+            with self.ydl_pool.acquire(list_opts) as ydl:
+                info, new_entries, scanned, gone = self._find_new_entries(
+                    ydl, url, known, state.get('newest_upload_date'), retry)
+            if gone:
+                self.sync_state.forget(url, gone)
+            if max_items:
+                new_entries = new_entries[:max_items]
+
+            title = info.get('title') or state.get('title') or info.get('id') or 'Playlist'
+            self.socketio.emit('terminal_output', {
+                'job_id': job_id,
+                'line': f"\033[1mScanned {scanned} entries, {len(new_entries)} new.\033[0m\n"})
+
+            # Download oldest first, so an interrupted sync leaves no gaps behind the newest item.
+            if any(self._entry_upload_date(e) for e in new_entries):
+                new_entries.sort(key=lambda e: self._entry_upload_date(e) or '')
+
+            folder = sanitize_filename(title).replace('%', '%%')
+            ydl_opts = {
+                'outtmpl': f"{self.output_path}/{folder}/%(title)s [%(id)s].%(ext)s",
+                'noplaylist': True,
+                **format_opts,
+                **job_opts,
+            }
+            failed, newest_upload_date = 0, None
+            with self.ydl_pool.acquire(ydl_opts) as ydl, \
+                    self._reserve_per_item(ydl, job_id, converts=format != 'mp4'):
+                for entry in new_entries:
+                    try:
+                        # Entries are either references to resolve or full video dicts; yt-dlp handles both.
+                        ydl.add_extra_info(entry, {
+                            key: info.get(key) for key in ('extractor', 'extractor_key', 'webpage_url',
+                                                           'webpage_url_basename', 'webpage_url_domain')
+                        })
+                        item = ydl.process_ie_result(entry, download=True)
+                        upload_date = (item or {}).get('upload_date') or self._entry_upload_date(entry)
+                        self.sync_state.mark_downloaded(url, entry['id'], upload_date)
+                        newest_upload_date = max(filter(None, [newest_upload_date, upload_date]), default=None)
+                    except DownloadInterrupted:
+                        # Items downloaded so far are recorded, so the next sync carries on from here.
+                        raise
+                    except Exception as e:
+                        failed += 1
+                        # Remembered, so a later sync retries it even though newer items moved the cutoff past it.
+                        self.sync_state.mark_failed(url, entry['id'], self._entry_upload_date(entry))
+                        logger.warning(f"Sync of {url}: item {entry['id']} failed: {e}")
+
+            self.sync_state.finish_sync(url, info.get('id'), title, newest_upload_date)
+            self.socketio.emit('terminal_output', {
+                'job_id': job_id,
+                'line': f"\n\033[32;1mSync finished:\033[0m {len(new_entries) - failed} downloaded, {failed} failed"})
+            self.socketio.emit('download_complete', {'job_id': job_id})
+            return {'status': 'success', 'new_items': len(new_entries) - failed, 'failed': failed}
+        except DownloadInterrupted as e:
+            return self._interrupted(job_id, e)
+        except Exception as e:
+            logger.error(f"Playlist sync failed for {url}: {e}", exc_info=False)
+            return self._failed(job_id, str(e))
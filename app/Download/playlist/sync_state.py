@@ -0,0 +1,160 @@
+# app/Download/playlist/sync_state.py
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Set
+
+# --- Basic Configuration ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class PlaylistSyncState:
+    """
+    Remembers, per mirrored playlist or channel, which entries have already been seen
+    and downloaded, so a re-sync only has to enumerate and fetch what is new.
+    Backed by SQLite in WAL mode, like the job journal.
+    """
+
+    def __init__(self, db_path):
+        """
+        Initializes the PlaylistSyncState.
+
+        Args:
+            db_path (str): The path to the SQLite database file.
+        """
+        self.db_path = str(db_path)
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS playlists (
+                url TEXT PRIMARY KEY,
+                playlist_id TEXT,
+                title TEXT,
+                quality TEXT NOT NULL,
+                format TEXT NOT NULL,
+                interval_minutes INTEGER NOT NULL DEFAULT 0,
+                newest_upload_date TEXT,
+                last_synced_at REAL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS playlist_items (
+                url TEXT NOT NULL,
+                video_id TEXT NOT NULL,
+                upload_date TEXT,
+                downloaded INTEGER NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (url, video_id)
+            )
+        """)
+        self._migrate()
+
+    def _migrate(self):
+        """Adds columns introduced after the database was first created."""
+        columns = {row['name'] for row in self._conn.execute('PRAGMA table_info(playlist_items)')}
+        if 'failures' not in columns:
+            self._conn.execute('ALTER TABLE playlist_items ADD COLUMN failures INTEGER NOT NULL DEFAULT 0')
+
+    def register(self, url: str, quality: str, format: str, interval_minutes: int = 0):
+        """Adds a playlist to the mirror list, or updates its options."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO playlists (url, quality, format, interval_minutes) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET quality = excluded.quality, format = excluded.format, "
+                "interval_minutes = excluded.interval_minutes",
+                (url, quality, format, interval_minutes)
+            )
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """Returns the stored state of a playlist, or None if it was never synced."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM playlists WHERE url = ?", (url,)).fetchone()
+        return dict(row) if row else None
+
+    def list_playlists(self) -> List[Dict[str, Any]]:
+        """Returns every mirrored playlist with how many of its items were downloaded."""
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT p.*, COUNT(i.video_id) AS items_seen, COALESCE(SUM(i.downloaded), 0) AS items_downloaded
+                FROM playlists p LEFT JOIN playlist_items i ON i.url = p.url
+                GROUP BY p.url ORDER BY p.title
+            """).fetchall()
+        return [dict(row) for row in rows]
+
+    def due(self) -> List[Dict[str, Any]]:
+        """Returns the scheduled playlists whose next re-sync is due."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM playlists WHERE interval_minutes > 0 "
+                "AND (last_synced_at IS NULL OR last_synced_at + interval_minutes * 60 <= ?)",
+                (time.time(),)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def known_ids(self, url: str) -> Set[str]:
+        """IDs of the entries that a previous sync already saw and downloaded."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT video_id FROM playlist_items WHERE url = ? AND downloaded = 1", (url,)
+            ).fetchall()
+        return {row['video_id'] for row in rows}
+
+    def mark_downloaded(self, url: str, video_id: str, upload_date: str | None = None):
+        """Records that an entry has been downloaded."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO playlist_items (url, video_id, upload_date, downloaded) VALUES (?, ?, ?, 1) "
+                "ON CONFLICT(url, video_id) DO UPDATE SET downloaded = 1, "
+                "upload_date = COALESCE(excluded.upload_date, upload_date)",
+                (url, video_id, upload_date)
+            )
+
+    def mark_failed(self, url: str, video_id: str, upload_date: str | None = None):
+        """Records a failed attempt at an entry, so later syncs know to retry it."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO playlist_items (url, video_id, upload_date, failures) VALUES (?, ?, ?, 1) "
+                "ON CONFLICT(url, video_id) DO UPDATE SET failures = failures + 1, "
+                "upload_date = COALESCE(excluded.upload_date, upload_date)",
+                (url, video_id, upload_date)
+            )
+
+    def failed_items(self, url: str) -> Dict[str, int]:
+        """Entries that failed and were never downloaded, with their number of failed attempts."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT video_id, failures FROM playlist_items WHERE url = ? AND downloaded = 0 AND failures > 0",
+                (url,)
+            ).fetchall()
+        return {row['video_id']: row['failures'] for row in rows}
+
+    def forget(self, url: str, video_ids):
+        """Drops failed entries that are no longer listed, so syncs stop looking for them."""
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM playlist_items WHERE url = ? AND video_id = ? AND downloaded = 0",
+                [(url, video_id) for video_id in video_ids]
+            )
+
+    def touch(self, url: str):
+        """Marks a sync as started now, so the scheduler doesn't queue it again before its interval."""
+        with self._lock:
+            self._conn.execute("UPDATE playlists SET last_synced_at = ? WHERE url = ?", (time.time(), url))
+
+    def finish_sync(self, url: str, playlist_id: str | None, title: str | None, newest_upload_date: str | None):
+        """Stores the playlist's metadata and the time of this sync."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE playlists SET playlist_id = COALESCE(?, playlist_id), title = COALESCE(?, title), "
+                "newest_upload_date = NULLIF(MAX(COALESCE(newest_upload_date, ''), COALESCE(?, '')), ''), "
+                "last_synced_at = ? WHERE url = ?",
+                (playlist_id, title, newest_upload_date, time.time(), url)
+            )
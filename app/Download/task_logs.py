@@ -0,0 +1,284 @@
+# app/Download/task_logs.py
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque, OrderedDict
+from itertools import islice
+from typing import Dict, Any
+
+# --- Basic Configuration ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Seconds between sweeps for spill files older than TaskLogStore.max_age
+PRUNE_INTERVAL = 3600
+
+
+class _TaskLog:
+    """The ring buffer of one job. `start` is the absolute offset of the oldest line kept in memory."""
+
+    def __init__(self, capacity: int):
+        self.lines = deque(maxlen=capacity)
+        self.start = 0
+        self.last_is_progress = False
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.lines)
+
+
+class TaskLogStore:
+    """
+    Keeps the terminal output of each job in a bounded in-memory ring buffer, so a
+    window that connects after a job started can replay what it missed, and clients
+    can fetch just the jobs they display instead of every downloader's output.
+
+    Every line gets an absolute offset within its job, assigned in memory. Progress
+    lines (redrawn in place with '\\r') replace each other rather than filling the buffer.
+
+    Optionally every line is also spilled to disk, one JSON string per line. A writer
+    thread does the file I/O, so append() never waits for the disk on a download thread.
+    A progress line is spilled as soon as it appears, which keeps the offsets on disk the
+    same as in memory even if the app stops mid-download, and rewritten with its last
+    text once a normal line follows it. Spill files no job has written to for `max_age`
+    seconds are deleted by the same thread.
+    """
+
+    def __init__(self, capacity: int = 2000, max_jobs: int = 200, spill_dir=None, max_age: float = 14 * 24 * 3600):
+        """
+        Initializes the TaskLogStore.
+
+        Args:
+            capacity (int): Lines kept in memory per job.
+            max_jobs (int): Jobs kept in memory; the least recently written ones are forgotten first.
+            spill_dir (str): Optional folder where every job's full log is also written.
+            max_age (float): Seconds a spill file is kept after its job last wrote to it.
+        """
+        self.capacity = capacity
+        self.max_jobs = max_jobs
+        self.spill_dir = str(spill_dir) if spill_dir else None
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._logs: 'OrderedDict[str, _TaskLog]' = OrderedDict()
+        # Where the logs of jobs forgotten from memory continue
+        self._ends: Dict[str, int] = {}
+        # Spill writes waiting for the writer thread: (job ID, line, replaces the job's last line)
+        self._writes = deque()
+        self._writing = False
+        self._write_condition = threading.Condition()
+        # Writer thread only: byte position of the last line in each job's file
+        self._last_line_pos: 'OrderedDict[str, int]' = OrderedDict()
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            threading.Thread(target=self._run_writer, name='task-log-writer', daemon=True).start()
+
+    # --- Offsets (in memory) ---
+
+    def _find(self, job_id: str) -> _TaskLog | None:
+        """Returns a job's log if it is known without reading its spill file. Call with the lock held."""
+        log = self._logs.get(job_id)
+        if log is None and (job_id in self._ends or not self.spill_dir):
+            log = self._create(job_id, self._ends.pop(job_id, 0))
+        if log is not None:
+            self._logs.move_to_end(job_id)
+        return log
+
+    def _create(self, job_id: str, start: int) -> _TaskLog:
+        """Adds a job's log, forgetting the least recently written one if there are too many. Call with the lock held."""
+        log = self._logs[job_id] = _TaskLog(self.capacity)
+        log.start = start
+        while len(self._logs) > self.max_jobs:
+            old_id, old = self._logs.popitem(last=False)
+            self._ends[old_id] = old.end
+            if old.last_is_progress:
+                self._spill(old_id, old.lines[-1], replace=True)
+        return log
+
+    def prepare(self, job_id: str):
+        """
+        Looks up where a job's log continues. Called before a job runs, so its first line
+        doesn't have to count the lines of an earlier run in the spill file.
+        """
+        with self._lock:
+            if self._find(job_id) is not None:
+                return
+        start = self._count_spilled(job_id)
+        with self._lock:
+            if self._find(job_id) is None:
+                self._create(job_id, start)
+
+    def append(self, job_id: str, line: str) -> int:
+        """Adds a line to a job's log and returns its offset."""
+        with self._lock:
+            if (log := self._find(job_id)) is not None:
+                return self._add_line(job_id, log, line)
+        # A job not seen since startup continues after the lines of its earlier runs (see prepare()).
+        start = self._count_spilled(job_id)
+        with self._lock:
+            return self._add_line(job_id, self._find(job_id) or self._create(job_id, start), line)
+
+    def _add_line(self, job_id: str, log: _TaskLog, line: str) -> int:
+        is_progress = line.startswith('\r')
+        if is_progress and log.last_is_progress:
+            # Redraw the current progress line in place, keeping its offset.
+            log.lines[-1] = line
+            return log.end - 1
+
+        if log.last_is_progress:
+            # The progress line is final now, so its copy on disk gets its last text.
+            self._spill(job_id, log.lines[-1], replace=True)
+        if len(log.lines) == log.lines.maxlen:
+            log.start += 1
+        log.lines.append(line)
+        log.last_is_progress = is_progress
+        self._spill(job_id, line)
+        return log.end - 1
+
+    # --- Spill files (writer thread) ---
+
+    def _spill_path(self, job_id: str) -> str:
+        return os.path.join(self.spill_dir, f"{job_id}.log")
+
+    def _spill(self, job_id: str, line: str, replace: bool = False):
+        """Hands a line to the writer thread."""
+        if not self.spill_dir:
+            return
+        with self._write_condition:
+            self._writes.append((job_id, line, replace))
+            self._write_condition.notify_all()
+
+    def _run_writer(self):
+        next_prune = 0.0
+        while True:
+            if time.monotonic() >= next_prune:
+                self._prune()
+                next_prune = time.monotonic() + PRUNE_INTERVAL
+            with self._write_condition:
+                while not self._writes and time.monotonic() < next_prune:
+                    self._write_condition.wait(next_prune - time.monotonic())
+                if not self._writes:
+                    continue
+                batch, self._writes = self._writes, deque()
+                self._writing = True
+            try:
+                by_job: Dict[str, list] = {}
+                for job_id, line, replace in batch:
+                    by_job.setdefault(job_id, []).append((line, replace))
+                for job_id, writes in by_job.items():
+                    self._write_spill(job_id, writes)
+            finally:
+                with self._write_condition:
+                    self._writing = False
+                    self._write_condition.notify_all()
+
+    def _write_spill(self, job_id: str, writes: list):
+        """Appends lines to a job's log file, or rewrites its last line in place."""
+        path = self._spill_path(job_id)
+        try:
+            with open(path, 'r+b' if os.path.exists(path) else 'w+b') as f:
+                f.seek(0, os.SEEK_END)
+                for line, replace in writes:
+                    data = (json.dumps(line) + '\n').encode('utf-8')
+                    if replace:
+                        if job_id not in self._last_line_pos:
+                            continue  # Written by an earlier run; its progress line just stays as it was.
+                        f.seek(self._last_line_pos[job_id])
+                        f.write(data)
+                        f.truncate()
+                    else:
+                        self._last_line_pos[job_id] = f.tell()
+                        self._last_line_pos.move_to_end(job_id)
+                        f.write(data)
+        except OSError as e:
+            logger.warning(f"Could not spill {len(writes)} log lines of job {job_id}: {e}")
+        while len(self._last_line_pos) > self.max_jobs * 4:
+            self._last_line_pos.popitem(last=False)
+
+    def _prune(self):
+        """Deletes the spill files of jobs that haven't written a line for `max_age` seconds."""
+        cutoff = time.time() - self.max_age
+        try:
+            entries = [entry for entry in os.scandir(self.spill_dir) if entry.name.endswith('.log')]
+        except OSError as e:
+            logger.warning(f"Could not list the task logs in {self.spill_dir}: {e}")
+            return
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    self._last_line_pos.pop(entry.name[:-len('.log')], None)
+            except OSError as e:
+                logger.warning(f"Could not delete the old task log {entry.path}: {e}")
+
+    def flush(self):
+        """Waits until every line handed to the writer thread is on disk."""
+        with self._write_condition:
+            while self._writes or self._writing:
+                self._write_condition.wait()
+
+    def _count_spilled(self, job_id: str) -> int:
+        """The number of lines in a job's spill file, e.g. from before a restart."""
+        if not self.spill_dir:
+            return 0
+        try:
+            with open(self._spill_path(job_id), 'rb') as f:
+                return sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1024 * 1024), b''))
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            logger.warning(f"Could not read the log of job {job_id}: {e}")
+            return 0
+
+    def fetch(self, job_id: str, offset: int = 0, limit: int = 500) -> Dict[str, Any]:
+        """
+        Returns up to `limit` lines of a job's log starting at `offset`.
+
+        Returns:
+            dict: {'lines', 'offset' (of the first returned line), 'next_offset', 'truncated'}.
+                  'truncated' is True if lines before `offset` were lost from memory and disk.
+        """
+        offset = max(0, offset)
+        with self._lock:
+            log = self._logs.get(job_id)
+            # A job no longer in memory (e.g. after a restart) can only be served from its spill file.
+            start, lines = (log.start, list(log.lines)) if log else (float('inf'), [])
+
+        result = []
+        first = offset
+        if offset < start:
+            # Lines that left the ring must all come from disk to keep the offsets contiguous.
+            spilled = self._read_spill(job_id, offset, min(offset + limit, start), exact=log is not None)
+            if spilled is None:
+                first = start if log else offset
+            else:
+                result = spilled
+
+        if log and len(result) < limit:
+            skip = first + len(result) - start
+            result += lines[skip:skip + limit - len(result)]
+
+        return {
+            'lines': result,
+            'offset': first,
+            'next_offset': first + len(result),
+            'truncated': first > offset,
+        }
+
+    def _read_spill(self, job_id: str, begin: int, end: int, exact: bool = True) -> list | None:
+        """
+        Reads lines [begin, end) back from a job's spill file. Returns None if there is no
+        spill file, or if `exact` and the file doesn't hold every requested line.
+        """
+        if not self.spill_dir:
+            return None
+        self.flush()
+        if not os.path.exists(self._spill_path(job_id)):
+            return None
+        with open(self._spill_path(job_id), encoding='utf-8') as f:
+            rows = [json.loads(row) for row in islice(f, begin, end)]
+        if exact and len(rows) < end - begin:
+            return None
+        return rows
@@ -0,0 +1,384 @@
+# app/Download/worker.py
+
+import os
+import time
+import shutil
+import socket
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, List
+from urllib.parse import quote
+
+import requests
+
+from app.Download.video.video import YouTubeVideoDownloader
+from app.Download.uhd.uhd import YouTube4KDownloader
+from app.Download.audio.audio import YouTubeAudioDownloader
+from app.Download.playlist.playlist import PlaylistDownloader
+from app.Download.other_platforms.other_platforms import OtherPlatformsDownloader
+from app.Download.documents.documents import DocumentDownloader
+from app.Download.fragments import FragmentTuner
+from app.Download.engine import YoutubeDLPool
+from app.Download.admission import DiskAdmission
+from app.Download.control import JobControl, DownloadInterrupted
+
+# --- Basic Configuration ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Job kinds a worker can run on its own. Playlist syncs need the coordinator's sync state.
+WORKER_KINDS = ('video', 'audio', '4k', 'playlist', 'other', 'document')
+# Files a downloader leaves behind while it is still working on them; never handed over.
+PARTIAL_SUFFIXES = ('.part', '.ytdl', '.temp', '.ranges')
+# Subfolder of the output folder that holds one scratch folder per job. Nothing else in
+# the output folder is ever deleted.
+SCRATCH_DIR = '.lawran-jobs'
+
+
+class LeaseLostError(Exception):
+    """Raised when the coordinator no longer recognizes a worker's lease on a job."""
+
+
+class CoordinatorClient:
+    """The HTTP side of the worker protocol, talking to the coordinator's /api/worker endpoints."""
+
+    def __init__(self, base_url: str, worker_id: str, token: str | None = None, timeout: float = 30.0):
+        """
+        Initializes the CoordinatorClient.
+
+        Args:
+            base_url (str): The coordinator's address, e.g. 'http://192.168.1.10:5000'.
+            worker_id (str): A name for this worker that is unique among the coordinator's workers.
+            token (str): The coordinator's LAWRAN_WORKER_TOKEN, if it requires one.
+            timeout (float): Seconds to wait for the coordinator to answer a request.
+        """
+        self.base_url = base_url.rstrip('/')
+        self.worker_id = worker_id
+        self.timeout = timeout
+        self.session = requests.Session()
+        if token:
+            self.session.headers['X-Worker-Token'] = token
+
+    def _post(self, path: str, **payload) -> Dict[str, Any]:
+        r = self.session.post(f"{self.base_url}/api/worker/{path}", json={'worker_id': self.worker_id, **payload},
+                              timeout=self.timeout)
+        if r.status_code == 409:
+            raise LeaseLostError(r.json().get('message', 'Lease lost'))
+        r.raise_for_status()
+        return r.json()
+
+    def lease(self, kinds, kept=()) -> tuple[Dict[str, Any] | None, float, List[str]]:
+        """
+        Asks for a job, listing the paused jobs whose scratch folders this worker keeps.
+        Returns (job or None, lease duration in seconds, IDs of the kept folders to delete).
+        """
+        data = self._post('lease', kinds=list(kinds), kept=list(kept))
+        return data.get('job'), data['lease_seconds'], data.get('discard') or []
+
+    def heartbeat(self, job_id: str, downloaded: int | None, total: int | None) -> str | None:
+        """Extends the lease and reports progress. Returns a pending 'cancel'/'pause' request, if any."""
+        return self._post('heartbeat', job_id=job_id, downloaded=downloaded, total=total).get('action')
+
+    def send_events(self, job_id: str, events: List[Dict[str, Any]]):
+        self._post('events', job_id=job_id, events=events)
+
+    def upload(self, job_id: str, rel_path: str, path: str):
+        """Streams a finished file to the coordinator's downloads folder, under the same relative path."""
+        with open(path, 'rb') as f:
+            r = self.session.put(
+                f"{self.base_url}/api/worker/jobs/{job_id}/files/{quote(rel_path)}",
+                params={'worker_id': self.worker_id}, data=f, timeout=self.timeout
+            )
+        if r.status_code == 409:
+            raise LeaseLostError(r.json().get('message', 'Lease lost'))
+        r.raise_for_status()
+
+    def complete(self, job_id: str, result: Dict[str, Any], downloaded: int | None, total: int | None):
+        """Reports how a job ended, with its final progress (e.g. the offset a paused job stopped at)."""
+        self._post('complete', job_id=job_id, result=result, downloaded=downloaded, total=total)
+
+
+class RemoteEmitter:
+    """
+    Stands in for the SocketIOEmitter on a worker: downloader messages are queued and
+    a sender thread forwards them to the coordinator in batches, which then records
+    them in the job's log and relays them to the UI as if the job ran locally. Like
+    the local emitter, only the newest of consecutive progress lines is sent.
+    """
+
+    def __init__(self, client: CoordinatorClient, flush_interval: float = 0.5):
+        self.client = client
+        self.flush_interval = flush_interval
+        self._queue = deque()
+        self._send_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='remote-emitter', daemon=True)
+        self._thread.start()
+
+    def emit(self, event: str, data=None, **kwargs):
+        """Queues a message of a job for the coordinator. Messages that belong to no job are dropped."""
+        job_id = data.get('job_id') if isinstance(data, dict) else None
+        if job_id:
+            self._queue.append((job_id, {'event': event, 'data': data}))
+
+    def flush(self):
+        """Sends everything queued so far, grouped per job."""
+        with self._send_lock:
+            batches: Dict[str, list] = {}
+            while self._queue:
+                job_id, message = self._queue.popleft()
+                batch = batches.setdefault(job_id, [])
+                if batch and self._is_progress(batch[-1]) and self._is_progress(message):
+                    batch[-1] = message
+                else:
+                    batch.append(message)
+            for job_id, events in batches.items():
+                try:
+                    self.client.send_events(job_id, events)
+                except LeaseLostError:
+                    pass  # The job's heartbeat notices this too and stops it.
+                except requests.RequestException as e:
+                    logger.warning(f"Could not forward {len(events)} log lines of job {job_id}: {e}")
+
+    @staticmethod
+    def _is_progress(message: Dict[str, Any]) -> bool:
+        return message['event'] == 'terminal_output' and str(message['data'].get('line', '')).startswith('\r')
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def close(self):
+        self._closed.set()
+        self._thread.join()
+        self.flush()
+
+
+class RemoteJobStore:
+    """
+    Stands in for the JobStore on a worker. Downloaders journal their progress here; it
+    is kept in memory and reported to the coordinator with each heartbeat. get() returns
+    the job as leased, so a resumed document download still finds its journaled offset.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, job: Dict[str, Any]):
+        self._jobs[job['id']] = dict(job)
+
+    def remove(self, job_id: str):
+        self._jobs.pop(job_id, None)
+
+    def get(self, job_id: str) -> Dict[str, Any] | None:
+        return self._jobs.get(job_id)
+
+    def update_progress(self, job_id: str, downloaded: int | None, total: int | None = None, force: bool = False):
+        job = self._jobs.get(job_id)
+        if job is None or downloaded is None:
+            return
+        job['downloaded'] = int(downloaded)
+        if total:
+            job['total'] = int(total)
+
+
+class Worker:
+    """
+    A download worker process. It leases jobs from a coordinator (the Lawran IDM app
+    started with LAWRAN_COORDINATOR=1), runs them with the regular downloader classes,
+    streams their output back, and hands over the finished files: either by uploading
+    them, or, when `shared_storage` is set, by writing straight into the coordinator's
+    downloads folder mounted at `output_path`.
+
+    A job's lease is renewed by a heartbeat while it runs. If the worker dies, the lease
+    runs out and the coordinator gives the job to another worker.
+    """
+
+    def __init__(self, coordinator_url: str, output_path: str, worker_id: str | None = None, token: str | None = None,
+                 slots: int = 1, shared_storage: bool = False, kinds=WORKER_KINDS, poll_interval: float = 2.0):
+        """
+        Initializes the Worker.
+
+        Args:
+            coordinator_url (str): The coordinator's address, e.g. 'http://192.168.1.10:5000'.
+            output_path (str): Scratch folder for downloads, or the shared downloads folder.
+            worker_id (str): Name reported to the coordinator; defaults to '<hostname>-<pid>'.
+            token (str): Shared secret, if the coordinator sets LAWRAN_WORKER_TOKEN.
+            slots (int): Number of jobs run at the same time.
+            shared_storage (bool): True if `output_path` is the coordinator's downloads folder.
+            kinds (tuple): Job kinds this worker accepts.
+            poll_interval (float): Seconds between lease requests while there is nothing to do.
+        """
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.output_path = os.path.abspath(output_path)
+        self.slots = slots
+        self.shared_storage = shared_storage
+        self.kinds = tuple(kind for kind in kinds if kind in WORKER_KINDS)
+        self.poll_interval = poll_interval
+        os.makedirs(self.output_path, exist_ok=True)
+
+        self.client = CoordinatorClient(coordinator_url, self.worker_id, token)
+        self.emitter = RemoteEmitter(self.client)
+        self.job_store = RemoteJobStore()
+        self.job_control = JobControl()
+        self.fragment_tuner = FragmentTuner()
+        # Warm yt-dlp instances, kept across this worker's jobs
+        self.ydl_pool = YoutubeDLPool()
+        self.disk_admission = DiskAdmission(self.output_path, job_store=self.job_store)
+        self._stopping = threading.Event()
+        # Paused jobs whose scratch folders are kept, in case this worker resumes them
+        self._kept_lock = threading.Lock()
+        self._kept = set()
+        if not self.shared_storage:
+            # Left by an earlier run; the coordinator says which of them are no longer needed.
+            scratch = os.path.join(self.output_path, SCRATCH_DIR)
+            os.makedirs(scratch, exist_ok=True)
+            self._kept = {entry.name for entry in os.scandir(scratch) if entry.is_dir()}
+
+    def _job_dir(self, job_id: str) -> str:
+        """Where a job writes its files: the shared folder itself, or a scratch folder of its own."""
+        return self.output_path if self.shared_storage else os.path.join(self.output_path, SCRATCH_DIR, job_id)
+
+    def _targets(self, output_path: str) -> Dict[str, Any]:
+        """Builds the downloaders for one job, writing into `output_path`."""
+        common = {'job_store': self.job_store, 'disk_admission': self.disk_admission, 'job_control': self.job_control}
+        engine = {'fragment_tuner': self.fragment_tuner, 'ydl_pool': self.ydl_pool, **common}
+        video = YouTubeVideoDownloader(self.emitter, output_path=output_path, **engine)
+        audio = YouTubeAudioDownloader(self.emitter, output_path=output_path, **engine)
+        return {
+            'video': video.download_video,
+            'audio': audio.download_audio,
+            '4k': YouTube4KDownloader(self.emitter, output_path=output_path, **engine).download_4k_video,
+            'playlist': PlaylistDownloader(self.emitter, video, audio, job_store=self.job_store,
+                                           job_control=self.job_control,
+                                           disk_admission=self.disk_admission).download_playlist,
+            'other': OtherPlatformsDownloader(self.emitter, output_path=output_path, **engine).download_media,
+            'document': DocumentDownloader(self.emitter, output_path=output_path, **common).download_document,
+        }
+
+    def _heartbeat(self, job_id: str, lease_seconds: float, done: threading.Event, lost: threading.Event):
+        """Renews the lease until the job is handed over, and relays cancel/pause requests."""
+        while not done.wait(lease_seconds / 3):
+            job = self.job_store.get(job_id) or {}
+            sent = time.monotonic()
+            try:
+                action = self.client.heartbeat(job_id, job.get('downloaded'), job.get('total'))
+            except LeaseLostError:
+                logger.warning(f"Lost the lease on job {job_id}; stopping it.")
+                lost.set()
+                self.job_control.request(job_id, JobControl.LEASE_LOST)
+                return
+            except requests.RequestException as e:
+                logger.warning(f"Heartbeat for job {job_id} failed: {e}")
+                continue
+            # The coordinator extended the lease from some time after `sent`.
+            self.job_control.set_deadline(job_id, sent + lease_seconds)
+            if action:
+                self.job_control.request(job_id, action)
+
+    def _hand_over(self, job_id: str, job_dir: str):
+        """Uploads every finished file the job produced, keeping its path relative to the job folder."""
+        for root, _, files in os.walk(job_dir):
+            for name in files:
+                if name.endswith(PARTIAL_SUFFIXES):
+                    continue
+                path = os.path.join(root, name)
+                rel_path = os.path.relpath(path, job_dir).replace(os.sep, '/')
+                self.emitter.emit('terminal_output', {'job_id': job_id, 'line': f"\033[36mHanding over {rel_path}...\033[0m"})
+                self.client.upload(job_id, rel_path, path)
+
+    def _discard_scratch(self, job_ids: List[str]):
+        """Deletes the kept scratch folders of paused jobs that ended or were resumed elsewhere."""
+        for job_id in job_ids:
+            with self._kept_lock:
+                if job_id not in self._kept:
+                    continue
+                self._kept.discard(job_id)
+            logger.info(f"Deleting the scratch folder of job {job_id}, which no longer runs here.")
+            shutil.rmtree(self._job_dir(job_id), ignore_errors=True)
+
+    def run_job(self, job: Dict[str, Any], lease_seconds: float):
+        """Runs one leased job to the end and reports its outcome to the coordinator."""
+        job_id = job['id']
+        job_dir = self._job_dir(job_id)
+        with self._kept_lock:
+            self._kept.discard(job_id)
+        self.job_store.add(job)
+        done, lost = threading.Event(), threading.Event()
+        self.job_control.set_deadline(job_id, time.monotonic() + lease_seconds)
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, lease_seconds, done, lost), daemon=True)
+        heartbeat.start()
+        self.emitter.emit('terminal_output', {'job_id': job_id, 'line': f"\033[1mRunning on worker {self.worker_id}\033[0m"})
+        result = None
+        try:
+            try:
+                result = self._targets(job_dir)[job['kind']](job_id=job_id, **job['params'])
+            except DownloadInterrupted as e:
+                result = {'status': e.status}
+            except Exception as e:
+                result = {'status': 'error', 'message': str(e)}
+            result = result or {'status': 'error', 'message': 'Unknown error'}
+            if result.get('status') == 'lease_lost':
+                lost.set()
+
+            # Once the lease is lost, the partial files belong to the job's new worker.
+            if result.get('status') == 'cancelled' and not lost.is_set():
+                self.job_control.discard_partials(job_id)
+            if not lost.is_set() and result.get('status') == 'success' and not self.shared_storage:
+                self._hand_over(job_id, job_dir)
+            self.emitter.flush()
+            if not lost.is_set():
+                job = self.job_store.get(job_id)
+                self.client.complete(job_id, result, job.get('downloaded'), job.get('total'))
+        except (LeaseLostError, requests.RequestException, OSError) as e:
+            # The lease runs out on the coordinator and another worker picks the job up.
+            logger.error(f"Could not hand over job {job_id}: {e}")
+        finally:
+            done.set()
+            status = (result or {}).get('status')
+            self.job_control.clear(job_id, keep_partials=status == 'paused')
+            self.job_store.remove(job_id)
+            # A paused job keeps its scratch folder, in case this worker gets to resume it.
+            if not self.shared_storage and status == 'paused':
+                with self._kept_lock:
+                    self._kept.add(job_id)
+            elif not self.shared_storage:
+                shutil.rmtree(job_dir, ignore_errors=True)
+
+    def _slot(self):
+        """One job at a time: lease, run, hand over, repeat."""
+        while not self._stopping.is_set():
+            with self._kept_lock:
+                kept = sorted(self._kept)
+            try:
+                job, lease_seconds, discard = self.client.lease(self.kinds, kept)
+            except requests.RequestException as e:
+                logger.warning(f"Coordinator unreachable: {e}")
+                job, discard = None, []
+            self._discard_scratch(discard)
+            if job is None:
+                self._stopping.wait(self.poll_interval)
+                continue
+            logger.info(f"Leased {job['kind']} job {job['id']}")
+            self.run_job(job, lease_seconds)
+
+    def run(self):
+        """Runs the worker's slots until interrupted."""
+        logger.info(f"Worker {self.worker_id} serving {self.client.base_url} with {self.slots} slot(s), "
+                    f"{'shared storage at' if self.shared_storage else 'scratch folder'} {self.output_path}")
+        threads = [threading.Thread(target=self._slot, name=f"worker-slot-{i}", daemon=True) for i in range(self.slots)]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            # Running jobs are simply abandoned; their leases expire and they are re-queued.
+            logger.info("Stopping worker.")
+            self._stopping.set()
+        finally:
+            self.emitter.close()
+
+    def stop(self):
+        self._stopping.set()
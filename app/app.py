@@ -1,17 +1,31 @@
-from flask import Flask, send_from_directory, request, jsonify
+from flask import Flask, send_from_directory, send_file, request, jsonify
 from flask_cors import CORS
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room, leave_room, emit
 import os
+import hmac
 from pathlib import Path  # <-- ADD THIS IMPORT
+from werkzeug.security import safe_join
 
 # --- Import all downloader classes ---
 from app.Download.video.video import YouTubeVideoDownloader
 from app.Download.uhd.uhd import YouTube4KDownloader
 from app.Download.playlist.playlist import PlaylistDownloader
+from app.Download.playlist.sync_state import PlaylistSyncState
 from app.Download.downloads import DownloadManager
+from app.Download.media_cache import MediaProbeCache
 from app.Download.audio.audio import YouTubeAudioDownloader
 from app.Download.other_platforms.other_platforms import OtherPlatformsDownloader
 from app.Download.documents.documents import DocumentDownloader
+from app.Download.jobs import JobStore
+from app.Download.checksum import parse_expected_digest
+from app.Download.fragments import FragmentTuner
+from app.Download.engine import YoutubeDLPool
+from app.Download.admission import DiskAdmission
+from app.Download.emitter import SocketIOEmitter
+from app.Download.task_logs import TaskLogStore
+from app.Download.control import JobControl, DownloadInterrupted
+from app.Download.worker import WORKER_KINDS
+from app.static_assets import StaticAssetIndex
 app = Flask(__name__)
 # This configuration explicitly tells the browser that any origin ('*') is allowed
 # to make requests to any of our API routes or download routes. This is essential
@@ -34,22 +48,232 @@ DOWNLOADS_DIR = home_dir / "Downloads" / "Lawran IDM"
 os.makedirs(DOWNLOADS_DIR, exist_ok=True)
 print(f"--- Downloads will be saved to: {DOWNLOADS_DIR} ---")
 
+# 4. App state (the job journal, caches) lives in a hidden folder next to the downloads.
+STATE_DIR = DOWNLOADS_DIR / ".lawran"
+os.makedirs(STATE_DIR, exist_ok=True)
+
+# --- Per-job terminal output, kept for clients that connect after a job started ---
+task_logs = TaskLogStore(spill_dir=STATE_DIR / "logs")
+# Downloaders emit through this queue, so slow clients never stall a download thread.
+emitter = SocketIOEmitter(socketio, task_logs=task_logs)
+
+# --- The durable job journal, so queued/running downloads survive a restart ---
+job_store = JobStore(STATE_DIR / "jobs.db")
+# --- Shared so fragment concurrency learned on one host carries over between downloaders ---
+fragment_tuner = FragmentTuner()
+# --- Reserves disk space per job so concurrent downloads can't overcommit the disk ---
+disk_admission = DiskAdmission(DOWNLOADS_DIR, job_store=job_store)
+# --- What each mirrored playlist/channel has already downloaded, for incremental syncs ---
+sync_state = PlaylistSyncState(STATE_DIR / "sync.db")
+# Seconds between checks for scheduled playlist syncs that are due
+SYNC_CHECK_INTERVAL = 30
+# --- Cancel/pause requests for running jobs, checked by the downloaders as they go ---
+job_control = JobControl()
+
+# --- Distributed mode: with LAWRAN_COORDINATOR=1 this app only keeps the job queue, and
+# worker processes (see worker.py) lease the jobs, run them and hand the files over ---
+COORDINATOR_MODE = os.getenv('LAWRAN_COORDINATOR') == '1'
+# Shared secret workers must send. Without one, only workers on this machine are accepted.
+WORKER_TOKEN = os.getenv('LAWRAN_WORKER_TOKEN')
+# Seconds a worker's lease on a job lasts without a heartbeat
+LEASE_SECONDS = float(os.getenv('LAWRAN_LEASE_SECONDS', 30))
+
+# --- Warm yt-dlp instances, shared by all yt-dlp downloaders so jobs skip the setup ---
+ydl_pool = YoutubeDLPool()
+
 # --- Instantiate all managers, PASSING THE NEW SYSTEM PATH to them ---
-video_downloader = YouTubeVideoDownloader(socketio, output_path=DOWNLOADS_DIR)
-audio_downloader = YouTubeAudioDownloader(socketio, output_path=DOWNLOADS_DIR)
-downloader_4k = YouTube4KDownloader(socketio, output_path=DOWNLOADS_DIR)
-playlist_downloader = PlaylistDownloader(socketio, video_downloader, audio_downloader)
-download_manager = DownloadManager(download_folder=DOWNLOADS_DIR)
-other_downloader = OtherPlatformsDownloader(socketio, output_path=DOWNLOADS_DIR)
-document_downloader = DocumentDownloader(socketio, output_path=DOWNLOADS_DIR)
+video_downloader = YouTubeVideoDownloader(emitter, output_path=DOWNLOADS_DIR, job_store=job_store,
+                                          fragment_tuner=fragment_tuner, disk_admission=disk_admission,
+                                          job_control=job_control, ydl_pool=ydl_pool)
+audio_downloader = YouTubeAudioDownloader(emitter, output_path=DOWNLOADS_DIR, job_store=job_store,
+                                          disk_admission=disk_admission, job_control=job_control,
+                                          ydl_pool=ydl_pool)
+downloader_4k = YouTube4KDownloader(emitter, output_path=DOWNLOADS_DIR, job_store=job_store,
+                                    fragment_tuner=fragment_tuner, disk_admission=disk_admission,
+                                    job_control=job_control, ydl_pool=ydl_pool)
+playlist_downloader = PlaylistDownloader(emitter, video_downloader, audio_downloader, job_store=job_store,
+                                         sync_state=sync_state, job_control=job_control,
+                                         disk_admission=disk_admission)
+# --- Probed media details and thumbnails of finished downloads, filled in the background ---
+media_cache = MediaProbeCache(STATE_DIR / "media",
+                              max_bytes=int(os.getenv('LAWRAN_MEDIA_CACHE_MB', 256)) * 1024 * 1024)
+download_manager = DownloadManager(download_folder=DOWNLOADS_DIR, media_cache=media_cache)
+other_downloader = OtherPlatformsDownloader(emitter, output_path=DOWNLOADS_DIR, job_store=job_store,
+                                            fragment_tuner=fragment_tuner, disk_admission=disk_admission,
+                                            job_control=job_control, ydl_pool=ydl_pool)
+document_downloader = DocumentDownloader(emitter, output_path=DOWNLOADS_DIR, job_store=job_store,
+                                         disk_admission=disk_admission, job_control=job_control)
+
+# --- Maps each job kind recorded in the journal to the method that runs it ---
+JOB_TARGETS = {
+    'video': video_downloader.download_video,
+    'audio': audio_downloader.download_audio,
+    '4k': downloader_4k.download_4k_video,
+    'playlist': playlist_downloader.download_playlist,
+    'playlist_sync': playlist_downloader.sync_playlist,
+    'other': other_downloader.download_media,
+    'document': document_downloader.download_document,
+}
+
+
+def runs_on_worker(kind):
+    """True if jobs of this kind are left in the queue for remote workers instead of run here."""
+    return COORDINATOR_MODE and kind in WORKER_KINDS
+
+
+def run_job(job_id):
+    """
+    Runs a journaled job in the current (background) thread and records its outcome.
+    """
+    job = job_store.get(job_id)
+    job_store.mark_running(job_id)
+    # Looked up here rather than on the job's first log line, which may come from a yt-dlp hook.
+    task_logs.prepare(job_id)
+    try:
+        # A job that was stopped before it got going doesn't start at all.
+        job_control.check(job_id)
+        result = JOB_TARGETS[job['kind']](job_id=job_id, **job['params'])
+    except DownloadInterrupted as e:
+        result = {'status': e.status}
+    except Exception as e:
+        result = {'status': 'error', 'message': str(e)}
+    record_outcome(job_id, result)
+
+
+def record_outcome(job_id, result):
+    """Records how a job ended, whether it ran here or on a worker."""
+    status = (result or {}).get('status')
+    if status == 'success':
+        job_store.mark_completed(job_id, result.get('filename'), result.get('digest'))
+        # Probe it now, so it already has its details and thumbnail when the downloads list is opened.
+        if result.get('filename'):
+            media_cache.schedule(os.path.join(DOWNLOADS_DIR, result['filename']))
+    elif status == JobStore.CANCELLED:
+        job_control.discard_partials(job_id)
+        job_store.mark_cancelled(job_id)
+    elif status == JobStore.PAUSED:
+        job_store.mark_paused(job_id, job_control.partials(job_id))
+    else:
+        job_store.mark_failed(job_id, (result or {}).get('message', 'Unknown error'))
+    # A paused job keeps its partial files (and their tracking) for when it is resumed.
+    job_control.clear(job_id, keep_partials=status == JobStore.PAUSED)
+
+
+def submit_job(kind, **params):
+    """
+    Records a new job in the journal and starts it as a background task.
+    Returns the job ID so clients can follow it.
+    """
+    job_id = job_store.submit(kind, params)
+    if runs_on_worker(kind):
+        emitter.emit('terminal_output', {'job_id': job_id, 'line': "\033[1mQueued for the next free worker...\033[0m"})
+    else:
+        socketio.start_background_task(target=run_job, job_id=job_id)
+    return job_id
+
+
+def resume_unfinished_jobs():
+    """
+    Re-queues every job that was pending or running when the app last stopped.
+    yt-dlp continues from its '.part' files and documents resume with Range requests,
+    so most of the already transferred data is kept. A job that was interrupted
+    JobStore.MAX_ATTEMPTS times is marked failed instead.
+    """
+    for job in job_store.unfinished():
+        if job['status'] == JobStore.RUNNING and job['attempts'] >= JobStore.MAX_ATTEMPTS:
+            print(f"--- Giving up on {job['kind']} job {job['id']} after {job['attempts']} attempts ---")
+            job_store.mark_failed(job['id'], f"Stopped after {job['attempts']} interrupted attempts.")
+            continue
+        if runs_on_worker(job['kind']):
+            continue  # Still in the queue; a worker leases it again once its old lease has run out.
+        print(f"--- Resuming unfinished {job['kind']} job {job['id']} ---")
+        socketio.start_background_task(target=run_job, job_id=job['id'])
+
+
+def run_sync_scheduler():
+    """
+    Background loop that queues a sync job for every scheduled playlist whose
+    interval has elapsed, unless a sync of that playlist is still queued or running.
+    """
+    while True:
+        socketio.sleep(SYNC_CHECK_INTERVAL)
+        try:
+            active = {job['params'].get('url') for job in job_store.unfinished() if job['kind'] == 'playlist_sync'}
+            for playlist in sync_state.due():
+                if playlist['url'] in active:
+                    continue
+                sync_state.touch(playlist['url'])
+                submit_job('playlist_sync', url=playlist['url'], quality=playlist['quality'],
+                           format=playlist['format'])
+        except Exception as e:
+            print(f"--- Playlist sync scheduler error: {e} ---")
+
+
+def run_lease_reaper():
+    """
+    Coordinator loop that re-queues jobs whose worker stopped sending heartbeats,
+    so the next free worker picks them up.
+    """
+    while True:
+        socketio.sleep(LEASE_SECONDS / 3)
+        try:
+            for job_id in job_store.expire_leases():
+                print(f"--- Lease on job {job_id} expired, re-queueing it ---")
+                emitter.emit('terminal_output', {
+                    'job_id': job_id, 'line': "\n\033[93mThe worker stopped responding; the job is queued for another worker.\033[0m"})
+        except Exception as e:
+            print(f"--- Lease reaper error: {e} ---")
+
+
+def start_background_tasks():
+    """
+    Indexes the UI, resumes unfinished jobs and starts the schedulers. Called once, by the
+    process that serves requests: importing this module must not start jobs or hash and
+    compress the UI, because the debug reloader imports it in its watcher process as well.
+    """
+    static_assets.build()
+    socketio.start_background_task(target=static_assets.compress_all)
+    resume_unfinished_jobs()
+    socketio.start_background_task(target=run_sync_scheduler)
+    if COORDINATOR_MODE:
+        print(f"--- Coordinator mode: {', '.join(WORKER_KINDS)} jobs are run by worker processes ---")
+        if not WORKER_TOKEN:
+            print("--- LAWRAN_WORKER_TOKEN is not set: only workers on this machine can connect ---")
+        socketio.start_background_task(target=run_lease_reaper)
+
+
+def checksum_error(checksum):
+    """Returns a 400 response if a submitted checksum can't be parsed, otherwise None."""
+    if not checksum:
+        return None
+    try:
+        parse_expected_digest(checksum)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    return None
+
+
+def fragments_error(fragments):
+    """Returns a 400 response unless `fragments` is 'auto' or a number of fragment workers the tuner allows."""
+    if fragments == 'auto' or (str(fragments).isdigit() and 0 < int(fragments) <= fragment_tuner.maximum):
+        return None
+    return jsonify({'status': 'error',
+                    'message': f"'fragments' must be 'auto' or a number from 1 to {fragment_tuner.maximum}"}), 400
+
+def number_error(name, value, minimum=0):
+    """Returns a 400 response unless `value` is a whole number of at least `minimum`, otherwise None."""
+    if str(value).isdigit() and int(value) >= minimum:
+        return None
+    return jsonify({'status': 'error', 'message': f"'{name}' must be a whole number of at least {minimum}"}), 400
+
+# --- The built UI: indexed once by start_background_tasks(), served precompressed with long-lived caching ---
+static_assets = StaticAssetIndex(app.static_folder, cache_dir=STATE_DIR / "static")
+
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
-    if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    else:
-        return send_from_directory(app.static_folder, 'index.html')
+    return static_assets.response(path)
 
 
 # --- API Endpoints (No changes needed here) ---
@@ -58,16 +282,19 @@ def download_video_route():
     data = request.json
     url = data.get('url')
     quality = data.get('quality', '1080p')
-
-    # Instead of waiting for a result, we start a background task.
+    checksum = data.get('checksum')
+    if error := checksum_error(checksum):
+        return error
+    # Concurrent HLS/DASH fragment downloads: 'auto' lets the tuner adapt it to the host
+    fragments = data.get('fragments', 'auto')
+    if error := fragments_error(fragments):
+        return error
+
+    # Instead of waiting for a result, we journal the job and start a background task.
     # This keeps the server responsive.
-    socketio.start_background_task(
-        target=video_downloader.download_video,
-        url=url,
-        quality=quality
-    )
+    job_id = submit_job('video', url=url, quality=quality, checksum=checksum, fragments=fragments)
     # Return an immediate response to the client.
-    return jsonify({'status': 'success', 'message': 'Download has started.'})
+    return jsonify({'status': 'success', 'message': 'Download has started.', 'job_id': job_id})
 
 
 @app.route('/api/download/audio', methods=['POST'])
@@ -75,28 +302,30 @@ def download_audio_route():
     data = request.json
     url = data.get('url')
     audio_format = data.get('format', 'mp3')
+    checksum = data.get('checksum')
+    if error := checksum_error(checksum):
+        return error
 
-    socketio.start_background_task(
-        target=audio_downloader.download_audio,
-        url=url,
-        format=audio_format
-    )
+    job_id = submit_job('audio', url=url, format=audio_format, checksum=checksum)
     # Return an immediate success response
-    return jsonify({'status': 'success', 'message': 'Audio extraction has started.'})
+    return jsonify({'status': 'success', 'message': 'Audio extraction has started.', 'job_id': job_id})
 
 
 @app.route('/api/download/4k', methods=['POST'])
 def download_4k_route():
     data = request.json
     url = data.get('url')
+    checksum = data.get('checksum')
+    if error := checksum_error(checksum):
+        return error
+    fragments = data.get('fragments', 'auto')
+    if error := fragments_error(fragments):
+        return error
 
     # Start the 4K download as a background task
-    socketio.start_background_task(
-        target=downloader_4k.download_4k_video,
-        url=url
-    )
+    job_id = submit_job('4k', url=url, checksum=checksum, fragments=fragments)
     # Return an immediate success response
-    return jsonify({'status': 'success', 'message': 'UHD download has started.'})
+    return jsonify({'status': 'success', 'message': 'UHD download has started.', 'job_id': job_id})
 
 
 @app.route('/api/playlist/info', methods=['POST'])
@@ -113,15 +342,46 @@ def playlist_download_route():
     # --- THIS IS THE CRITICAL CHANGE ---
     # Start the playlist download as a background task.
     # The frontend will get progress updates via Socket.IO.
-    socketio.start_background_task(
-        target=playlist_downloader.download_playlist,
+    job_id = submit_job(
+        'playlist',
         url=data.get('url'),
         num_videos=int(data.get('num_videos')),
         quality=data.get('quality', '1080p'),
         format=data.get('format', 'mp4')
     )
     # Return an immediate success response.
-    return jsonify({'status': 'success', 'message': 'Playlist download has started.'})
+    return jsonify({'status': 'success', 'message': 'Playlist download has started.', 'job_id': job_id})
+
+
+@app.route('/api/playlist/sync', methods=['POST'])
+def playlist_sync_route():
+    """
+    Downloads only what is new in a playlist/channel since its last sync. With
+    'interval_minutes' > 0 the playlist is also re-synced on that schedule.
+    """
+    data = request.json
+    url = data.get('url')
+    if not url:
+        return jsonify({'status': 'error', 'message': 'URL is required'}), 400
+    quality = data.get('quality', '1080p')
+    format = data.get('format', 'mp4')
+    max_items = data.get('max_items') or None
+    if max_items is not None and (error := number_error('max_items', max_items, minimum=1)):
+        return error
+    interval_minutes = data.get('interval_minutes') or 0
+    if error := number_error('interval_minutes', interval_minutes):
+        return error
+
+    sync_state.register(url, quality, format, interval_minutes=int(interval_minutes))
+    sync_state.touch(url)
+    job_id = submit_job('playlist_sync', url=url, quality=quality, format=format,
+                        max_items=int(max_items) if max_items else None)
+    return jsonify({'status': 'success', 'message': 'Playlist sync has started.', 'job_id': job_id})
+
+
+@app.route('/api/playlist/syncs', methods=['GET'])
+def playlist_syncs_route():
+    return jsonify(sync_state.list_playlists())
 
 
 @app.route('/api/download/other', methods=['POST'])
@@ -130,25 +390,34 @@ def download_other_route():
     url = data.get('url')
     if not url:
         return jsonify({'status': 'error', 'message': 'URL is required'}), 400
+    checksum = data.get('checksum')
+    if error := checksum_error(checksum):
+        return error
+    fragments = data.get('fragments', 'auto')
+    if error := fragments_error(fragments):
+        return error
 
-    socketio.start_background_task(
-        target=other_downloader.download_media,  # <-- Make sure it calls download_media
-        url=url
-    )
+    job_id = submit_job('other', url=url, checksum=checksum, fragments=fragments)
 
-    return jsonify({'status': 'success', 'message': 'Universal download has started.'})
+    return jsonify({'status': 'success', 'message': 'Universal download has started.', 'job_id': job_id})
 
 
 @app.route('/api/download/document', methods=['POST'])
 def download_document_route():
     data = request.json
     url = data.get('url')
+    # An optional published digest, e.g. 'sha256:<hex>', verified while the file streams in
+    checksum = data.get('checksum')
+    if error := checksum_error(checksum):
+        return error
+    # Optional other URLs of the same file, downloaded from in parallel with `url`
+    mirrors = data.get('mirrors') or None
+    if mirrors is not None and (not isinstance(mirrors, list) or not all(isinstance(m, str) for m in mirrors)):
+        return jsonify({'status': 'error', 'message': "'mirrors' must be a list of URLs."}), 400
+
     # Start the generic download as a background task
-    socketio.start_background_task(
-        target=document_downloader.download_document,
-        url=url
-    )
-    return jsonify({'status': 'success', 'message': 'Document download has started.'})
+    job_id = submit_job('document', url=url, checksum=checksum, mirrors=mirrors)
+    return jsonify({'status': 'success', 'message': 'Document download has started.', 'job_id': job_id})
 
 @app.route('/api/downloads/list', methods=['GET'])
 def list_downloads_route():
@@ -156,12 +425,229 @@ def list_downloads_route():
     return jsonify(files)
 
 
+@app.route('/api/downloads/thumbnail/<key>', methods=['GET'])
+def download_thumbnail_route(key):
+    """Serves a thumbnail from the media cache. Keys change with the file, so they can be cached forever."""
+    path = media_cache.thumbnail_path(key)
+    if path is None or not os.path.exists(path):
+        return jsonify({'status': 'error', 'message': 'Thumbnail not found.'}), 404
+    response = send_file(path, mimetype='image/jpeg', conditional=True)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs_route():
+    limit = request.args.get('limit', 100, type=int)
+    return jsonify(job_store.list_jobs(limit=limit))
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_route(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+    return jsonify(job)
+
+
+def stop_job(job_id, action):
+    """
+    Asks a queued or running job to cancel or pause. The download stops at its next
+    progress update, and a document download waiting on a stalled server is aborted
+    at once; its final status is recorded by run_job once it has unwound.
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+
+    if action == JobControl.CANCEL and job['status'] == JobStore.PAUSED:
+        # Nothing is running, so the partial files can go right away. They are only tracked
+        # in memory until the app restarts, so the journaled ones are removed too.
+        for path in job['partials']:
+            job_control.track(job_id, path)
+        job_control.discard_partials(job_id)
+        job_control.clear(job_id)
+        job_store.mark_cancelled(job_id)
+        emitter.emit('download_cancelled', {'job_id': job_id})
+        return jsonify({'status': 'success', 'message': 'Job cancelled.'})
+
+    if job['status'] == JobStore.PENDING and runs_on_worker(job['kind']):
+        # Still waiting in the queue, so no worker has to be told.
+        status = JobStore.CANCELLED if action == JobControl.CANCEL else JobStore.PAUSED
+        record_outcome(job_id, {'status': status})
+        emitter.emit(f"download_{status}", {'job_id': job_id})
+        return jsonify({'status': 'success', 'message': f"Job {status}."})
+
+    if job['status'] not in JobStore.UNFINISHED:
+        return jsonify({'status': 'error', 'message': f"Job is already {job['status']}."}), 409
+    job_control.request(job_id, action)
+    # Jobs waiting for disk space would otherwise only notice at their next re-check.
+    disk_admission.wake()
+    return jsonify({'status': 'success', 'message': f"Job will be {'cancelled' if action == JobControl.CANCEL else 'paused'}."})
+
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job_route(job_id):
+    """Stops a job and deletes its partial files."""
+    return stop_job(job_id, JobControl.CANCEL)
+
+
+@app.route('/api/jobs/<job_id>/pause', methods=['POST'])
+def pause_job_route(job_id):
+    """Stops a job but keeps its partial files, so it can be resumed later."""
+    return stop_job(job_id, JobControl.PAUSE)
+
+
+@app.route('/api/jobs/<job_id>/resume', methods=['POST'])
+def resume_job_route(job_id):
+    """Re-queues a paused job; it continues from its partial files."""
+    if job_store.get(job_id) is None:
+        return jsonify({'status': 'error', 'message': 'Job not found'}), 404
+    if not job_store.requeue_paused(job_id):
+        return jsonify({'status': 'error', 'message': 'Only paused jobs can be resumed.'}), 409
+    if not runs_on_worker(job_store.get(job_id)['kind']):
+        socketio.start_background_task(target=run_job, job_id=job_id)
+    return jsonify({'status': 'success', 'message': 'Job resumed.', 'job_id': job_id})
+
+
+@app.route('/api/jobs/<job_id>/logs', methods=['GET'])
+def get_job_logs_route(job_id):
+    """Returns a page of a job's terminal output, starting at the given line offset."""
+    offset = request.args.get('offset', 0, type=int)
+    limit = min(request.args.get('limit', 500, type=int), 5000)
+    return jsonify(task_logs.fetch(job_id, offset=offset, limit=limit))
+
+
+# --- Worker protocol (distributed mode) ---
+def worker_request_error():
+    """
+    Returns an error response unless this app is a coordinator and the worker sent the right
+    token. The app listens on every interface, so without a token only loopback workers get in.
+    """
+    if not COORDINATOR_MODE:
+        return jsonify({'status': 'error', 'message': 'This app is not running as a coordinator.'}), 404
+    if not WORKER_TOKEN:
+        if request.remote_addr not in ('127.0.0.1', '::1'):
+            return jsonify({'status': 'error',
+                            'message': 'Set LAWRAN_WORKER_TOKEN to accept workers from other machines.'}), 403
+        return None
+    if not hmac.compare_digest(request.headers.get('X-Worker-Token', ''), WORKER_TOKEN):
+        return jsonify({'status': 'error', 'message': 'Invalid worker token.'}), 401
+    return None
+
+
+def lease_lost():
+    return jsonify({'status': 'error', 'message': 'This worker no longer holds the lease on the job.'}), 409
+
+
+@app.route('/api/worker/lease', methods=['POST'])
+def worker_lease_route():
+    """
+    Hands the oldest queued job this worker can run to it, or {'job': None}. The worker
+    lists the paused jobs it keeps scratch files for, and is told which of them to delete.
+    """
+    if error := worker_request_error():
+        return error
+    data = request.json
+    kinds = [kind for kind in data.get('kinds', WORKER_KINDS) if kind in WORKER_KINDS]
+    job = job_store.lease(data['worker_id'], kinds, LEASE_SECONDS)
+    if job:
+        print(f"--- {job['kind']} job {job['id']} leased to worker {data['worker_id']} ---")
+    discard = job_store.stale_scratch(data['worker_id'], [str(job_id) for job_id in data.get('kept') or []])
+    return jsonify({'job': job, 'lease_seconds': LEASE_SECONDS, 'discard': discard})
+
+
+@app.route('/api/worker/heartbeat', methods=['POST'])
+def worker_heartbeat_route():
+    """Renews a lease and records the job's progress; the answer carries any cancel/pause request."""
+    if error := worker_request_error():
+        return error
+    data = request.json
+    job_id = data['job_id']
+    if not job_store.heartbeat(job_id, data['worker_id'], LEASE_SECONDS):
+        return lease_lost()
+    job_store.update_progress(job_id, data.get('downloaded'), data.get('total'), force=True)
+    return jsonify({'status': 'success', 'action': job_control.requested(job_id)})
+
+
+@app.route('/api/worker/events', methods=['POST'])
+def worker_events_route():
+    """Relays a batch of a job's terminal output and download events to the UI, as if it ran here."""
+    if error := worker_request_error():
+        return error
+    data = request.json
+    job_id = data['job_id']
+    if not job_store.holds_lease(job_id, data['worker_id']):
+        return lease_lost()
+    for message in data.get('events', []):
+        event = message.get('event', '')
+        if event == 'terminal_output' or event.startswith('download_'):
+            emitter.emit(event, {**(message.get('data') or {}), 'job_id': job_id})
+    return jsonify({'status': 'success'})
+
+
+@app.route('/api/worker/jobs/<job_id>/files/<path:filename>', methods=['PUT'])
+def worker_upload_route(job_id, filename):
+    """Receives a finished file from a worker into the downloads folder, streamed to disk."""
+    if error := worker_request_error():
+        return error
+    if not job_store.holds_lease(job_id, request.args.get('worker_id', '')):
+        return lease_lost()
+    path = safe_join(str(DOWNLOADS_DIR), filename)
+    if path is None or Path(filename).parts[0] == STATE_DIR.name:
+        return jsonify({'status': 'error', 'message': 'Invalid file name.'}), 400
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    part_path = path + '.part'
+    with open(part_path, 'wb') as f:
+        while chunk := request.stream.read(1024 * 1024):
+            f.write(chunk)
+    os.replace(part_path, path)
+    return jsonify({'status': 'success'})
+
+
+@app.route('/api/worker/complete', methods=['POST'])
+def worker_complete_route():
+    """Records the outcome of a job a worker has finished (and handed over, if it succeeded)."""
+    if error := worker_request_error():
+        return error
+    data = request.json
+    job_id = data['job_id']
+    if not job_store.holds_lease(job_id, data['worker_id']):
+        return lease_lost()
+    job_store.update_progress(job_id, data.get('downloaded'), data.get('total'), force=True)
+    record_outcome(job_id, data.get('result'))
+    return jsonify({'status': 'success'})
+
+
 # --- SocketIO Events (No changes needed here) ---
 @socketio.on('connect')
 def handle_connect():
+    # Until a client subscribes to specific jobs, it receives every job's output.
+    join_room(SocketIOEmitter.FIREHOSE_ROOM)
     print('Client connected')
 
 
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """
+    Follows one job: replays its log from `offset`, then streams new lines. Clients
+    de-duplicate the replay and the live stream by each line's 'offset'.
+    """
+    job_id = data.get('job_id')
+    if not job_id:
+        return
+    leave_room(SocketIOEmitter.FIREHOSE_ROOM)
+    join_room(SocketIOEmitter.job_room(job_id))
+    replay = task_logs.fetch(job_id, offset=int(data.get('offset', 0)), limit=5000)
+    emit('terminal_replay', {'job_id': job_id, **replay})
+
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    leave_room(SocketIOEmitter.job_room(data.get('job_id')))
+
+
 @socketio.on('disconnect')
 def handle_disconnect():
     print('Client disconnected')
@@ -182,4 +668,7 @@ def download_file(filename):
 
 
 if __name__ == '__main__':
+    # The reloader runs this file twice: a watcher, and the child (WERKZEUG_RUN_MAIN) that serves requests.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_tasks()
     socketio.run(app, debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,165 @@
+# app/static_assets.py
+
+import os
+import re
+import gzip
+import hashlib
+import logging
+import mimetypes
+import threading
+from typing import Dict, Any
+
+from flask import Response, request, send_file, abort
+
+try:
+    import brotli  # Optional: `pip install brotli` adds br variants next to gzip
+except ImportError:
+    brotli = None
+
+# --- Basic Configuration ---
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Vite writes bundles as 'assets/<name>-<hash>.<ext>'; their content never changes under a name.
+HASHED_ASSET = re.compile(r'^assets/.+-[\w-]{8,}\.\w+$')
+# Text formats worth compressing; images, fonts and media are already compressed.
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/xml',
+                      'image/svg+xml', 'application/wasm', 'application/manifest+json')
+# Some platforms (notably the Windows registry) map these to the wrong type, which breaks module scripts.
+MIME_OVERRIDES = {'.js': 'text/javascript', '.mjs': 'text/javascript', '.css': 'text/css',
+                  '.svg': 'image/svg+xml', '.wasm': 'application/wasm', '.json': 'application/json'}
+
+
+class StaticAssetIndex:
+    """
+    Serves the built React UI. The static folder is indexed once at startup instead of
+    touching the filesystem on every request, and text assets get precompressed
+    brotli/gzip variants that are picked by the client's Accept-Encoding.
+
+    Vite's hashed bundles are cached by the browser (and pywebview) forever with
+    `Cache-Control: immutable`; everything else, index.html in particular, is
+    revalidated with its ETag, so a repeat launch costs a single 304.
+
+    Compressing with brotli's highest quality is slow, so it runs in a background
+    thread and the results are cached on disk by content hash; until a variant is
+    ready the asset is served uncompressed.
+    """
+
+    def __init__(self, static_folder, cache_dir=None, min_size: int = 1024):
+        """
+        Initializes the StaticAssetIndex.
+
+        Args:
+            static_folder (str): The folder Vite builds the UI into.
+            cache_dir (str): Optional folder where compressed variants are kept between launches.
+            min_size (int): Files smaller than this many bytes aren't worth compressing.
+        """
+        self.static_folder = str(static_folder)
+        self.cache_dir = str(cache_dir) if cache_dir else None
+        self.min_size = min_size
+        self._assets: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def build(self):
+        """Indexes every file in the static folder: its type, size, ETag and caching policy."""
+        assets = {}
+        for root, _, files in os.walk(self.static_folder):
+            for name in files:
+                path = os.path.join(root, name)
+                rel_path = os.path.relpath(path, self.static_folder).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    etag = hashlib.sha1(f.read()).hexdigest()[:20]
+                ext = os.path.splitext(name)[1].lower()
+                mimetype = MIME_OVERRIDES.get(ext) or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                size = os.path.getsize(path)
+                assets[rel_path] = {
+                    'path': path,
+                    'mimetype': mimetype,
+                    'size': size,
+                    'etag': etag,
+                    'immutable': bool(HASHED_ASSET.match(rel_path)),
+                    'compressible': size >= self.min_size and mimetype.startswith(COMPRESSIBLE_TYPES),
+                    'variants': {},
+                }
+        with self._lock:
+            self._assets = assets
+        logger.info(f"Indexed {len(assets)} UI assets in {self.static_folder}")
+
+    def compress_all(self):
+        """Creates (or loads from the disk cache) the compressed variants of every compressible asset."""
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        encoders = {'gzip': lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli:
+            encoders['br'] = lambda data: brotli.compress(data, quality=11)
+
+        for asset in list(self._assets.values()):
+            if not asset['compressible']:
+                continue
+            data = None
+            for encoding, compress in encoders.items():
+                cache_path = os.path.join(self.cache_dir, f"{asset['etag']}.{encoding}") if self.cache_dir else None
+                try:
+                    if cache_path and os.path.exists(cache_path):
+                        with open(cache_path, 'rb') as f:
+                            body = f.read()
+                    else:
+                        if data is None:
+                            with open(asset['path'], 'rb') as f:
+                                data = f.read()
+                        body = compress(data)
+                        if cache_path:
+                            with open(cache_path, 'wb') as f:
+                                f.write(body)
+                except OSError as e:
+                    logger.warning(f"Could not prepare {encoding} variant of {asset['path']}: {e}")
+                    continue
+                # Only worth sending if it actually saves bytes.
+                if len(body) < asset['size'] * 0.9:
+                    asset['variants'][encoding] = body
+
+        if self.cache_dir:
+            # Drop variants of assets that earlier builds of the UI had.
+            current = {asset['etag'] for asset in self._assets.values()}
+            for name in os.listdir(self.cache_dir):
+                if name.split('.')[0] not in current:
+                    try:
+                        os.remove(os.path.join(self.cache_dir, name))
+                    except OSError:
+                        pass
+
+    def _cache_control(self, asset: Dict[str, Any]) -> str:
+        if asset['immutable']:
+            return 'public, max-age=31536000, immutable'
+        # Stored, but revalidated with the ETag on every use.
+        return 'no-cache'
+
+    def _pick_encoding(self, asset: Dict[str, Any]) -> str | None:
+        """Picks the best precompressed variant the client accepts, preferring brotli."""
+        for encoding in ('br', 'gzip'):
+            if encoding in asset['variants'] and request.accept_encodings[encoding]:
+                return encoding
+        return None
+
+    def response(self, path: str):
+        """
+        Returns the response for a UI path. Unknown paths get index.html, so client-side
+        routes of the single-page app work on reload.
+        """
+        asset = self._assets.get(path) or self._assets.get('index.html')
+        if asset is None:
+            abort(404)
+
+        encoding = self._pick_encoding(asset)
+        if encoding:
+            response = Response(asset['variants'][encoding], mimetype=asset['mimetype'])
+            response.headers['Content-Encoding'] = encoding
+            # Each representation needs its own validator.
+            response.set_etag(f"{asset['etag']}-{encoding}")
+            response = response.make_conditional(request)
+        else:
+            response = send_file(asset['path'], mimetype=asset['mimetype'], etag=asset['etag'], conditional=True)
+        response.headers['Cache-Control'] = self._cache_control(asset)
+        if asset['compressible']:
+            response.vary.add('Accept-Encoding')
+        return response
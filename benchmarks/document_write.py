@@ -0,0 +1,107 @@
+# benchmarks/document_write.py
+"""
+Compares the CPU cost per GB of DocumentDownloader's disk write path against the
+previous 8 KB iter_content() loop. A local http.server in a separate process serves a
+generated file, so only the client's CPU time is measured.
+
+Usage:
+    python -m benchmarks.document_write [size_in_mb]
+"""
+
+import os
+import sys
+import time
+import socket
+import tempfile
+import subprocess
+import requests
+
+from app.Download.documents.documents import DocumentDownloader
+from tests.conftest import NullSocketIO
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def legacy_write(url, path):
+    """The write loop DocumentDownloader used before: 8 KB chunks and a percent per chunk."""
+    socketio = NullSocketIO()
+    with requests.get(url, stream=True) as r:
+        total_size = int(r.headers.get('content-length', 0))
+        downloaded = 0
+        with open(path, 'wb') as f:
+            for chunk in r.iter_content(chunk_size=8192):
+                f.write(chunk)
+                downloaded += len(chunk)
+                if total_size > 0:
+                    percent = (downloaded / total_size) * 100
+                    progress_line = (
+                        f"\r\033[K"
+                        f"\033[36mDownloading...\033[0m "
+                        f"{percent:>7.2f}% of {total_size / (1024 * 1024):.2f} MB"
+                    )
+                    socketio.emit('terminal_output', {'line': progress_line})
+
+
+def current_write(url, path):
+    """The preallocated, block-aligned write path."""
+    downloader = DocumentDownloader(NullSocketIO(), output_path=os.path.dirname(path))
+    with requests.get(url, stream=True) as r:
+        total_size = int(r.headers.get('content-length', 0))
+        downloader._stream_to_file(r, path, 0, total_size)
+
+
+def measure(label, fn, url, path, size_bytes, rounds=3):
+    """Runs `fn` a few times and prints the best CPU seconds per GB and wall-clock throughput."""
+    best_cpu, best_wall = float('inf'), float('inf')
+    for _ in range(rounds):
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        fn(url, path)
+        best_cpu = min(best_cpu, time.process_time() - cpu_start)
+        best_wall = min(best_wall, time.perf_counter() - wall_start)
+        assert os.path.getsize(path) == size_bytes
+        os.remove(path)
+    gb = size_bytes / (1024 ** 3)
+    print(f"{label:<10} {best_cpu / gb:8.2f} CPU-s/GB   {size_bytes / best_wall / (1024 ** 2):8.1f} MB/s")
+    return best_cpu / gb
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    size_bytes = size_mb * 1024 * 1024
+
+    with tempfile.TemporaryDirectory() as serve_dir, tempfile.TemporaryDirectory() as out_dir:
+        with open(os.path.join(serve_dir, 'payload.bin'), 'wb') as f:
+            block = os.urandom(1024 * 1024)
+            for _ in range(size_mb):
+                f.write(block)
+
+        port = _free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'http.server', str(port), '--bind', '127.0.0.1', '--directory', serve_dir],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            url = f"http://127.0.0.1:{port}/payload.bin"
+            for _ in range(50):
+                try:
+                    requests.head(url, timeout=1)
+                    break
+                except requests.ConnectionError:
+                    time.sleep(0.1)
+
+            out_path = os.path.join(out_dir, 'payload.bin')
+            print(f"Transferring {size_mb} MB over loopback (best of 3):")
+            legacy = measure('legacy', legacy_write, url, out_path, size_bytes)
+            current = measure('current', current_write, url, out_path, size_bytes)
+            print(f"CPU per GB reduced by {(1 - current / legacy) * 100:.0f}%")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
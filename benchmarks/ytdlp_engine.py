@@ -0,0 +1,127 @@
+# benchmarks/ytdlp_engine.py
+"""
+Compares the per-job setup latency of the yt-dlp downloaders with a pooled, warm
+YoutubeDL (YtDlpEngine) against building a new YoutubeDL for every job, as the
+downloaders did before.
+
+Two numbers per variant, both averaged over a series of jobs:
+  - setup: getting a YoutubeDL configured with a job's options (hooks, logger,
+    format selector, postprocessors), before any network traffic;
+  - job:   a complete small download of a direct media link through the generic
+    extractor, served by a local http.server in a separate process.
+
+Usage:
+    python -m benchmarks.ytdlp_engine [jobs]
+"""
+
+import os
+import sys
+import time
+import socket
+import tempfile
+import subprocess
+import statistics
+import requests
+import yt_dlp
+
+from app.Download.engine import YoutubeDLPool
+from app.Download.other_platforms.other_platforms import OtherPlatformsDownloader
+from tests.conftest import NullSocketIO
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _job_opts(downloader, out_dir, job_id):
+    """The options OtherPlatformsDownloader gives a job, built the same way for both variants."""
+    return {
+        'format': 'bestvideo+bestaudio/best',
+        'outtmpl': os.path.join(out_dir, f'%(title)s - {job_id}.%(ext)s'),
+        'merge_output_format': 'mp4',
+        'noplaylist': True,
+        'postprocessors': [{'key': 'FFmpegVideoRemuxer', 'preferedformat': 'mp4'}],
+        **downloader._job_opts(job_id),
+    }
+
+
+def legacy_setup(downloader, out_dir, job_id):
+    """A new YoutubeDL per job."""
+    with yt_dlp.YoutubeDL(_job_opts(downloader, out_dir, job_id)):
+        pass
+
+
+def pooled_setup(downloader, pool, out_dir, job_id):
+    """A warm YoutubeDL from the pool, reconfigured for the job."""
+    with pool.acquire(_job_opts(downloader, out_dir, job_id)):
+        pass
+
+
+def legacy_job(downloader, out_dir, job_id, url):
+    with yt_dlp.YoutubeDL(_job_opts(downloader, out_dir, job_id)) as ydl:
+        info = ydl.extract_info(url, download=False)
+        ydl.process_ie_result(info, download=True)
+
+
+def pooled_job(downloader, pool, out_dir, job_id, url):
+    with pool.acquire(_job_opts(downloader, out_dir, job_id)) as ydl:
+        info = ydl.extract_info(url, download=False)
+        ydl.process_ie_result(info, download=True)
+
+
+def measure(label, run, jobs):
+    """Calls `run(job_id)` once per job (after one warm-up) and prints the mean and median milliseconds."""
+    run('warmup')
+    timings = []
+    for i in range(jobs):
+        start = time.perf_counter()
+        run(f'job{i}')
+        timings.append((time.perf_counter() - start) * 1000)
+    mean, median = statistics.mean(timings), statistics.median(timings)
+    print(f"{label:<14} {mean:8.2f} ms mean   {median:8.2f} ms median")
+    return median
+
+
+def main():
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+
+    with tempfile.TemporaryDirectory() as serve_dir, tempfile.TemporaryDirectory() as out_dir:
+        with open(os.path.join(serve_dir, 'clip.mp4'), 'wb') as f:
+            f.write(os.urandom(64 * 1024))
+
+        port = _free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'http.server', str(port), '--bind', '127.0.0.1', '--directory', serve_dir],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            url = f"http://127.0.0.1:{port}/clip.mp4"
+            for _ in range(50):
+                try:
+                    requests.head(url, timeout=1)
+                    break
+                except requests.ConnectionError:
+                    time.sleep(0.1)
+
+            pool = YoutubeDLPool()
+            downloader = OtherPlatformsDownloader(NullSocketIO(), output_path=out_dir, ydl_pool=pool)
+
+            print(f"Per-job setup, {jobs} jobs (after one warm-up):")
+            legacy = measure('new YoutubeDL', lambda job_id: legacy_setup(downloader, out_dir, job_id), jobs)
+            pooled = measure('pooled', lambda job_id: pooled_setup(downloader, pool, out_dir, job_id), jobs)
+            print(f"Setup latency reduced by {(1 - pooled / legacy) * 100:.0f}%\n")
+
+            print(f"Whole small job (generic extractor, 64 KB over loopback), {jobs} jobs:")
+            legacy = measure('new YoutubeDL', lambda job_id: legacy_job(downloader, out_dir, job_id, url), jobs)
+            pooled = measure('pooled', lambda job_id: pooled_job(downloader, pool, out_dir, job_id, url), jobs)
+            print(f"Job latency reduced by {(1 - pooled / legacy) * 100:.0f}%")
+            pool.close()
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
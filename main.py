@@ -1,6 +1,6 @@
 import webview
 import threading
-from app.app import app, socketio
+from app.app import app, socketio, start_background_tasks
 
 
 def run_server():
@@ -8,6 +8,7 @@ def run_server():
 
 
 if __name__ == '__main__':
+    start_background_tasks()
     t = threading.Thread(target=run_server)
     t.daemon = True
     t.start()
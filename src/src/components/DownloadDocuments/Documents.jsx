@@ -13,6 +13,7 @@ const containerVariants = { hidden: { opacity: 0 }, visible: { opacity: 1, trans
 export default function DownloadDocuments() {
   const socket = useContext(SocketContext);
   const [url, setUrl] = useState('');
+  const [mirrors, setMirrors] = useState('');
   const [isRequesting, setIsRequesting] = useState(false);
   const [logs, setLogs] = useState([]);
 
@@ -40,7 +41,8 @@ export default function DownloadDocuments() {
     await fetch('/api/download/document', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ url })
+      // Other mirrors of the same file, one per line; the server downloads from the fastest ones at once
+      body: JSON.stringify({ url, mirrors: mirrors.split('\n').map(m => m.trim()).filter(Boolean) })
     });
   };
 
@@ -61,6 +63,13 @@ export default function DownloadDocuments() {
             placeholder="Manually paste any download link..."
             focusColor="focus:ring-gray-500 focus:border-gray-500"
           />
+          <textarea
+            value={mirrors}
+            onChange={(e) => setMirrors(e.target.value)}
+            placeholder="Other mirrors of the same file (optional, one link per line)"
+            rows={2}
+            className="w-full bg-gray-900/50 border border-gray-700 rounded-lg p-3 text-white placeholder-gray-500 focus:ring-2 focus:ring-gray-500 focus:border-gray-500 transition-all"
+          />
           <ActionButton
             onClick={handleDownload}
             disabled={!url || isRequesting}
@@ -21,6 +21,26 @@ const itemVariants = {
   exit: { opacity: 0, transition: { duration: 0.2 } },
 };
 
+// --- Media details from the server's probe cache (absent until the file has been probed) ---
+const formatDuration = (seconds) => {
+  const total = Math.round(seconds);
+  const h = Math.floor(total / 3600);
+  const m = Math.floor((total % 3600) / 60);
+  const s = String(total % 60).padStart(2, '0');
+  return h > 0 ? `${h}:${String(m).padStart(2, '0')}:${s}` : `${m}:${s}`;
+};
+
+const mediaSummary = (download) => {
+  const media = download.media;
+  if (!media) return download.size;
+  return [
+    media.duration && formatDuration(media.duration),
+    media.height && `${media.height}p`,
+    media.video_codec || media.audio_codec,
+    download.size,
+  ].filter(Boolean).join(' · ');
+};
+
 export default function Downloads() {
   // ==================================================================
   // --- YOUR EXISTING LOGIC - UNCHANGED ---
@@ -78,8 +98,13 @@ export default function Downloads() {
                       className={`group flex items-center justify-between p-4 bg-gray-800/50 border border-gray-700 rounded-xl cursor-pointer transition-all duration-300 ${theme.hoverBorder} hover:bg-gray-800`}
                     >
                       <div className="flex items-center gap-4 overflow-hidden">
-                        <span className={theme.color}>{theme.icon}</span>
-                        <p className="font-medium text-gray-200 truncate">{download.filename}</p>
+                        {download.media?.thumbnail
+                          ? <img src={`/api/downloads/thumbnail/${download.media.thumbnail}`} alt="" loading="lazy" className="w-20 h-12 object-cover rounded-md flex-shrink-0" />
+                          : <span className={theme.color}>{theme.icon}</span>}
+                        <div className="overflow-hidden">
+                          <p className="font-medium text-gray-200 truncate">{download.filename}</p>
+                          <p className="text-xs text-gray-500 truncate">{mediaSummary(download)}</p>
+                        </div>
                       </div>
                       <div className="flex items-center gap-2 text-gray-500 transition-all duration-300 opacity-0 group-hover:opacity-100 group-hover:text-white">
                         <span className="text-sm">Play</span>
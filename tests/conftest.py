@@ -0,0 +1,34 @@
+# tests/conftest.py
+
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+
+class NullSocketIO:
+    """Swallows emits, for downloaders run outside the app."""
+
+    def emit(self, *args, **kwargs):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    """
+    Starts local HTTP servers for a test. Yields serve(handler), which starts one with
+    the given request handler and returns its base URL; all of them stop after the test.
+    """
+    servers = []
+
+    def serve(handler):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield serve
+    for server in servers:
+        server.shutdown()
+        server.server_close()
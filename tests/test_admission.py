@@ -0,0 +1,95 @@
+# tests/test_admission.py
+
+import os
+import shutil
+import threading
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from app.Download.admission import DiskAdmission, InsufficientDiskSpaceError
+from app.Download.documents.documents import DocumentDownloader
+from tests.conftest import NullSocketIO
+
+GB = 1024 ** 3
+FILE_SIZE = 256 * 1024
+DiskUsage = namedtuple('DiskUsage', 'total used free')
+
+
+@pytest.fixture
+def free_space(monkeypatch):
+    """Pretends the disk has 10 GB free."""
+    monkeypatch.setattr(shutil, 'disk_usage', lambda path: DiskUsage(20 * GB, 10 * GB, 10 * GB))
+
+
+class _Journal:
+    def __init__(self, **jobs):
+        self.jobs = jobs
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+
+def test_reservations_count_against_the_free_space(tmp_path, free_space):
+    admission = DiskAdmission(tmp_path, safety_margin=0, poll_interval=0.05)
+    first = admission.reserve('a', 6 * GB)
+    waits = []
+    reserved = []
+    waiter = threading.Thread(target=lambda: reserved.append(
+        admission.reserve('b', 6 * GB, on_wait=lambda *args: waits.append(args))))
+    waiter.start()
+
+    waiter.join(0.3)
+    assert not reserved
+    assert waits == [(6 * GB, 4 * GB)]
+    admission.release(first)
+    waiter.join(5)
+    assert reserved and reserved[0] != first
+    admission.release(first)  # Releasing twice is harmless
+    assert list(admission._reservations) == reserved
+
+
+def test_a_job_that_can_never_fit_is_rejected(tmp_path, free_space):
+    admission = DiskAdmission(tmp_path, safety_margin=GB)
+    admission.reserve('a', 5 * GB)
+
+    with pytest.raises(InsufficientDiskSpaceError):
+        admission.reserve('b', 10 * GB)
+
+
+def test_written_bytes_no_longer_count_as_owed(tmp_path, free_space):
+    admission = DiskAdmission(tmp_path, job_store=_Journal(a={'downloaded': 4 * GB}), safety_margin=0)
+    admission.reserve('a', 8 * GB)
+
+    assert admission._budget() == (6 * GB, 10 * GB)
+
+
+@pytest.mark.parametrize('preallocates', [True, False])
+def test_a_document_holds_its_space_until_it_is_on_disk(tmp_path, http_server, monkeypatch, preallocates):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', str(FILE_SIZE))
+            self.end_headers()
+            self.wfile.write(b'x' * FILE_SIZE)
+
+        def log_message(self, *args):
+            pass
+
+    class Admission(DiskAdmission):
+        def release(self, token):
+            if token in self._reservations:
+                released.append(os.path.getsize(tmp_path / 'file.bin.part'))
+            super().release(token)
+
+    released = []
+    downloader = DocumentDownloader(NullSocketIO(), str(tmp_path), disk_admission=Admission(tmp_path, safety_margin=0))
+    if not preallocates:
+        monkeypatch.setattr(downloader, '_preallocate', lambda fd, size: False)
+
+    result = downloader.download_document(f"{http_server(Handler)}/file.bin", job_id='job')
+
+    assert result['status'] == 'success'
+    # A preallocated file claims its space at once; otherwise the reservation lasts until it is written.
+    assert released == [FILE_SIZE]
@@ -0,0 +1,106 @@
+# tests/test_control.py
+
+import os
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from app.Download.control import JobControl, DownloadInterrupted
+from app.Download.engine import YtDlpEngine
+from app.Download.jobs import JobStore
+from tests.conftest import NullSocketIO
+
+ITEM_SIZE = 64 * 1024
+
+
+@pytest.fixture
+def playlist_server(http_server):
+    """Serves a.mp4 at once, and b.mp4 slowly after asking the job to cancel."""
+    job_control = JobControl()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'video/mp4')
+            self.send_header('Content-Length', str(ITEM_SIZE))
+            self.end_headers()
+            if self.path == '/a.mp4':
+                self.wfile.write(b'a' * ITEM_SIZE)
+                return
+            job_control.request('job', JobControl.CANCEL)
+            try:
+                for _ in range(ITEM_SIZE // 1024):
+                    self.wfile.write(b'b' * 1024)
+                    self.wfile.flush()
+                    time.sleep(0.01)
+            except OSError:
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    return http_server(Handler), job_control
+
+
+def _playlist(base_url):
+    return {
+        '_type': 'playlist', 'id': 'pl', 'title': 'pl',
+        'extractor': 'generic', 'extractor_key': 'Generic', 'webpage_url': f"{base_url}/pl",
+        'webpage_url_basename': 'pl', 'webpage_url_domain': '127.0.0.1',
+        'entries': [
+            {'id': name, 'title': name, 'url': f"{base_url}/{name}.mp4", 'ext': 'mp4'} for name in ('a', 'b')
+        ],
+    }
+
+
+def test_cancel_keeps_finished_playlist_items(tmp_path, playlist_server):
+    base_url, job_control = playlist_server
+    engine = YtDlpEngine(NullSocketIO(), str(tmp_path), job_control=job_control)
+    opts = {
+        'outtmpl': f"{tmp_path}/%(id)s.%(ext)s",
+        'quiet': True,
+        'ratelimit': 256 * 1024,
+        **engine._job_opts('job'),
+    }
+
+    with pytest.raises(DownloadInterrupted), engine.ydl_pool.acquire(opts) as ydl:
+        ydl.process_ie_result(_playlist(base_url), download=True)
+    job_control.discard_partials('job')
+
+    assert os.path.getsize(tmp_path / 'a.mp4') == ITEM_SIZE
+    assert not os.path.exists(tmp_path / 'b.mp4.part')
+    assert not os.path.exists(tmp_path / 'b.mp4')
+
+
+def test_cancel_discards_the_item_in_progress(tmp_path):
+    job_control = JobControl()
+    part = tmp_path / 'b.mp4.part'
+    part.write_bytes(b'b')
+    (tmp_path / 'b.mp4.ytdl').write_bytes(b'{}')
+
+    job_control.on_progress('job', {'status': 'downloading', 'filename': str(tmp_path / 'b.mp4'),
+                                    'tmpfilename': str(part)})
+
+    assert job_control.discard_partials('job') == 2
+    assert not os.listdir(tmp_path)
+
+
+def test_a_paused_job_journals_its_partials(tmp_path):
+    job_control = JobControl()
+    job_store = JobStore(tmp_path / 'jobs.db')
+    job_id = job_store.submit('document', {})
+    part = tmp_path / 'file.bin.part'
+    part.write_bytes(b'x')
+    (tmp_path / 'file.bin.part.ranges').write_bytes(b'{}')
+    job_control.track(job_id, part)
+    job_control.track(job_id, f"{part}.ranges")
+    job_store.mark_paused(job_id, job_control.partials(job_id))
+
+    # After a restart, the partials are only known from the journal.
+    restarted = JobControl()
+    for path in JobStore(tmp_path / 'jobs.db').get(job_id)['partials']:
+        restarted.track(job_id, path)
+
+    assert restarted.discard_partials(job_id) == 2
+    assert not [path for path in os.listdir(tmp_path) if not path.startswith('jobs.db')]
@@ -0,0 +1,88 @@
+# tests/test_documents.py
+
+import time
+import threading
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from app.Download.control import JobControl
+from app.Download.documents.documents import DocumentDownloader
+from tests.conftest import NullSocketIO
+
+FILE_SIZE = 1024 * 1024
+
+
+@pytest.fixture(params=['HTTP/1.0', 'HTTP/1.1'])
+def stalled_server(request, http_server):
+    """Sends the start of a file, then stalls until the test is over."""
+    done = threading.Event()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = request.param
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', str(FILE_SIZE))
+            self.end_headers()
+            self.wfile.write(b'x' * 4096)
+            self.wfile.flush()
+            done.wait(30)
+
+        def log_message(self, *args):
+            pass
+
+    yield f"{http_server(Handler)}/stalled.bin"
+    done.set()
+
+
+@pytest.mark.parametrize('action, status', [(JobControl.CANCEL, 'cancelled'), (JobControl.PAUSE, 'paused')])
+def test_stop_aborts_a_stalled_read(tmp_path, stalled_server, action, status):
+    job_control = JobControl()
+    downloader = DocumentDownloader(NullSocketIO(), str(tmp_path), job_control=job_control)
+    threading.Timer(0.5, job_control.request, args=('job', action)).start()
+
+    started = time.monotonic()
+    result = downloader.download_document(stalled_server, job_id='job')
+
+    assert result['status'] == status
+    assert time.monotonic() - started < 5
+
+
+def _range_handler(done):
+    """Answers range requests with the start of the range, then stalls until `done` is set."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            start, end = (int(x) for x in self.headers['Range'].split('=')[1].split('-'))
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{end}/{FILE_SIZE}")
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+            self.wfile.write(b'x' * min(end - start + 1, 4096))
+            self.wfile.flush()
+            if end > start:
+                done.wait(30)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def test_stop_aborts_stalled_mirrors(tmp_path, http_server):
+    done = threading.Event()
+    urls = [f"{http_server(_range_handler(done))}/stalled.bin" for _ in range(2)]
+    job_control = JobControl()
+    downloader = DocumentDownloader(NullSocketIO(), str(tmp_path), job_control=job_control)
+    threading.Timer(1, job_control.request, args=('job', JobControl.CANCEL)).start()
+
+    try:
+        started = time.monotonic()
+        result = downloader.download_document(urls[0], job_id='job', mirrors=urls[1:])
+        assert result['status'] == 'cancelled'
+        assert time.monotonic() - started < 5
+    finally:
+        done.set()
@@ -0,0 +1,71 @@
+# tests/test_emitter.py
+
+import threading
+
+from app.Download.emitter import SocketIOEmitter
+from app.Download.task_logs import TaskLogStore
+
+
+class _BlockedSocketIO:
+    """Records emits, holding up the sender thread on the first one until released."""
+
+    def __init__(self):
+        self.sent = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def emit(self, event, data=None, **kwargs):
+        self.started.set()
+        self.release.wait(5)
+        self.sent.append((event, data, kwargs))
+
+
+def _lines(socketio):
+    return [data['line'] for event, data, _ in socketio.sent if event == 'terminal_output']
+
+
+def _blocked_emitter(**kwargs):
+    socketio = _BlockedSocketIO()
+    emitter = SocketIOEmitter(socketio, **kwargs)
+    emitter.emit('terminal_output', {'line': 'first'})
+    socketio.started.wait(5)
+    return socketio, emitter
+
+
+def test_progress_lines_merge_per_job():
+    socketio, emitter = _blocked_emitter()
+    for percent in (10, 20):
+        emitter.emit('terminal_output', {'job_id': 'a', 'line': f"\r{percent}%"})
+        emitter.emit('terminal_output', {'job_id': 'b', 'line': f"\r{percent}%"})
+        emitter.emit('terminal_output', {'line': f"\r{percent}% of an untagged job"})
+    socketio.release.set()
+    emitter.close(5)
+
+    assert _lines(socketio) == ['first', '\r20%', '\r20%', '\r10% of an untagged job', '\r20% of an untagged job']
+    assert [data.get('job_id') for _, data, _ in socketio.sent[1:3]] == ['a', 'b']
+
+
+def test_a_full_queue_drops_log_lines_but_not_events():
+    socketio, emitter = _blocked_emitter(max_queue=2)
+    for n in range(4):
+        emitter.emit('terminal_output', {'line': f"line {n}"})
+    emitter.emit('download_complete', {'filename': 'x.mp4'})
+    socketio.release.set()
+    emitter.close(5)
+
+    assert _lines(socketio) == ['first', 'line 0', 'line 1', '\033[93m[2 log lines dropped: client too slow]\033[0m']
+    assert ('download_complete', {'filename': 'x.mp4'}, {}) in socketio.sent
+
+
+def test_job_lines_go_to_the_job_log_and_rooms():
+    socketio = _BlockedSocketIO()
+    socketio.release.set()
+    task_logs = TaskLogStore()
+    emitter = SocketIOEmitter(socketio, task_logs=task_logs)
+    emitter.emit('terminal_output', {'job_id': 'a', 'line': 'hello'})
+    emitter.close(5)
+
+    [(event, data, kwargs)] = socketio.sent
+    assert data == {'job_id': 'a', 'line': 'hello', 'offset': 0}
+    assert kwargs['to'] == ['job:a', SocketIOEmitter.FIREHOSE_ROOM]
+    assert task_logs.fetch('a')['lines'] == ['hello']
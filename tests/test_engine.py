@@ -0,0 +1,100 @@
+# tests/test_engine.py
+
+import os
+import hashlib
+from functools import partial
+from http.server import SimpleHTTPRequestHandler
+
+import pytest
+import yt_dlp
+
+from app.Download.engine import YoutubeDLPool, _reuse_supported
+from app.Download.fragments import FragmentTuner
+from app.Download.other_platforms.other_platforms import OtherPlatformsDownloader
+from tests.conftest import NullSocketIO
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def media_server(tmp_path, http_server):
+    """Serves two small clips over http.server; yields (base URL, clip folder)."""
+    serve_dir = tmp_path / 'serve'
+    serve_dir.mkdir()
+    for name in ('one.mp4', 'two.mp4'):
+        (serve_dir / name).write_bytes(os.urandom(64 * 1024))
+    return http_server(partial(_QuietHandler, directory=str(serve_dir))), serve_dir
+
+
+def _idle_instances(pool):
+    return [ydl for _, ydl in pool._idle.values()]
+
+
+def test_fragment_tuning_reaches_a_reused_instance():
+    pool = YoutubeDLPool()
+    with pool.acquire({'quiet': True}) as first:
+        pass
+
+    tuner = FragmentTuner(initial=4, window=0)
+    session = tuner.session('https://media.example.com/stream.m3u8')
+    opts = {'quiet': True, **session.ydl_opts()}
+    session.bind(opts)
+    with pool.acquire(opts) as ydl:
+        assert ydl is first
+        for downloaded in (0, 1024 * 1024):
+            session.on_progress({'status': 'downloading', 'fragment_count': 10, 'filename': 'x.mp4',
+                                 'downloaded_bytes': downloaded})
+        assert session.concurrency == 5
+        assert ydl.params['concurrent_fragment_downloads'] == 5
+    pool.close()
+
+
+def test_a_job_runs_twice_on_one_pooled_instance(tmp_path, media_server):
+    base_url, serve_dir = media_server
+    pool = YoutubeDLPool()
+    downloader = OtherPlatformsDownloader(NullSocketIO(), output_path=str(tmp_path / 'out'), ydl_pool=pool)
+    digest = hashlib.sha256((serve_dir / 'one.mp4').read_bytes()).hexdigest()
+
+    first = downloader.download_media(f"{base_url}/one.mp4", job_id='job1', checksum=f"sha256:{digest}")
+    assert first['status'] == 'success'
+    assert first['digest'] == f"sha256:{digest}"
+    [instance] = _idle_instances(pool)
+
+    # The first job's checksum postprocessor must not carry over: it would reject this file.
+    second = downloader.download_media(f"{base_url}/two.mp4", job_id='job2')
+    assert second['status'] == 'success'
+    assert second['digest'] is None
+    assert _idle_instances(pool) == [instance]
+    assert (tmp_path / 'out' / second['filename']).read_bytes() == (serve_dir / 'two.mp4').read_bytes()
+    pool.close()
+
+
+def test_download_archive_jobs_get_a_new_instance(tmp_path):
+    pool = YoutubeDLPool()
+    with pool.acquire({'quiet': True}) as pooled:
+        pass
+
+    archive = tmp_path / 'archive.txt'
+    archive.write_text('generic clip\n')
+    with pool.acquire({'quiet': True, 'download_archive': str(archive)}) as ydl:
+        assert ydl is not pooled
+        assert ydl.in_download_archive({'id': 'clip', 'extractor_key': 'Generic'})
+    assert _idle_instances(pool) == [pooled]
+    pool.close()
+
+
+def test_reuse_is_checked_against_a_new_instance(monkeypatch):
+    assert _reuse_supported.__wrapped__()
+
+    # A release whose YoutubeDL.__init__ derives more state from the options than _reconfigure redoes
+    init = yt_dlp.YoutubeDL.__init__
+
+    def patched_init(self, params=None, *args, **kwargs):
+        init(self, params, *args, **kwargs)
+        self._output_dir = os.path.dirname(self.params.get('outtmpl', {}).get('default', ''))
+
+    monkeypatch.setattr(yt_dlp.YoutubeDL, '__init__', patched_init)
+    assert not _reuse_supported.__wrapped__()
@@ -0,0 +1,35 @@
+# tests/test_fragments.py
+
+from app.Download.fragments import FragmentTuner
+
+URL = 'https://www.media.example.com/stream.m3u8'
+
+
+def test_concurrency_grows_until_the_speed_drops():
+    tuner = FragmentTuner(initial=4, maximum=6)
+    session = tuner.session(URL)
+    assert session.concurrency == 4
+
+    assert tuner._adjust(session.key, 4, speed=10.0, errors=0) == 5
+    assert tuner._adjust(session.key, 5, speed=12.0, errors=0) == 6
+    assert tuner._adjust(session.key, 6, speed=20.0, errors=0) == 6
+    assert tuner._adjust(session.key, 6, speed=15.0, errors=0) == 5
+    # The next job on the same host starts where the last one left off.
+    assert tuner.session('https://media.example.com/other.m3u8').concurrency == 5
+
+
+def test_retries_halve_the_concurrency():
+    tuner = FragmentTuner(initial=8)
+    session = tuner.session(URL)
+
+    assert tuner._adjust(session.key, 8, speed=10.0, errors=2) == 4
+    assert tuner._adjust(session.key, 4, speed=1.0, errors=0) == 5
+    assert tuner._adjust(session.key, 1, speed=0.0, errors=1) == 1
+
+
+def test_fixed_fragments_stay_within_bounds():
+    tuner = FragmentTuner(minimum=1, maximum=16)
+
+    assert tuner.session(URL, fragments='3').concurrency == 3
+    assert tuner.session(URL, fragments=100000).concurrency == 16
+    assert not tuner.session(URL, fragments=3).auto
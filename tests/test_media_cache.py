@@ -0,0 +1,72 @@
+# tests/test_media_cache.py
+
+import os
+import json
+
+import pytest
+
+from app.Download.media_cache import MediaProbeCache
+
+MEDIA = {'duration': 1.0, 'width': None, 'height': None, 'video_codec': None, 'audio_codec': 'opus', 'bit_rate': None}
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for name in ('a.opus', 'b.opus', 'c.opus'):
+        path = tmp_path / name
+        path.write_bytes(name.encode())
+        paths.append(str(path))
+    return paths
+
+
+def _cache(tmp_path, **kwargs):
+    cache = MediaProbeCache(tmp_path / 'cache', **kwargs)
+    cache.ffmpeg = None
+    cache._run_ffprobe = lambda path: MEDIA
+    return cache
+
+
+def _probe(cache, path):
+    cache._probe(path, cache.key(path, os.stat(path)))
+
+
+def _saved_keys(tmp_path):
+    with open(tmp_path / 'cache' / MediaProbeCache.INDEX_FILE, encoding='utf-8') as f:
+        return [key for key, _ in json.load(f)]
+
+
+def test_lookups_are_saved_in_lru_order(tmp_path, files):
+    cache = _cache(tmp_path)
+    for path in files:
+        _probe(cache, path)
+    keys = [cache.key(path, os.stat(path)) for path in files]
+    assert _saved_keys(tmp_path) == keys
+
+    assert cache.lookup(files[0]) == {**MEDIA, 'thumbnail': None}
+    cache.save_soon()
+    cache._executor.shutdown(wait=True)
+
+    assert _saved_keys(tmp_path) == keys[1:] + keys[:1]
+    assert list(_cache(tmp_path)._entries) == keys[1:] + keys[:1]
+
+
+def test_the_least_recently_used_entries_are_evicted(tmp_path, files):
+    cache = _cache(tmp_path, max_bytes=1024)
+    _probe(cache, files[0])
+    _probe(cache, files[1])
+    cache.lookup(files[0])
+    _probe(cache, files[2])
+
+    assert cache.lookup(files[1]) is None
+    assert cache.lookup(files[0]) is not None
+    assert cache.lookup(files[2]) is not None
+
+
+def test_a_modified_file_is_probed_again(tmp_path, files):
+    cache = _cache(tmp_path)
+    _probe(cache, files[0])
+    with open(files[0], 'ab') as f:
+        f.write(b'more')
+
+    assert cache.lookup(files[0]) is None
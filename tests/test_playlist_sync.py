@@ -0,0 +1,101 @@
+# tests/test_playlist_sync.py
+
+import pytest
+
+from app.Download.playlist.playlist import PlaylistDownloader
+from app.Download.playlist.sync_state import PlaylistSyncState
+from tests.conftest import NullSocketIO
+
+CHANNEL = 'https://www.youtube.com/@channel/videos'
+PLAYLIST = 'https://www.youtube.com/playlist?list=PL1'
+
+
+class _Listing:
+    """Stands in for a YoutubeDL: a flat listing whose entries are produced lazily, like yt-dlp's."""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.walked = []
+
+    def _walk(self):
+        for entry in self.entries:
+            self.walked.append(entry['id'])
+            yield entry
+
+    def extract_info(self, url, download=False, process=True):
+        return {'_type': 'playlist', 'id': 'pl', 'entries': self._walk()}
+
+
+def _entries(*dated_ids):
+    return [{'id': video_id, 'upload_date': date} for video_id, date in dated_ids]
+
+
+@pytest.fixture
+def downloader():
+    return PlaylistDownloader(NullSocketIO())
+
+
+def _ids(entries):
+    return [entry['id'] for entry in entries]
+
+
+def test_a_channel_walk_stops_after_a_run_of_known_entries(downloader):
+    listing = _Listing(_entries(*((f"v{n}", None) for n in range(20))))
+    known = {f"v{n}" for n in range(2, 20)}
+
+    _, new, scanned, gone = downloader._find_new_entries(listing, CHANNEL, known, None)
+
+    assert _ids(new) == ['v0', 'v1']
+    assert scanned == 2 + PlaylistDownloader.KNOWN_STREAK_TO_STOP
+    assert listing.walked == [f"v{n}" for n in range(scanned)]
+    assert not gone
+
+
+def test_a_newest_first_walk_stops_at_the_newest_upload_we_have(downloader):
+    # Dates going backwards mark the listing as newest-first, even without a channel URL.
+    listing = _Listing(_entries(('new', '20260103'), ('newer', '20260102'), ('old', '20251231'), ('older', '20251230')))
+
+    _, new, scanned, _ = downloader._find_new_entries(listing, PLAYLIST, set(), '20260101')
+
+    assert _ids(new) == ['new', 'newer']
+    assert scanned == 3
+
+
+def test_a_walk_goes_on_until_it_passes_failed_entries(downloader):
+    listing = _Listing(_entries(('new', '20260103'), ('old', '20251231'), ('failed', '20251230'), ('oldest', '20251229')))
+
+    _, new, scanned, gone = downloader._find_new_entries(listing, CHANNEL, set(), '20260101', retry={'failed'})
+
+    assert _ids(new) == ['new', 'failed']
+    assert scanned == 4
+    assert not gone
+
+
+def test_failed_entries_no_longer_listed_are_reported_gone(downloader):
+    listing = _Listing(_entries(('a', None), ('b', None)))
+
+    _, new, scanned, gone = downloader._find_new_entries(listing, PLAYLIST, {'a'}, None, retry={'removed'})
+
+    assert _ids(new) == ['b']
+    assert gone == {'removed'}
+
+
+def test_sync_state_tracks_downloads_and_failures(tmp_path):
+    state = PlaylistSyncState(tmp_path / 'sync.db')
+    state.register(CHANNEL, '1080p', 'mp4')
+    state.mark_downloaded(CHANNEL, 'a', '20260101')
+    state.mark_failed(CHANNEL, 'b')
+    state.mark_failed(CHANNEL, 'b')
+    state.mark_failed(CHANNEL, 'c')
+    state.mark_downloaded(CHANNEL, 'c')
+
+    assert state.known_ids(CHANNEL) == {'a', 'c'}
+    assert state.failed_items(CHANNEL) == {'b': 2}
+    state.forget(CHANNEL, ['b', 'a'])
+    assert state.failed_items(CHANNEL) == {}
+    assert state.known_ids(CHANNEL) == {'a', 'c'}
+
+    state.finish_sync(CHANNEL, 'UC1', 'Channel', '20260101')
+    state.finish_sync(CHANNEL, None, None, None)
+    [playlist] = state.list_playlists()
+    assert (playlist['title'], playlist['newest_upload_date'], playlist['items_downloaded']) == ('Channel', '20260101', 2)
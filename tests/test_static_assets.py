@@ -0,0 +1,63 @@
+# tests/test_static_assets.py
+
+import gzip
+
+import pytest
+from flask import Flask
+
+from app.static_assets import StaticAssetIndex
+
+INDEX = b'<!doctype html><script type="module" src="/assets/app-1a2b3c4d.js"></script>' + b' ' * 4096
+BUNDLE = b'console.log("lawran");\n' * 512
+
+
+@pytest.fixture
+def assets(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'assets').mkdir(parents=True)
+    (static / 'index.html').write_bytes(INDEX)
+    (static / 'assets' / 'app-1a2b3c4d.js').write_bytes(BUNDLE)
+    (static / 'favicon.png').write_bytes(b'\x89PNG' * 512)
+    index = StaticAssetIndex(static, cache_dir=tmp_path / 'cache')
+    index.build()
+    index.compress_all()
+    return index
+
+
+def _get(index, path, **headers):
+    with Flask(__name__).test_request_context(f"/{path}", headers=headers):
+        response = index.response(path)
+        response.direct_passthrough = False
+        return response
+
+
+def test_hashed_bundles_are_immutable_and_precompressed(assets):
+    response = _get(assets, 'assets/app-1a2b3c4d.js', **{'Accept-Encoding': 'gzip'})
+
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert response.headers['Content-Type'].startswith('text/javascript')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.get_data()) == BUNDLE
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+
+def test_unknown_paths_get_a_revalidated_index(assets):
+    response = _get(assets, 'downloads/settings')
+
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_data() == INDEX
+    assert _get(assets, 'index.html', **{'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_compressed_variants_are_cached_by_content(tmp_path, assets):
+    cached = sorted(path.name for path in (tmp_path / 'cache').iterdir())
+    assert all(name.endswith(('.gzip', '.br')) for name in cached)
+    # Images aren't compressed; the two text files are.
+    assert len({name.split('.')[0] for name in cached}) == 2
+
+    (tmp_path / 'cache' / cached[0]).write_bytes(b'from the cache')
+    again = StaticAssetIndex(tmp_path / 'static', cache_dir=tmp_path / 'cache')
+    again.build()
+    again.compress_all()
+    assert b'from the cache' in [variant for asset in again._assets.values() for variant in asset['variants'].values()]
@@ -0,0 +1,47 @@
+# tests/test_task_logs.py
+
+import os
+import time
+
+from app.Download.task_logs import TaskLogStore
+
+
+def test_offsets_continue_across_a_restart(tmp_path):
+    logs = TaskLogStore(capacity=3, spill_dir=tmp_path)
+    assert [logs.append('job', line) for line in ('start', '\r 10%', '\r 50%', '\r100%', 'done')] == [0, 1, 1, 1, 2]
+    logs.flush()
+
+    restarted = TaskLogStore(capacity=3, spill_dir=tmp_path)
+    # Before the job runs again, its log is served from the spill file.
+    assert restarted.fetch('job')['lines'] == ['start', '\r100%', 'done']
+    restarted.prepare('job')
+    assert restarted.append('job', 'resumed') == 3
+    assert restarted.append('job', 'again') == 4
+    restarted.flush()
+
+    page = restarted.fetch('job', offset=1, limit=3)
+    assert page['lines'] == ['\r100%', 'done', 'resumed']
+    assert (page['offset'], page['next_offset'], page['truncated']) == (1, 4, False)
+
+
+def test_lines_that_left_memory_come_from_disk(tmp_path):
+    logs = TaskLogStore(capacity=2, spill_dir=tmp_path)
+    for n in range(5):
+        logs.append('job', f"line {n}")
+
+    assert logs.fetch('job', offset=1)['lines'] == [f"line {n}" for n in range(1, 5)]
+    assert TaskLogStore(capacity=2).fetch('job') == {'lines': [], 'offset': 0, 'next_offset': 0, 'truncated': False}
+
+
+def test_old_spill_files_are_deleted(tmp_path):
+    for job_id in ('old', 'recent'):
+        (tmp_path / f"{job_id}.log").write_text('"line"\n')
+    week_ago = time.time() - 7 * 24 * 3600
+    os.utime(tmp_path / 'old.log', (week_ago, week_ago))
+
+    TaskLogStore(spill_dir=tmp_path, max_age=24 * 3600)
+
+    deadline = time.monotonic() + 5
+    while (tmp_path / 'old.log').exists() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert sorted(os.listdir(tmp_path)) == ['recent.log']
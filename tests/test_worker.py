@@ -0,0 +1,178 @@
+# tests/test_worker.py
+
+import os
+import sys
+import time
+import signal
+import socket
+import subprocess
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+from app.Download.jobs import JobStore
+from app.Download.worker import Worker, SCRATCH_DIR
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FILE_SIZE = 12 * 1024 * 1024
+# The file's bytes, so a download resumed by another worker can be checked byte for byte.
+CONTENT = bytes(range(256)) * (FILE_SIZE // 256)
+LEASE_SECONDS = 3
+# Runs the app as a coordinator the way app.py does, minus the debug reloader.
+COORDINATOR = (
+    "import sys\n"
+    "from app.app import app, socketio, start_background_tasks\n"
+    "start_background_tasks()\n"
+    "socketio.run(app, host='127.0.0.1', port=int(sys.argv[1]), allow_unsafe_werkzeug=True)\n"
+)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(predicate, timeout, interval=0.2):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if result := predicate():
+            return result
+        time.sleep(interval)
+    raise AssertionError(f"Timed out after {timeout}s")
+
+
+@pytest.fixture
+def slow_file_server(http_server):
+    """
+    Serves CONTENT at about 2 MB/s with range support, so a download is still running
+    when its worker is stopped, and the next worker can resume it.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            start = int(self.headers['Range'].split('=')[1].split('-')[0]) if 'Range' in self.headers else 0
+            self.send_response(206 if start else 200)
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(FILE_SIZE - start))
+            if start:
+                self.send_header('Content-Range', f"bytes {start}-{FILE_SIZE - 1}/{FILE_SIZE}")
+            self.end_headers()
+            try:
+                for pos in range(start, FILE_SIZE, 64 * 1024):
+                    self.wfile.write(CONTENT[pos:pos + 64 * 1024])
+                    time.sleep(0.03)
+            except OSError:
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    return f"{http_server(Handler)}/big.bin"
+
+
+@pytest.fixture
+def cluster(tmp_path):
+    """
+    Starts a coordinator with HOME in `tmp_path`. Yields (base URL, start_worker), where
+    start_worker(worker_id, *args) starts a worker.py process with the extra arguments.
+    """
+    processes = []
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = {**os.environ, 'HOME': str(tmp_path), 'LAWRAN_COORDINATOR': '1',
+           'LAWRAN_LEASE_SECONDS': str(LEASE_SECONDS), 'PYTHONPATH': REPO_ROOT}
+    env.pop('LAWRAN_WORKER_TOKEN', None)
+
+    def start(args, log_name):
+        process = subprocess.Popen([sys.executable, *args], cwd=REPO_ROOT, env=env,
+                                   stdout=open(tmp_path / log_name, 'wb'), stderr=subprocess.STDOUT)
+        processes.append(process)
+        return process
+
+    def start_worker(worker_id, *args):
+        return start(['worker.py', base_url, '--id', worker_id, *args], f"{worker_id}.log")
+
+    def coordinator_up():
+        try:
+            return requests.get(f"{base_url}/api/jobs", timeout=1).ok
+        except requests.RequestException:
+            return False
+
+    start(['-c', COORDINATOR, str(port)], 'coordinator.log')
+    try:
+        _wait_for(coordinator_up, 30)
+        yield base_url, start_worker
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+
+
+def _job_poller(base_url, job_id):
+    return lambda: requests.get(f"{base_url}/api/jobs/{job_id}", timeout=5).json()
+
+
+def test_killed_worker_job_is_reassigned(tmp_path, slow_file_server, cluster):
+    base_url, start_worker = cluster
+    workers = {worker_id: start_worker(worker_id, '--output', str(tmp_path / worker_id)) for worker_id in ('w1', 'w2')}
+
+    job_id = requests.post(f"{base_url}/api/download/document", json={'url': slow_file_server}).json()['job_id']
+    job = _job_poller(base_url, job_id)
+    first = _wait_for(lambda: (j := job())['status'] == 'running' and j['worker_id'], 30)
+    time.sleep(1)
+    workers[first].send_signal(signal.SIGKILL)
+    workers[first].wait()
+
+    finished = _wait_for(lambda: (j := job())['status'] in ('completed', 'failed') and j, 60)
+    assert finished['status'] == 'completed'
+    assert finished['worker_id'] == ({'w1', 'w2'} - {first}).pop()
+    assert finished['attempts'] == 2
+    assert (tmp_path / 'Downloads' / 'Lawran IDM' / 'big.bin').read_bytes() == CONTENT
+
+
+def test_lost_lease_keeps_shared_partials(tmp_path, slow_file_server, cluster):
+    base_url, start_worker = cluster
+    downloads = tmp_path / 'Downloads' / 'Lawran IDM'
+    workers = {worker_id: start_worker(worker_id, '--output', str(downloads), '--shared') for worker_id in ('w1', 'w2')}
+
+    job_id = requests.post(f"{base_url}/api/download/document", json={'url': slow_file_server}).json()['job_id']
+    job = _job_poller(base_url, job_id)
+    # Suspend the worker once it has journaled some progress, until the job is resumed by the other one.
+    first = _wait_for(lambda: (j := job())['status'] == 'running' and j['downloaded'] and j['worker_id'], 30)
+    workers[first].send_signal(signal.SIGSTOP)
+    second = ({'w1', 'w2'} - {first}).pop()
+    _wait_for(lambda: job()['worker_id'] == second, 30)
+    # The first worker wakes up without its lease; the '.part' file the second one writes must stay.
+    workers[first].send_signal(signal.SIGCONT)
+
+    finished = _wait_for(lambda: (j := job())['status'] in ('completed', 'failed') and j, 60)
+    assert finished['status'] == 'completed', finished.get('error')
+    assert finished['worker_id'] == second
+    assert (downloads / 'big.bin').read_bytes() == CONTENT
+    assert workers[first].poll() is None
+
+
+def test_worker_only_keeps_its_own_scratch_folders(tmp_path):
+    (tmp_path / 'Photos').mkdir()
+    (tmp_path / SCRATCH_DIR / 'job1').mkdir(parents=True)
+
+    worker = Worker('http://127.0.0.1:9', str(tmp_path), worker_id='w1')
+    worker._discard_scratch(['Photos', 'job1'])
+    worker.emitter.close()
+
+    assert (tmp_path / 'Photos').is_dir()
+    assert not (tmp_path / SCRATCH_DIR / 'job1').exists()
+
+
+def test_stale_scratch(tmp_path):
+    job_store = JobStore(tmp_path / 'jobs.db')
+    ended, paused, elsewhere, here = (job_store.submit('document', {}) for _ in range(4))
+    job_store.mark_completed(ended)
+    job_store.mark_paused(paused)
+    job_store.lease('w2', ['document'], 30)  # elsewhere, the oldest queued job
+    job_store.lease('w1', ['document'], 30)  # here
+
+    assert job_store.stale_scratch('w1', [ended, paused, elsewhere, here, 'unknown']) == [ended, elsewhere]
@@ -0,0 +1,45 @@
+"""
+Runs a Lawran IDM download worker.
+
+Start the app as a coordinator (LAWRAN_COORDINATOR=1), then start one or more
+workers on this or other machines:
+
+    python worker.py http://<coordinator>:5000 --output ./worker-downloads --slots 2
+
+Workers upload finished files to the coordinator. If the coordinator's downloads
+folder is mounted on the worker (e.g. a network share), pass that path as
+--output and add --shared, and files are written there directly.
+"""
+import os
+import argparse
+
+from app.Download.worker import Worker, WORKER_KINDS
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lawran IDM download worker')
+    parser.add_argument('coordinator', help="The coordinator's address, e.g. http://192.168.1.10:5000")
+    parser.add_argument('--output', default='./worker-downloads',
+                        help='Scratch folder for downloads (default: ./worker-downloads)')
+    parser.add_argument('--shared', action='store_true',
+                        help="--output is the coordinator's downloads folder on shared storage")
+    parser.add_argument('--slots', type=int, default=1, help='Number of jobs to run at the same time')
+    parser.add_argument('--id', dest='worker_id', help='Worker name (default: <hostname>-<pid>)')
+    parser.add_argument('--kinds', default=','.join(WORKER_KINDS),
+                        help=f"Comma-separated job kinds to accept (default: {','.join(WORKER_KINDS)})")
+    args = parser.parse_args()
+
+    worker = Worker(
+        args.coordinator,
+        output_path=args.output,
+        worker_id=args.worker_id,
+        token=os.getenv('LAWRAN_WORKER_TOKEN'),
+        slots=args.slots,
+        shared_storage=args.shared,
+        kinds=[kind.strip() for kind in args.kinds.split(',') if kind.strip()],
+    )
+    worker.run()
+
+
+if __name__ == '__main__':
+    main()